@@ -1,14 +1,20 @@
-import os, csv
+import os, csv, atexit, threading, time
 from datetime import datetime, timezone, timedelta
 from pathlib import Path
 from typing import Optional
 
+from analytics.tick_store import TickStore
+
 ROOT = Path(__file__).resolve().parents[1]  # trading_project2
 RAW_DIR = ROOT / "trading-analytics-logger" / "data" / "raw"
 MARKET_DIR = RAW_DIR / "market"
 SIGNAL_DIR = RAW_DIR / "signals"
 TRADE_DIR  = RAW_DIR / "trades"
 EVENT_DIR  = RAW_DIR / "events"  # جدید: رویدادهای مدیریت ریسک / تغییر SL/TP
+MARKET_BIN_DIR = RAW_DIR / "market_bin"  # تیک‌ها به‌صورت ستونی باینری (analytics.tick_store)
+
+# "binary" = TickStore (پیش‌فرض) ، "csv" = فرمت متنی قدیمی در MARKET_DIR
+MARKET_TICK_FORMAT = "binary"
 
 def _ensure_dirs():
     """Ensure required directories exist. If a file collides with a directory
@@ -40,6 +46,8 @@ def _ensure_dirs():
 # Perform a safe one-time ensure at import
 _ensure_dirs()
 
+_tick_store = TickStore(MARKET_BIN_DIR)
+
 def _iran_now_str():
     tehran = timezone(timedelta(hours=3, minutes=30))
     return datetime.now(tehran).strftime("%Y-%m-%d %H:%M:%S")
@@ -47,15 +55,121 @@ def _iran_now_str():
 def _utc_now_str():
     return datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
 
-def _append_csv(fp: Path, headers: list[str], row: dict):
-    file_exists = fp.exists()
-    with fp.open("a", newline="", encoding="utf-8") as f:
-        w = csv.DictWriter(f, fieldnames=headers, extrasaction="ignore")
-        if not file_exists:
-            w.writeheader()
-        w.writerow(row)
+CSV_FLUSH_ROWS = 500       # flush a file after this many buffered rows
+CSV_FLUSH_INTERVAL = 2.0   # background flush of all open files (seconds)
+
+
+class _CsvFile:
+    """One open, buffered CSV file; the header is checked once at open."""
+
+    def __init__(self, fp: Path, headers: list[str]):
+        self.path = fp
+        self.fh = fp.open("a", newline="", encoding="utf-8", buffering=1 << 16)
+        self.writer = csv.DictWriter(self.fh, fieldnames=headers, extrasaction="ignore")
+        if self.fh.tell() == 0:
+            self.writer.writeheader()
+        self.pending = 0
+
+    def write(self, row: dict):
+        self.writer.writerow(row)
+        self.pending += 1
+
+    def flush(self):
+        if self.pending:
+            self.fh.flush()
+            self.pending = 0
+
+    def close(self):
+        try:
+            self.flush()
+            self.fh.close()
+        except Exception:
+            pass
+
+
+class _CsvWriterRegistry:
+    """
+    Keeps one open CSV per stream (e.g. market ticks of a symbol). Rows are buffered and
+    flushed every CSV_FLUSH_ROWS rows, every CSV_FLUSH_INTERVAL seconds by a daemon
+    thread, and at exit. When a stream's daily file name changes (UTC midnight) the old
+    file is closed and the new one opened.
+    """
+
+    def __init__(self):
+        self._files: dict[str, _CsvFile] = {}
+        self._lock = threading.Lock()
+        self._flusher = None
+
+    def append(self, stream: str, fp: Path, headers: list[str], row: dict, flush: bool = False):
+        with self._lock:
+            f = self._files.get(stream)
+            if f is None or f.path != fp:
+                if f is not None:
+                    f.close()
+                f = self._files[stream] = _CsvFile(fp, headers)
+            f.write(row)
+            if flush or f.pending >= CSV_FLUSH_ROWS:
+                f.flush()
+        if self._flusher is None:
+            self._start_flusher()
+
+    def pending_rows(self) -> int:
+        return sum(f.pending for f in list(self._files.values()))
+
+    def flush_all(self):
+        with self._lock:
+            for f in self._files.values():
+                try:
+                    f.flush()
+                except Exception:
+                    pass
+
+    def close_all(self):
+        with self._lock:
+            for f in self._files.values():
+                f.close()
+            self._files.clear()
+
+    def _start_flusher(self):
+        with self._lock:
+            if self._flusher is not None:
+                return
+            self._flusher = threading.Thread(target=self._flush_loop, name="analytics-csv-flush", daemon=True)
+            self._flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(CSV_FLUSH_INTERVAL)
+            self.flush_all()
+
+
+_csv_writers = _CsvWriterRegistry()
+atexit.register(_csv_writers.close_all)
+atexit.register(_tick_store.close)
+
+
+def _append_csv(fp: Path, headers: list[str], row: dict, stream: Optional[str] = None, flush: bool = True):
+    # فقط تیک‌ها (پرتکرار) بافر می‌شوند؛ سیگنال/معامله/رویداد بلافاصله روی دیسک می‌روند
+    _csv_writers.append(stream or str(fp), fp, headers, row, flush=flush)
+
+
+def flush_analytics():
+    """Flush buffered analytics rows to disk (also done periodically and at exit)."""
+    _csv_writers.flush_all()
+    _tick_store.flush()
+
+
+def analytics_queue_depth() -> int:
+    """Rows/ticks buffered in memory and not yet on disk."""
+    return _csv_writers.pending_rows() + _tick_store.pending()
 
-def log_market(symbol: str, bid: float, ask: float, last: Optional[float], point: float, digits: int, source="mt5", session="bot"):
+def log_market(symbol: str, bid: float, ask: float, last: Optional[float], point: float, digits: int, source="mt5", session="bot",
+               time_msc: Optional[int] = None):
+    if MARKET_TICK_FORMAT == "binary":
+        # زمان/قیمت‌ها با عرض ثابت؛ symbol/point/digits/source/session یک بار در meta.json هر روز
+        _tick_store.append(symbol, bid, ask, last, time_ms=time_msc, point=point, digits=digits,
+                           source=source, session=session)
+        return
     # 1 pip = 0.01 for 2/3 digits, else 0.0001
     pip = 0.01 if digits in (2,3) else 0.0001
     spread_points = (ask - bid) / point if (ask and bid and point) else None
@@ -73,7 +187,7 @@ def log_market(symbol: str, bid: float, ask: float, last: Optional[float], point
     _append_csv(fp, [
         "dt_utc","dt_iran","symbol","bid","ask","last",
         "spread_points","spread_pips","point","digits","source","session"
-    ], row)
+    ], row, stream=f"market:{symbol}", flush=False)
 
 def log_signal(symbol: str, strategy: str, direction: str, rr: float, entry: float, sl: float, tp: float,
                fib: Optional[dict]=None, confidence: Optional[float]=None, features_json: Optional[str]=None, note: Optional[str]=None):
@@ -90,7 +204,7 @@ def log_signal(symbol: str, strategy: str, direction: str, rr: float, entry: flo
     _append_csv(fp, [
         "dt_utc","dt_iran","symbol","strategy","direction","rr","entry","sl","tp",
         "fib_0","fib_0705","fib_09","fib_1","confidence","features_json","note"
-    ], row)
+    ], row, stream=f"signals:{symbol}")
 
 def log_trade(symbol: str, side: str, request: dict, result, reason: str=""):
     # result می‌تواند آبجکت MT5 یا dict باشد
@@ -125,7 +239,7 @@ def log_trade(symbol: str, side: str, request: dict, result, reason: str=""):
     _append_csv(fp, [
         "dt_utc","dt_iran","symbol","side","req_price","req_vol","req_deviation","req_filling",
         "retcode","order","deal","result_price","result_comment","sl","tp","magic","reason","risk_abs"
-    ], row)
+    ], row, stream=f"trades:{symbol}")
 
 def log_position_event(symbol: str, ticket: int, event: str, direction: str, entry: float, current_price: float,
                         sl: float, tp: float, profit_R: float | None, stage: int | None, risk_abs: float | None,
@@ -161,4 +275,4 @@ def log_position_event(symbol: str, ticket: int, event: str, direction: str, ent
         "volume": volume,
         "note": note
     }
-    _append_csv(fp, headers, row)
\ No newline at end of file
+    _append_csv(fp, headers, row, stream=f"events:{symbol}")
\ No newline at end of file
@@ -0,0 +1,224 @@
+"""
+Append-only columnar tick store.
+
+Layout (one directory per symbol and broker server-time day):
+
+    <root>/<SYMBOL>/<YYYY-MM-DD>/meta.json   symbol, point, digits, source, session, rows
+    <root>/<SYMBOL>/<YYYY-MM-DD>/time.bin    int64   tick time, ms since epoch in broker server time (MT5 time_msc)
+    <root>/<SYMBOL>/<YYYY-MM-DD>/bid.bin     float64
+    <root>/<SYMBOL>/<YYYY-MM-DD>/ask.bin     float64
+    <root>/<SYMBOL>/<YYYY-MM-DD>/last.bin    float64 (NaN when the broker sends none)
+
+Each column is a raw little-endian array, so a day loads with np.memmap and no parsing.
+meta.json['rows'] is the committed row count: a flush appends every column and only then
+replaces meta.json (write + rename), and the reader never looks past that count. Rows of
+a flush cut short (crash, disk error) are dropped and overwritten by the next flush, so
+the columns never go out of step.
+"""
+import json
+import os
+import threading
+import time
+from datetime import datetime, timezone, timedelta
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+COLUMNS = {
+    "time": np.dtype("<i8"),
+    "bid": np.dtype("<f8"),
+    "ask": np.dtype("<f8"),
+    "last": np.dtype("<f8"),
+}
+
+TICK_FLUSH_TICKS = 1000     # flush a day after this many buffered ticks
+TICK_FLUSH_INTERVAL = 2.0   # background flush (seconds)
+
+
+class _TickDay:
+    """Buffered appender for one symbol/day directory."""
+
+    def __init__(self, path: Path, meta: dict, start_ms: int):
+        self.path = path
+        self.start_ms = start_ms
+        self.end_ms = start_ms + 86_400_000
+        path.mkdir(parents=True, exist_ok=True)
+        old = _read_meta(path)
+        if old:
+            # همان روز بعد از ری‌استارت: ادامه از ردیف‌های commit‌شده
+            self.meta = old
+            self.meta["rows"] = _committed_rows(path, old)
+        else:
+            self.meta = dict(meta, rows=0)
+            self._write_meta()
+        self.buffers = {name: [] for name in COLUMNS}
+
+    def _write_meta(self):
+        tmp = self.path / "meta.json.tmp"
+        tmp.write_text(json.dumps(self.meta), encoding="utf-8")
+        os.replace(tmp, self.path / "meta.json")
+
+    def append(self, time_ms: int, bid: float, ask: float, last: float):
+        b = self.buffers
+        b["time"].append(time_ms)
+        b["bid"].append(bid)
+        b["ask"].append(ask)
+        b["last"].append(last)
+
+    @property
+    def pending(self) -> int:
+        return len(self.buffers["time"])
+
+    def flush(self):
+        """Append the buffered rows to every column, then commit the new row count."""
+        n = self.pending
+        if not n:
+            return
+        rows = self.meta["rows"]
+        for name, dtype in COLUMNS.items():
+            fp = self.path / f"{name}.bin"
+            with fp.open("r+b" if fp.exists() else "wb") as f:
+                # هر چیزی بعد از ردیف‌های commit‌شده باقیمانده‌ی یک flush ناقص است
+                f.truncate(rows * dtype.itemsize)
+                f.seek(0, os.SEEK_END)
+                np.asarray(self.buffers[name], dtype=dtype).tofile(f)
+        self.meta["rows"] = rows + n
+        try:
+            self._write_meta()
+        except Exception:
+            self.meta["rows"] = rows
+            raise
+        # بافرها فقط بعد از commit خالی می‌شوند؛ اگر خطا رخ دهد flush بعدی دوباره می‌نویسد
+        self.buffers = {name: [] for name in COLUMNS}
+
+
+class TickStore:
+    """
+    Writer side. append() only buffers in memory; ticks reach disk every
+    TICK_FLUSH_TICKS ticks, every TICK_FLUSH_INTERVAL seconds (daemon thread) and on
+    close(). A new directory is started when the (server-time) date changes; time_ms
+    defaults to the local wall clock only when the broker sent no time_msc.
+    """
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self._days: dict[str, _TickDay] = {}  # symbol -> current day
+        self._lock = threading.Lock()
+        self._flusher = None
+
+    def append(self, symbol: str, bid: Optional[float], ask: Optional[float], last: Optional[float] = None,
+               time_ms: Optional[int] = None, point: Optional[float] = None, digits: Optional[int] = None,
+               source: str = "mt5", session: str = "bot"):
+        if time_ms is None:
+            time_ms = int(time.time() * 1000)
+        with self._lock:
+            d = self._days.get(symbol)
+            if d is None or not (d.start_ms <= time_ms < d.end_ms):
+                if d is not None:
+                    d.flush()
+                start_ms = time_ms - time_ms % 86_400_000
+                # time_ms زمان سرور است؛ tz=utc فقط برای تبدیل بدون جابه‌جایی به تاریخ همان ساعت
+                day = datetime.fromtimestamp(start_ms / 1000, tz=timezone.utc).strftime("%Y-%m-%d")
+                meta = {"symbol": symbol, "point": point, "digits": digits, "source": source,
+                        "session": session, "time_unit": "ms", "time_base": "server"}
+                d = self._days[symbol] = _TickDay(self.root / symbol / day, meta, start_ms)
+            d.append(time_ms, _nan(bid), _nan(ask), _nan(last))
+            if d.pending >= TICK_FLUSH_TICKS:
+                d.flush()
+        if self._flusher is None:
+            self._start_flusher()
+
+    def pending(self) -> int:
+        return sum(d.pending for d in list(self._days.values()))
+
+    def flush(self):
+        with self._lock:
+            for d in self._days.values():
+                try:
+                    d.flush()
+                except Exception as e:
+                    print(f"[tick_store] flush failed: {e}")
+
+    close = flush
+
+    def _start_flusher(self):
+        with self._lock:
+            if self._flusher is not None:
+                return
+            self._flusher = threading.Thread(target=self._flush_loop, name="tick-store-flush", daemon=True)
+            self._flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(TICK_FLUSH_INTERVAL)
+            self.flush()
+
+
+def _nan(v):
+    return float("nan") if v is None else float(v)
+
+
+def _read_meta(path: Path) -> dict:
+    try:
+        return json.loads((path / "meta.json").read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def _committed_rows(path: Path, meta: dict) -> int:
+    """meta['rows'], or the shortest column for days written before rows was recorded."""
+    lengths = []
+    for name, dtype in COLUMNS.items():
+        fp = path / f"{name}.bin"
+        lengths.append(fp.stat().st_size // dtype.itemsize if fp.exists() else 0)
+    n = min(lengths)
+    return min(n, meta["rows"]) if "rows" in meta else n
+
+
+# ---------- Reader ----------
+def read_ticks(root, symbol: str, day: str, as_frame: bool = False):
+    """
+    Load one day. Returns (columns, meta) where columns maps name -> read-only
+    memory-mapped array of the committed rows, or a DataFrame indexed by broker
+    server time (naive) when as_frame=True (meta is then in df.attrs).
+    """
+    path = Path(root) / symbol / day
+    meta = _read_meta(path)
+    n = _committed_rows(path, meta)
+    cols = {}
+    for name, dtype in COLUMNS.items():
+        fp = path / f"{name}.bin"
+        cols[name] = np.memmap(fp, dtype=dtype, mode="r", shape=(n,)) if n else np.empty(0, dtype=dtype)
+    if as_frame:
+        return _to_frame(cols, meta)
+    return cols, meta
+
+
+def load_ticks(root, symbol: str, start: str, end: Optional[str] = None, as_frame: bool = False):
+    """Concatenate days start..end (inclusive, 'YYYY-MM-DD'); missing days are skipped."""
+    day = datetime.strptime(start, "%Y-%m-%d").date()
+    last_day = datetime.strptime(end or start, "%Y-%m-%d").date()
+    parts, meta = [], {}
+    while day <= last_day:
+        if (Path(root) / symbol / day.isoformat()).exists():
+            cols, m = read_ticks(root, symbol, day.isoformat())
+            parts.append(cols)
+            meta = meta or m
+        day += timedelta(days=1)
+    if parts:
+        cols = {name: np.concatenate([p[name] for p in parts]) for name in COLUMNS}
+    else:
+        cols = {name: np.empty(0, dtype=dtype) for name, dtype in COLUMNS.items()}
+    if as_frame:
+        return _to_frame(cols, meta)
+    return cols, meta
+
+
+def _to_frame(cols, meta):
+    import pandas as pd
+    df = pd.DataFrame({name: cols[name] for name in ("bid", "ask", "last")},
+                      index=pd.to_datetime(cols["time"], unit="ms"))  # زمان سرور بروکر، نه UTC
+    df.index.name = "time"
+    df.attrs.update(meta)
+    return df
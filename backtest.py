@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+"""
+Headless replay of the live strategy over stored bars.
+
+Per bar t (the candle that just opened) the backtester does what main() does on a new bar:
+  1. bar t-1 has closed: open positions are checked for SL/TP and DYNAMIC_RISK_CONFIG
+     stages against its range
+  2. bar t-1 is committed to the LegTracker and bar t is peeked with only its open price
+     (in live trading the forming candle is a few hundred ms old when processed)
+  3. SwingFibStrategy.on_bar() runs Phase 1/2/3 on the closed bar t-1
+  4. a signal is filled at bar t's open (ask for buy, bid for sell) with main()'s SL
+     guards, win_ratio TP and risk-based volume
+
+Usage:
+    python backtest.py bars.csv [--threshold 6] [--win-ratio 2] [--trades out.csv]
+    python backtest.py EURUSD:M1 --from 2025-03-01 --to 2025-06-01   # from the bar cache
+"""
+import argparse
+import math
+import os
+
+import numpy as np
+import pandas as pd
+
+from get_legs import LegTracker
+from indicators import VolatilityEngine
+from metatrader5_config import MT5_CONFIG, TRADING_CONFIG, DYNAMIC_RISK_CONFIG, ADAPTIVE_THRESHOLD_CONFIG
+from save_file import ContextLogger
+from stages import StagePlan
+from strategy import SwingFibStrategy
+
+# مشخصات پیش‌فرض EURUSD (حساب دلاری)
+DEFAULT_SYMBOL_SPEC = {
+    'point': 0.00001,
+    'digits': 5,
+    'tick_size': 0.00001,
+    'tick_value': 1.0,          # ارزش هر tick_size برای 1 لات
+    'volume_step': 0.01,
+    'volume_min': 0.01,
+    'volume_max': 100.0,
+    'trade_stops_level': 0,
+    'spread_points': 10,        # اگر ستون spread در داده نباشد
+}
+
+
+def load_bars_csv(path):
+    """Bars with a time column (epoch seconds or datetime) and open/high/low/close[/spread]."""
+    df = pd.read_csv(path)
+    time_col = 'time' if 'time' in df.columns else df.columns[0]
+    t = df[time_col]
+    df.index = pd.to_datetime(t, unit='s', utc=True) if np.issubdtype(t.dtype, np.number) else pd.to_datetime(t, utc=True)
+    df.index.name = 'time'
+    return df.drop(columns=[time_col])
+
+
+def load_bars(source, start=None, end=None):
+    """A bar CSV path, or SYMBOL[:TF] from the local bar cache (bar_cache.py) between start and end."""
+    if os.path.isfile(source):
+        df = load_bars_csv(source)
+        if start is not None or end is not None:
+            df = df.loc[pd.Timestamp(start, tz='UTC') if start else None:
+                        pd.Timestamp(end, tz='UTC') if end else None]
+        return df
+    from bar_cache import open_cache
+    df = open_cache(source).frame(start, end)
+    if df is None:
+        raise SystemExit(f"no bars for {source!r}: not a file and not in the bar cache (python bar_cache.py sync ...)")
+    return df
+
+
+class Backtester:
+    def __init__(self, bars, threshold=None, win_ratio=None, risk_pct=0.01, balance=10_000.0,
+                 symbol_spec=None, risk_config=None, log=None, fib_705=None, fib_90=None, adaptive=None):
+        self.bars = bars
+        self.threshold = threshold if threshold is not None else TRADING_CONFIG['threshold']
+        self.fib_705 = fib_705
+        self.fib_90 = fib_90
+        # ADAPTIVE_THRESHOLD_CONFIG (یا dict مشابه)؛ None = تنظیمات فعلی، threshold ثابت وقتی enable نباشد
+        self.adaptive = adaptive if adaptive is not None else ADAPTIVE_THRESHOLD_CONFIG
+        self.win_ratio = win_ratio if win_ratio is not None else MT5_CONFIG['win_ratio']
+        self.risk_pct = risk_pct
+        self.initial_balance = balance
+        self.spec = dict(DEFAULT_SYMBOL_SPEC, **(symbol_spec or {}))
+        self.risk_config = risk_config if risk_config is not None else DYNAMIC_RISK_CONFIG
+        # پنجره‌ی داده‌ی زنده (get_bars(count=window_size * 2))؛ پولبکی که از آن بیرون بزند سوینگ نیست
+        self.window = TRADING_CONFIG['window_size'] * 2
+        # لاگ استراتژی در بک‌تست خاموش است (فقط یک مقایسه برای هر خط)
+        self.log = log or ContextLogger(__file__, 'Backtester', level=100)
+
+    # ---------- Run ----------
+    def run(self):
+        bars = self.bars
+        n = len(bars)
+        o = bars['open'].to_numpy(dtype=np.float64).tolist()
+        h = bars['high'].to_numpy(dtype=np.float64).tolist()
+        l = bars['low'].to_numpy(dtype=np.float64).tolist()
+        c = bars['close'].to_numpy(dtype=np.float64).tolist()
+        status = np.where(bars['open'].to_numpy() > bars['close'].to_numpy(), 'bearish', 'bullish').tolist()
+        point = self.spec['point']
+        if 'spread' in bars.columns:
+            spread = (bars['spread'].to_numpy(dtype=np.float64) * point).tolist()
+        else:
+            spread = [self.spec['spread_points'] * point] * n
+
+        indicators = None
+        if self.adaptive.get('enable'):
+            indicators = VolatilityEngine.from_config(self.adaptive, fallback=self.threshold, point=point,
+                                                      digits=self.spec['digits'])
+        tracker = LegTracker(custom_threshold=self.threshold, max_legs=TRADING_CONFIG['window_size'],
+                             indicators=indicators)
+        strategy = SwingFibStrategy(log=self.log, fib_705=self.fib_705, fib_90=self.fib_90)
+        self.balance = self.initial_balance
+        self.positions = []
+        self.trades = []
+
+        spread_points = [s / point for s in spread]
+        if n:
+            tracker.update({'timestamp': 0, 'open': o[0], 'high': h[0], 'low': l[0], 'close': c[0],
+                            'spread': spread_points[0]})
+        for t in range(1, n):
+            p = t - 1  # آخرین کندل بسته‌شده
+            if self.positions:
+                self._manage_positions(p, o[p], h[p], l[p], spread[p])
+
+            closed = {'timestamp': p, 'open': o[p], 'high': h[p], 'low': l[p], 'close': c[p], 'status': status[p],
+                      'spread': spread_points[p]}
+            if p > 0:
+                tracker.update(closed)
+            forming = o[t]
+            legs = tracker.peek({'timestamp': t, 'open': forming, 'high': forming, 'low': forming, 'close': forming}, last=3)
+            signal = strategy.on_bar(legs, closed, None, close=c, status=status,
+                                     window_start=max(0, t - self.window + 1))
+            if signal:
+                self._open(signal, strategy.state, t, forming, spread[t])
+                strategy.state.reset()
+
+        if n:
+            for pos in list(self.positions):
+                exit_price = c[-1] if pos['direction'] == 'buy' else c[-1] + spread[-1]
+                self._close(pos, n - 1, exit_price, 'end_of_data')
+        return self.summary()
+
+    # ---------- Orders ----------
+    def _open(self, signal, state, t, bid, spread):
+        spec = self.spec
+        point = spec['point']
+        pip_size = point * (10.0 if spec['digits'] in (3, 5) else 1.0)
+        min_dist = max((spec['trade_stops_level'] or 0) * point, 3 * point)
+        min_abs_dist = max(2 * pip_size, min_dist)
+        candidate_sl = state.fib_levels['1.0']
+
+        # همان گاردهای main()
+        if signal == 'buy':
+            entry = bid + spread
+            if candidate_sl >= entry:
+                return None
+            if (entry - candidate_sl) < min_abs_dist:
+                adj = entry - min_abs_dist
+                if adj <= 0:
+                    return None
+                candidate_sl = float(adj)
+            stop = float(candidate_sl)
+            if stop >= entry:
+                return None
+            tp = entry + abs(entry - stop) * self.win_ratio
+        else:
+            entry = bid
+            if candidate_sl <= entry:
+                return None
+            if (candidate_sl - entry) < min_abs_dist:
+                candidate_sl = float(entry + min_abs_dist)
+            stop = float(candidate_sl)
+            if stop <= entry:
+                return None
+            tp = entry - abs(entry - stop) * self.win_ratio
+
+        # calculate_valid_stops: حداقل 1 pip و گرد کردن
+        if abs(entry - stop) + 1e-12 <= pip_size:
+            return None
+        digits = spec['digits']
+        stop = round(stop, digits)
+        tp = round(tp, digits)
+        risk = abs(entry - stop)
+        volume = self._volume(entry, stop, spread)
+
+        pos = {
+            'direction': signal,
+            'open_index': t,
+            'entry': entry,
+            'sl': stop,
+            'tp': tp,
+            'initial_sl': stop,
+            'risk': risk,
+            'volume': volume,
+            'done_stages': set(),
+            'commission_trigger_R': self._commission_trigger_R(risk, volume),
+        }
+        self.positions.append(pos)
+        return pos
+
+    def _volume(self, entry, sl, spread):
+        """Same sizing as MT5Connector.calculate_volume_by_risk."""
+        spec = self.spec
+        tick_size, tick_value = spec['tick_size'], spec['tick_value']
+        risk_money = self.balance * self.risk_pct
+        price_risk_per_lot = abs(entry - sl) / tick_size * tick_value
+        total_cost_per_lot = price_risk_per_lot + spread / tick_size * tick_value
+        if total_cost_per_lot <= 0 or price_risk_per_lot <= 0:
+            return MT5_CONFIG['lot_size']
+        vol = min(risk_money / total_cost_per_lot, (self.balance * 0.02) / price_risk_per_lot)
+        step = spec['volume_step']
+        return max(spec['volume_min'], min(spec['volume_max'], round(vol / step) * step))
+
+    def _commission_trigger_R(self, risk, volume):
+        """Same as register_position in main()."""
+        cfg = self.risk_config.get('commission_coverage_stage', {})
+        if cfg.get('enable') and cfg.get('auto_calculate'):
+            spec = self.spec
+            pip_size = spec['point'] * (10.0 if spec['digits'] in (3, 5) else 1.0)
+            pip_value = spec['tick_value'] * 10.0 if spec['digits'] in (3, 5) else spec['tick_value']
+            risk_money = risk / pip_size * pip_value * volume
+            if risk_money > 0:
+                return self.risk_config.get('commission_per_lot', 4.5) / risk_money + cfg.get('commission_buffer_R', 0.15)
+        return 0.1
+
+    # ---------- Position management ----------
+    def _manage_positions(self, p, open_, high, low, spread):
+        for pos in list(self.positions):
+            if pos['direction'] == 'buy':
+                # BUY با bid بسته می‌شود
+                if low <= pos['sl']:
+                    self._close(pos, p, min(pos['sl'], open_), 'sl')
+                    continue
+                if pos['tp'] and high >= pos['tp']:
+                    self._close(pos, p, max(pos['tp'], open_), 'tp')
+                    continue
+                best = high
+            else:
+                # SELL با ask بسته می‌شود
+                if high + spread >= pos['sl']:
+                    self._close(pos, p, max(pos['sl'], open_ + spread), 'sl')
+                    continue
+                if pos['tp'] and low + spread <= pos['tp']:
+                    self._close(pos, p, min(pos['tp'], open_ + spread), 'tp')
+                    continue
+                best = low + spread
+            if self.risk_config.get('enable'):
+                self._apply_stages(pos, best)
+
+    def _apply_stages(self, pos, cur_price):
+        """Mirror of manage_open_positions() for one position at the bar's best price."""
+        plan = pos.get('plan')
+        if plan is None:
+            plan = pos['plan'] = StagePlan(self.risk_config.get('stages', []), pos['entry'], pos['risk'],
+                                           pos['direction'], pos['commission_trigger_R'], self.spec['digits'])
+        k = plan.reached(cur_price)
+        if k is None:
+            return
+        new_sl, new_tp, _ = plan.target(k)
+        if (new_sl - pos['sl']) * plan.sign > 0:
+            pos['sl'] = new_sl
+            if new_tp is not None:
+                pos['tp'] = new_tp
+            pos['done_stages'].update(plan.advance(k))
+
+    def _close(self, pos, index, exit_price, reason):
+        self.positions.remove(pos)
+        sign = 1 if pos['direction'] == 'buy' else -1
+        price_profit = sign * (exit_price - pos['entry'])
+        spec = self.spec
+        commission = self.risk_config.get('commission_per_lot', 0.0) * pos['volume']
+        pnl = price_profit / spec['tick_size'] * spec['tick_value'] * pos['volume'] - commission
+        self.balance += pnl
+        self.trades.append({
+            'direction': pos['direction'],
+            'open_time': self.bars.index[pos['open_index']],
+            'close_time': self.bars.index[index],
+            'entry': pos['entry'],
+            'initial_sl': pos['initial_sl'],
+            'exit': exit_price,
+            'reason': reason,
+            'volume': pos['volume'],
+            'R': price_profit / pos['risk'],
+            'stages': len(pos['done_stages']),
+            'pnl': pnl,
+            'balance': self.balance,
+        })
+
+    # ---------- Results ----------
+    def summary(self):
+        r = np.array([t['R'] for t in self.trades], dtype=np.float64)
+        pnl = np.array([t['pnl'] for t in self.trades], dtype=np.float64)
+        if len(r):
+            equity = np.cumsum(r)
+            max_dd = float(np.max(np.maximum.accumulate(np.r_[0.0, equity])[1:] - equity))
+            gains, losses = pnl[pnl > 0].sum(), -pnl[pnl < 0].sum()
+        else:
+            max_dd, gains, losses = 0.0, 0.0, 0.0
+        return {
+            'bars': len(self.bars),
+            'trades': int(len(r)),
+            'win_rate': float((r > 0).mean()) if len(r) else 0.0,
+            'expectancy_R': float(r.mean()) if len(r) else 0.0,
+            'total_R': float(r.sum()),
+            'max_drawdown_R': max_dd,
+            'profit_factor': float(gains / losses) if losses else (math.inf if gains else 0.0),
+            'net_pnl': float(pnl.sum()),
+            'final_balance': float(self.balance),
+        }
+
+    def trades_frame(self):
+        return pd.DataFrame(self.trades)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay the swing/fib strategy over stored bars")
+    parser.add_argument('bars', help="CSV with time, open, high, low, close[, spread], or SYMBOL[:TF] from the bar cache")
+    parser.add_argument('--from', dest='start', default=None, help="YYYY-MM-DD (UTC)")
+    parser.add_argument('--to', dest='end', default=None)
+    parser.add_argument('--threshold', type=float, default=None)
+    parser.add_argument('--win-ratio', type=float, default=None)
+    parser.add_argument('--fib-705', type=float, default=None, help="entry level ratio (default TRADING_CONFIG)")
+    parser.add_argument('--fib-90', type=float, default=None)
+    parser.add_argument('--risk-pct', type=float, default=0.01)
+    parser.add_argument('--balance', type=float, default=10_000.0)
+    parser.add_argument('--adaptive', action='store_true', help="volatility threshold (ADAPTIVE_THRESHOLD_CONFIG) even if disabled")
+    parser.add_argument('--trades', default=None, help="write the trade list to this CSV")
+    args = parser.parse_args()
+
+    bt = Backtester(load_bars(args.bars, args.start, args.end), threshold=args.threshold, win_ratio=args.win_ratio,
+                    risk_pct=args.risk_pct, balance=args.balance, fib_705=args.fib_705, fib_90=args.fib_90,
+                    adaptive=dict(ADAPTIVE_THRESHOLD_CONFIG, enable=True) if args.adaptive else None)
+    import time
+    t0 = time.perf_counter()
+    result = bt.run()
+    elapsed = time.perf_counter() - t0
+    for k, v in result.items():
+        print(f"{k:>16}: {v}")
+    print(f"{'elapsed_s':>16}: {elapsed:.2f} ({elapsed / max(result['bars'], 1) * 1e6:.1f} us/bar)")
+    if args.trades:
+        bt.trades_frame().to_csv(args.trades, index=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+import numpy as np
+
+
+class BarRingBuffer:
+    """
+    Fixed-capacity store of structured MT5 bars (the array returned by copy_rates_*).
+
+    Storage is 2 * capacity long and bars are appended at the end; when it fills up the
+    newest `capacity` bars are moved to the front in one copy. So the newest bars are
+    always contiguous and view() returns a zero-copy slice, while appends stay O(1)
+    amortized.
+    """
+
+    def __init__(self, capacity, dtype=None):
+        self.capacity = int(capacity)
+        self._buf = np.empty(2 * self.capacity, dtype=dtype) if dtype is not None else None
+        self._start = 0
+        self._end = 0
+
+    def __len__(self):
+        return self._end - self._start
+
+    @property
+    def last_time(self):
+        return int(self._buf['time'][self._end - 1]) if len(self) else None
+
+    def clear(self):
+        self._start = 0
+        self._end = 0
+
+    def view(self, count=None):
+        """Newest ``count`` bars (all if None) as a read-only view, oldest first."""
+        if self._buf is None:
+            return np.empty(0)
+        n = len(self) if count is None else min(int(count), len(self))
+        v = self._buf[self._end - n:self._end]
+        v.flags.writeable = False
+        return v
+
+    def extend(self, rates):
+        """Append bars newer than the stored ones (rates must be sorted by time)."""
+        if rates is None or len(rates) == 0:
+            return
+        if self._buf is None:
+            self._buf = np.empty(2 * self.capacity, dtype=rates.dtype)
+        if len(rates) >= self.capacity:
+            self._buf[:self.capacity] = rates[-self.capacity:]
+            self._start, self._end = 0, self.capacity
+            return
+        k = len(rates)
+        if self._end + k > len(self._buf):
+            keep = min(len(self), self.capacity - k)
+            self._buf[:keep] = self._buf[self._end - keep:self._end]
+            self._start, self._end = 0, keep
+        self._buf[self._end:self._end + k] = rates
+        self._end += k
+        if len(self) > self.capacity:
+            self._start = self._end - self.capacity
+
+    def merge(self, rates):
+        """
+        Merge a fresh tail of bars from MT5. Stored bars from rates[0]['time'] onward
+        (e.g. the previously forming candle) are replaced. Returns False when rates do
+        not reach back to the stored bars (gap), so the caller must fetch more.
+        """
+        if rates is None or len(rates) == 0:
+            return True
+        if not len(self):
+            self.extend(rates)
+            return True
+        first = int(rates['time'][0])
+        if first > self.last_time:
+            return False
+        times = self._buf['time'][self._start:self._end]
+        cut = len(times) - int(np.searchsorted(times, first, side='left'))
+        self._end -= cut
+        self.extend(rates)
+        return True
@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+"""
+On-disk bar cache per symbol and timeframe.
+
+Layout:
+
+    <root>/<SYMBOL>/<TF>/<YYYY-MM>.npy   MT5 rates (structured array as returned by copy_rates_*), sorted by time
+    <root>/<SYMBOL>/<TF>/meta.json       covered: [[from, to), ...] ranges already synced; gaps: [[from, to), ...]
+
+Partitions are plain .npy files, so reads are np.load(mmap_mode='r') and a slice inside
+one month is zero-copy. sync() asks MT5 (copy_rates_range, in chunks) only for the parts
+of [start, end) not yet covered and records every hole between consecutive bars as a gap
+(weekends, holidays, missing broker history). Times are MT5 server-time epoch seconds.
+
+    python bar_cache.py sync EURUSD --from 2025-01-01
+    python bar_cache.py info EURUSD
+    python backtest.py EURUSD:M1 --from 2025-03-01 --to 2025-06-01
+"""
+import argparse
+import json
+import os
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# نام timeframe -> (ثابت MT5، طول کندل به ثانیه)
+TIMEFRAMES = {
+    'M1': ('TIMEFRAME_M1', 60),
+    'M5': ('TIMEFRAME_M5', 300),
+    'M15': ('TIMEFRAME_M15', 900),
+    'M30': ('TIMEFRAME_M30', 1800),
+    'H1': ('TIMEFRAME_H1', 3600),
+    'H4': ('TIMEFRAME_H4', 14400),
+    'D1': ('TIMEFRAME_D1', 86400),
+}
+
+
+def to_epoch(value):
+    """None, epoch seconds, 'YYYY-MM-DD[ HH:MM]' or datetime (naive = UTC) -> epoch seconds."""
+    if value is None or isinstance(value, (int, float, np.integer)):
+        return value
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp())
+
+
+def timeframe_name(mt5, timeframe):
+    """MT5 timeframe constant -> cache name ('M1', ...); None if unknown."""
+    for name, (const, _) in TIMEFRAMES.items():
+        if getattr(mt5, const, None) == timeframe:
+            return name
+    return None
+
+
+def _merge_ranges(ranges):
+    out = []
+    for a, b in sorted(ranges):
+        if out and a <= out[-1][1]:
+            out[-1][1] = max(out[-1][1], b)
+        else:
+            out.append([a, b])
+    return out
+
+
+def _month(t):
+    return datetime.fromtimestamp(int(t), timezone.utc).strftime('%Y-%m')
+
+
+class BarCache:
+    def __init__(self, root, symbol, timeframe='M1'):
+        if timeframe not in TIMEFRAMES:
+            raise ValueError(f"unknown timeframe {timeframe!r} (one of {', '.join(TIMEFRAMES)})")
+        self.symbol = symbol
+        self.timeframe = timeframe
+        self.bar_seconds = TIMEFRAMES[timeframe][1]
+        self.path = Path(root) / symbol / timeframe
+        self.meta = self._read_meta()
+
+    # ---------- Meta ----------
+    def _read_meta(self):
+        try:
+            meta = json.loads((self.path / 'meta.json').read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            meta = {}
+        meta.setdefault('covered', [])
+        meta.setdefault('gaps', [])
+        return meta
+
+    def _write_meta(self):
+        self.path.mkdir(parents=True, exist_ok=True)
+        tmp = self.path / 'meta.json.tmp'
+        tmp.write_text(json.dumps(self.meta), encoding='utf-8')
+        os.replace(tmp, self.path / 'meta.json')
+
+    @property
+    def gaps(self):
+        return [tuple(g) for g in self.meta['gaps']]
+
+    def missing(self, start, end):
+        """Parts of [start, end) not covered by an earlier sync."""
+        out, cur = [], start
+        for a, b in self.meta['covered']:
+            if b <= cur:
+                continue
+            if a >= end:
+                break
+            if a > cur:
+                out.append((cur, a))
+            cur = max(cur, b)
+        if cur < end:
+            out.append((cur, end))
+        return out
+
+    # ---------- Partitions ----------
+    def partitions(self):
+        """Month keys ('YYYY-MM') on disk, oldest first."""
+        if not self.path.is_dir():
+            return []
+        return sorted(p.stem for p in self.path.glob('[0-9][0-9][0-9][0-9]-[0-9][0-9].npy'))
+
+    def _partition(self, month, mmap=True):
+        return np.load(self.path / f'{month}.npy', mmap_mode='r' if mmap else None)
+
+    def write(self, rates):
+        """Merge bars into their monthly partitions; a bar already stored is replaced."""
+        if rates is None or len(rates) == 0:
+            return
+        self.path.mkdir(parents=True, exist_ok=True)
+        months = np.array([_month(t) for t in rates['time']])
+        for month in np.unique(months):
+            new = rates[months == month]
+            fp = self.path / f'{month}.npy'
+            if fp.exists():
+                old = self._partition(month, mmap=False)
+                both = np.concatenate([new, old.astype(new.dtype)])
+                # np.unique اولین رخداد را نگه می‌دارد -> کندل جدید برنده است (و مرتب می‌شود)
+                _, idx = np.unique(both['time'], return_index=True)
+                new = both[idx]
+            else:
+                new = np.sort(new, order='time')
+            tmp = self.path / f'{month}.tmp.npy'
+            np.save(tmp, new)
+            os.replace(tmp, fp)
+
+    # ---------- Reads ----------
+    def load(self, start=None, end=None):
+        """Bars with start <= time < end, oldest first (zero-copy inside one partition)."""
+        start, end = to_epoch(start), to_epoch(end)
+        parts = []
+        for month in self.partitions():
+            if start is not None and month < _month(start):
+                continue
+            if end is not None and month > _month(end - 1):
+                break
+            arr = self._partition(month)
+            t = arr['time']
+            i0 = int(np.searchsorted(t, start, side='left')) if start is not None else 0
+            i1 = int(np.searchsorted(t, end, side='left')) if end is not None else len(arr)
+            if i1 > i0:
+                parts.append(arr[i0:i1])
+        if not parts:
+            return None
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+    def tail(self, count, end=None):
+        """Newest count bars (before end), oldest first."""
+        end = to_epoch(end)
+        parts, n = [], 0
+        for month in reversed(self.partitions()):
+            arr = self._partition(month)
+            if end is not None:
+                arr = arr[:int(np.searchsorted(arr['time'], end, side='left'))]
+            parts.append(arr[-(count - n):] if len(arr) > count - n else arr)
+            n += len(parts[-1])
+            if n >= count:
+                break
+        parts = [p for p in reversed(parts) if len(p)]
+        if not parts:
+            return None
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+    def frame(self, start=None, end=None):
+        """DataFrame shaped like backtest.load_bars_csv (UTC DatetimeIndex named 'time')."""
+        rates = self.load(start, end)
+        if rates is None:
+            return None
+        df = pd.DataFrame(rates)
+        df.index = pd.to_datetime(df.pop('time'), unit='s', utc=True)
+        df.index.name = 'time'
+        return df
+
+    # ---------- Sync ----------
+    def sync(self, mt5, start, end=None, chunk_days=7, log=print):
+        """
+        Fetch the uncovered parts of [start, end) with copy_rates_range in chunk_days
+        chunks (end None = up to the newest closed bar). Returns the number of bars written.
+        """
+        start = to_epoch(start)
+        timeframe = getattr(mt5, TIMEFRAMES[self.timeframe][0])
+        if end is None:
+            # زمان‌ها به وقت سرور بروکر است؛ end باز = زمان باز شدن کندل در حال تشکیل
+            newest = mt5.copy_rates_from_pos(self.symbol, timeframe, 0, 1)
+            if newest is None or not len(newest):
+                log(f"[bar_cache] {self.symbol} {self.timeframe}: no bars from MT5: "
+                    f"{getattr(mt5, 'last_error', lambda: None)()}")
+                return 0
+            end = int(newest['time'][-1])
+        end = to_epoch(end)
+        step = int(chunk_days * 86400)
+        tf = self.bar_seconds
+        written = 0
+        covered = [tuple(r) for r in self.meta['covered']]
+        for a, b in self.missing(start, end):
+            # کندل ذخیره‌شده‌ی قبلی فقط وقتی مرجع gap است که بازه‌ی درست قبل از a sync شده باشد
+            prev = self.tail(1, end=a) if any(e == a for _, e in covered) else None
+            last_seen = int(prev['time'][-1]) if prev is not None else None
+            pending = a  # ابتدای بازه‌ای که هنوز پوشش ثبت نشده
+            for c0 in range(a, b, step):
+                c1 = min(c0 + step, b)
+                rates = mt5.copy_rates_range(self.symbol, timeframe,
+                                             datetime.fromtimestamp(c0, timezone.utc),
+                                             datetime.fromtimestamp(c1 - 1, timezone.utc))
+                if rates is None:
+                    log(f"[bar_cache] {self.symbol} {self.timeframe}: copy_rates_range failed at {_month(c0)}: "
+                        f"{getattr(mt5, 'last_error', lambda: None)()}")
+                    self._write_meta()
+                    return written
+                if len(rates):
+                    rates = rates[(rates['time'] >= c0) & (rates['time'] < c1)]
+                if len(rates):
+                    self.write(rates)
+                    written += len(rates)
+                    self._record_gaps(rates['time'], last_seen)
+                    last_seen = int(rates['time'][-1])
+                # پوشش فقط تا انتهای آخرین کندل دیده‌شده؛ chunkهای خالی قبل از آن (تعطیلی) هم
+                # پوشش داده می‌شوند، بعد از آن (آینده / کندل‌های نیامده) دفعه‌ی بعد دوباره خوانده می‌شود
+                if last_seen is not None and last_seen + tf > pending:
+                    covered_to = min(c1, last_seen + tf)
+                    self.meta['covered'] = _merge_ranges(self.meta['covered'] + [[pending, covered_to]])
+                    pending = covered_to
+                self._write_meta()
+            # hole بین آخرین کندل این بازه و اولین کندل بازه‌ی sync‌شده‌ی بعدی
+            if last_seen is not None and any(s == b for s, _ in covered):
+                nxt = self._first_time(b)
+                if nxt is not None:
+                    self._record_gaps([nxt], last_seen)
+                    self._write_meta()
+        return written
+
+    def _first_time(self, t):
+        """Time of the first stored bar at or after t, or None."""
+        for month in self.partitions():
+            if month < _month(t):
+                continue
+            times = self._partition(month)['time']
+            i = int(np.searchsorted(times, t, side='left'))
+            if i < len(times):
+                return int(times[i])
+        return None
+
+    def _record_gaps(self, times, last_seen=None):
+        t = np.asarray(times, dtype=np.int64)
+        if last_seen is not None:
+            t = np.r_[last_seen, t]
+        jumps = np.nonzero(np.diff(t) > self.bar_seconds)[0]
+        if not len(jumps):
+            return
+        gaps = [[int(t[i]) + self.bar_seconds, int(t[i + 1])] for i in jumps]
+        self.meta['gaps'] = _merge_ranges(self.meta['gaps'] + gaps)
+
+
+def open_cache(spec, root=None):
+    """'EURUSD' or 'EURUSD:M5' -> BarCache under root (default BAR_CACHE_CONFIG['root'])."""
+    if root is None:
+        from metatrader5_config import BAR_CACHE_CONFIG
+        root = BAR_CACHE_CONFIG['root']
+    symbol, _, tf = spec.partition(':')
+    return BarCache(root, symbol, tf or 'M1')
+
+
+def _fmt(t):
+    return datetime.fromtimestamp(t, timezone.utc).strftime('%Y-%m-%d %H:%M')
+
+
+def main():
+    from metatrader5_config import BAR_CACHE_CONFIG
+    parser = argparse.ArgumentParser(description="Local MT5 bar cache")
+    sub = parser.add_subparsers(dest='cmd', required=True)
+    p_sync = sub.add_parser('sync', help="fetch the missing ranges from MT5")
+    p_sync.add_argument('symbol', help="SYMBOL or SYMBOL:TF (default M1)")
+    p_sync.add_argument('--from', dest='start', required=True, help="YYYY-MM-DD (UTC)")
+    p_sync.add_argument('--to', dest='end', default=None, help="default: newest closed bar")
+    p_sync.add_argument('--chunk-days', type=float, default=BAR_CACHE_CONFIG.get('chunk_days', 7))
+    p_info = sub.add_parser('info', help="partitions, covered ranges and gaps")
+    p_info.add_argument('symbol')
+    p_info.add_argument('--min-gap', type=int, default=60, help="only list gaps of at least N minutes")
+    for p in (p_sync, p_info):
+        p.add_argument('--root', default=BAR_CACHE_CONFIG['root'])
+    args = parser.parse_args()
+
+    cache = open_cache(args.symbol, args.root)
+    if args.cmd == 'sync':
+        import MetaTrader5 as mt5
+        if not mt5.initialize():
+            raise SystemExit(f"MT5 initialize failed: {mt5.last_error()}")
+        try:
+            mt5.symbol_select(cache.symbol, True)
+            t0 = time.perf_counter()
+            n = cache.sync(mt5, args.start, args.end, chunk_days=args.chunk_days)
+        finally:
+            mt5.shutdown()
+        print(f"{cache.symbol} {cache.timeframe}: {n} bars written in {time.perf_counter() - t0:.1f}s")
+
+    print(f"{cache.symbol} {cache.timeframe} @ {cache.path}")
+    for month in cache.partitions():
+        arr = cache._partition(month)
+        print(f"  {month}: {len(arr):>7} bars  {_fmt(arr['time'][0])} .. {_fmt(arr['time'][-1])}")
+    for a, b in cache.meta['covered']:
+        print(f"  covered {_fmt(a)} .. {_fmt(b)}")
+    min_gap = getattr(args, 'min_gap', 60) * 60
+    gaps = [g for g in cache.gaps if g[1] - g[0] >= min_gap]
+    print(f"  gaps: {len(cache.gaps)} ({len(gaps)} >= {min_gap // 60} min)")
+    for a, b in gaps:
+        print(f"    {_fmt(a)} .. {_fmt(b)}  ({(b - a) // 60} min)")
+
+
+if __name__ == "__main__":
+    main()
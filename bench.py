@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for the strategy hot paths.
+
+Cases: get_legs (reference), get_legs_fast, LegTracker.update_from (fixed and volatility
+threshold), get_swing_points, fibonacci_retracement, MT5Connector.get_historical_data
+(delta fetch + DataFrame) and one full processed bar (SymbolTrader.fetch + process). MT5
+is the offline simulator in mt5_sim/, so numbers do not depend on a terminal or the network.
+
+Fixtures are seeded synthetic EURUSD-like M1 bars and, with --bars, the newest rows of
+recorded bars (a CSV or SYMBOL[:TF] from the local bar cache), at 200, 10k and 1M bars.
+Each case reports the best wall time of --repeat runs, the per-bar (or per-call) cost
+and, from a separate run under tracemalloc, the peak and net allocated memory.
+
+    python bench.py --baseline --fail-on-regression          # against bench_baseline.json
+    python bar_cache.py sync EURUSD --from 2025-01-01         # recorded EURUSD (needs a terminal)
+    python bench.py --bars EURUSD:M1 --out bench_baseline.json
+
+bench_baseline.json is committed and covers the synthetic fixtures only: broker history
+is not redistributed with the repo, so recorded-N fixtures come from your own bar cache
+(they show up as '-' until a baseline with --bars is written). Wall times depend on the
+machine and on the numpy/pandas versions, so --baseline refuses to compare when the
+baseline's meta (python major.minor, numpy, pandas, machine, cpu_count) differs from the
+current environment; the committed file records the environment it was written in, which
+is not necessarily the requirements.txt pins. Re-write it with --out, or pass --ignore-env.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+# همیشه شبیه‌ساز (حتی اگر پکیج واقعی MetaTrader5 نصب باشد)
+sys.path.insert(0, os.path.join(ROOT, 'mt5_sim'))
+
+import MetaTrader5 as mt5  # noqa: E402
+from fibo_calculate import fibonacci_retracement  # noqa: E402
+from get_legs import get_legs, get_legs_fast, LegTracker  # noqa: E402
+from swing import get_swing_points  # noqa: E402
+
+SIZES = (200, 10_000, 1_000_000)
+BASELINE = os.path.join(ROOT, 'bench_baseline.json')
+WINDOW = 200          # cache_data در main: window_size * 2
+BAR_SAMPLES = 2000    # تعداد کندل برای موارد per-bar سنگین (fetch / full bar)
+REF_MAX_BARS = 10_000  # get_legs مرجع روی 1M عملا تمام نمی‌شود
+# baseline فقط روی همین محیط قابل مقایسه است (نسخه‌ی numpy/pandas روی زمان‌ها اثر مستقیم دارد)
+ENV_KEYS = ('python', 'numpy', 'pandas', 'machine', 'cpu_count')
+
+
+# ---------- Fixtures ----------
+def random_walk_bars(n, seed=0, vol=0.0003, start='2025-01-06'):
+    """Seeded random-walk M1 bars (UTC index, open/high/low/close/spread, 5 digits); also the tests' fixture."""
+    rng = np.random.default_rng(seed)
+    close = 1.1 + np.cumsum(rng.normal(0, vol, n))
+    open_ = np.r_[1.1, close[:-1]] + rng.normal(0, vol / 5, n)
+    high = np.maximum(open_, close) + np.abs(rng.normal(0, vol / 2, n))
+    low = np.minimum(open_, close) - np.abs(rng.normal(0, vol / 2, n))
+    index = pd.date_range(start, periods=n, freq='min', tz='UTC', name='time')
+    return pd.DataFrame({'open': open_.round(5), 'high': high.round(5), 'low': low.round(5),
+                         'close': close.round(5), 'spread': 10}, index=index)
+
+
+def synthetic_bars(n, seed=0, vol=0.0003, start='2025-01-06'):
+    """random_walk_bars shaped like cache_data (Asia/Tehran index, status, timestamp)."""
+    df = random_walk_bars(n, seed, vol, start)
+    df.index = df.index.tz_convert('Asia/Tehran')
+    return _finish(df)
+
+
+def recorded_bars(source, n):
+    """Newest n bars of a CSV or SYMBOL[:TF] in the bar cache; None when there are fewer."""
+    from backtest import load_bars
+    df = load_bars(source)
+    if len(df) < n:
+        return None
+    df = df.iloc[-n:].copy()
+    df.index = df.index.tz_convert('Asia/Tehran')
+    return _finish(df)
+
+
+def _finish(df):
+    df['timestamp'] = df.index
+    df['status'] = np.where(df['open'] > df['close'], 'bearish', 'bullish')
+    return df
+
+
+def fixtures(sizes, bars=None, seed=0):
+    for n in sizes:
+        yield f'synthetic-{n}', synthetic_bars(n, seed=seed)
+        if bars:
+            df = recorded_bars(bars, n)
+            if df is not None:
+                yield f'recorded-{n}', df
+
+
+def _epoch_seconds(index):
+    return np.asarray((index - pd.Timestamp(0, tz='UTC')) // pd.Timedelta(seconds=1), dtype=np.int64)
+
+
+def _rates(df):
+    out = np.zeros(len(df), dtype=mt5.RATES_DTYPE)
+    out['time'] = _epoch_seconds(df.index)
+    for name in ('open', 'high', 'low', 'close'):
+        out[name] = df[name].to_numpy()
+    if 'spread' in df.columns:
+        out['spread'] = df['spread'].to_numpy()
+    return out
+
+
+# ---------- Cases ----------
+# هر case یک تابع (data) -> (run, units) است؛ run بدون آرگومان اجرا می‌شود و units
+# تعداد کندل/فراخوانی برای هزینه‌ی per-bar است.
+def case_get_legs(df):
+    if len(df) > REF_MAX_BARS:
+        return None
+    return (lambda: get_legs(df)), len(df)
+
+
+def case_get_legs_fast(df):
+    return (lambda: get_legs_fast(df)), len(df)
+
+
+def case_leg_tracker(df):
+    def run():
+        LegTracker().update_from(df)
+    return run, len(df)
+
+
+def case_leg_tracker_adaptive(df):
+    from indicators import VolatilityEngine
+
+    def run():
+        LegTracker(indicators=VolatilityEngine(fallback=6)).update_from(df)
+    return run, len(df)
+
+
+def case_swing(df):
+    legs = get_legs_fast(df)
+    triples = [legs[k:k + 3] for k in range(len(legs) - 2)]
+    close = df['close'].to_numpy()
+    status = df['status'].to_numpy()
+
+    def run():
+        for legs3 in triples:
+            get_swing_points(df, legs3, close=close, status=status)
+    return run, max(len(triples), 1)
+
+
+def case_fib(df):
+    highs = df['high'].tolist()
+    lows = df['low'].tolist()
+
+    def run():
+        for h, l in zip(highs, lows):
+            fibonacci_retracement(start_price=h, end_price=l)
+    return run, len(df)
+
+
+def _sim_steps(df):
+    """Simulator over df and the bar open times to step through (the newest BAR_SAMPLES)."""
+    if len(df) <= WINDOW:
+        return None, None
+    sim = mt5.configure(bars=_rates(df), start=0, spread_points=10)
+    times = _epoch_seconds(df.index)[max(WINDOW, len(df) - BAR_SAMPLES):]
+    return sim, times
+
+
+def case_get_historical_data(df):
+    from mt5_connector import MT5Connector
+    sim, times = _sim_steps(df)
+    if sim is None:
+        return None
+
+    def run():
+        conn = MT5Connector()
+        for t in times:
+            sim.set_time(int(t) + 30)
+            conn.get_historical_data(count=WINDOW)
+    return run, len(times)
+
+
+def _no_side_effects():
+    """Simulated orders must not send emails or land in the real analytics CSVs."""
+    import engine
+    import mt5_connector
+    noop = lambda *args, **kwargs: None  # noqa: E731
+    engine.send_trade_email_async = engine.log_signal = engine.log_position_event = noop
+    mt5_connector.log_trade = mt5_connector.log_position_event = noop
+
+
+def case_full_bar(df):
+    from mt5_connector import MT5Connector
+    from engine import SymbolTrader
+    sim, times = _sim_steps(df)
+    if sim is None:
+        return None
+    _no_side_effects()
+
+    def run():
+        trader = SymbolTrader(MT5Connector())
+        trader.log.level = trader.strategy.log.level = 100  # فقط هزینه‌ی محاسبه، نه چاپ
+        for t in times:
+            sim.set_time(int(t) + 30)
+            cache_data = trader.fetch()
+            trader.process(cache_data)
+    return run, len(times)
+
+
+CASES = {
+    'get_legs': case_get_legs,
+    'get_legs_fast': case_get_legs_fast,
+    'leg_tracker': case_leg_tracker,
+    'leg_tracker_adaptive': case_leg_tracker_adaptive,
+    'swing': case_swing,
+    'fib': case_fib,
+    'get_historical_data': case_get_historical_data,
+    'full_bar': case_full_bar,
+}
+
+
+# ---------- Runner ----------
+def measure(run, units, repeat=3, allocations=True):
+    walls = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        run()
+        walls.append(time.perf_counter() - t0)
+    wall = min(walls)
+    result = {'units': units, 'wall_s': wall, 'per_bar_us': wall / units * 1e6, 'repeat': repeat}
+    if allocations:
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        diff = after.compare_to(before, 'filename')
+        result['peak_kib'] = peak / 1024
+        result['alloc_kib'] = sum(d.size_diff for d in diff if d.size_diff > 0) / 1024
+        result['alloc_blocks'] = sum(d.count_diff for d in diff if d.count_diff > 0)
+    return result
+
+
+def run_suite(sizes=SIZES, cases=None, bars=None, repeat=3, allocations=True, seed=0, progress=True):
+    results = {}
+    for fixture, df in fixtures(sizes, bars, seed):
+        for name in cases or CASES:
+            built = CASES[name](df)
+            if built is None:
+                continue
+            run, units = built
+            # 1M کندل: یک اجرا کافی است
+            r = measure(run, units, repeat=1 if len(df) > REF_MAX_BARS else repeat, allocations=allocations)
+            key = f'{name}[{fixture}]'
+            results[key] = r
+            if progress:
+                alloc = f" peak={r['peak_kib']:.0f}KiB alloc={r['alloc_kib']:.0f}KiB" if allocations else ''
+                print(f"{key:<40} {r['wall_s'] * 1e3:10.2f} ms  {r['per_bar_us']:9.2f} us/bar{alloc}")
+    return results
+
+
+def metadata():
+    try:
+        rev = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                             text=True, timeout=10).stdout.strip()
+    except Exception:
+        rev = None
+    return {
+        'time': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'git': rev,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def environment_mismatch(meta, current=None):
+    """{key: (baseline, current)} for the ENV_KEYS that differ; python is compared as major.minor."""
+    current = current or metadata()
+    out = {}
+    for key in ENV_KEYS:
+        a, b = (meta or {}).get(key), current.get(key)
+        if key == 'python' and a and b:
+            a, b = '.'.join(str(a).split('.')[:2]), '.'.join(str(b).split('.')[:2])
+        if a != b:
+            out[key] = ((meta or {}).get(key), current.get(key))
+    return out
+
+
+def compare(results, baseline, tolerance=0.10):
+    """Print new vs baseline per case; returns the keys slower than baseline by > tolerance."""
+    regressions = []
+    base = baseline.get('results', baseline)
+    print(f"\n{'case':<40} {'base ms':>10} {'new ms':>10} {'ratio':>7}")
+    for key, r in results.items():
+        b = base.get(key)
+        if not b:
+            print(f"{key:<40} {'-':>10} {r['wall_s'] * 1e3:10.2f}")
+            continue
+        ratio = r['wall_s'] / b['wall_s'] if b['wall_s'] else float('inf')
+        flag = ''
+        if ratio > 1 + tolerance:
+            regressions.append(key)
+            flag = '  <-- slower'
+        print(f"{key:<40} {b['wall_s'] * 1e3:10.2f} {r['wall_s'] * 1e3:10.2f} {ratio:7.2f}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the strategy hot paths")
+    parser.add_argument('--sizes', default=','.join(str(n) for n in SIZES))
+    parser.add_argument('--cases', default=None, help=f"comma separated subset of: {', '.join(CASES)}")
+    parser.add_argument('--bars', default=None,
+                        help="recorded bars for the recorded-N fixtures: CSV or SYMBOL[:TF] from the bar cache")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-alloc', action='store_true', help="skip the tracemalloc run")
+    parser.add_argument('--out', default=None, help="write results as JSON")
+    parser.add_argument('--baseline', nargs='?', const=BASELINE, default=None,
+                        help="JSON from an earlier run to compare against (no value: bench_baseline.json)")
+    parser.add_argument('--tolerance', type=float, default=0.10)
+    parser.add_argument('--fail-on-regression', action='store_true')
+    parser.add_argument('--ignore-env', action='store_true',
+                        help="compare even when the baseline was written on another python/numpy/pandas/machine")
+    args = parser.parse_args()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        mismatch = environment_mismatch(baseline.get('meta'))
+        if mismatch:
+            diff = ', '.join(f"{k}: baseline={a} here={b}" for k, (a, b) in mismatch.items())
+            if not args.ignore_env:
+                sys.exit(f"{args.baseline} was written in another environment ({diff}); "
+                         f"re-write it here with --out, or pass --ignore-env")
+            print(f"[bench] comparing across environments ({diff})")
+
+    sizes = [int(s) for s in args.sizes.split(',') if s]
+    cases = [c for c in args.cases.split(',') if c] if args.cases else None
+    results = run_suite(sizes, cases, args.bars, args.repeat, not args.no_alloc, args.seed)
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump({'meta': metadata(), 'results': results}, f, indent=2, sort_keys=True)
+    if baseline is not None:
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions and args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,894 @@
+import MetaTrader5 as mt5
+import threading
+import time
+from datetime import datetime
+from time import sleep
+import numpy as np
+from get_legs import LegTracker
+from indicators import VolatilityEngine
+from strategy import SwingFibStrategy
+from save_file import ContextLogger
+from scheduler import BarScheduler
+from latency import latency
+from position_manager import PositionManager, ModifyPool
+from position_store import PositionStore
+from stages import StagePlan
+from metatrader5_config import (MT5_CONFIG, TRADING_CONFIG, DYNAMIC_RISK_CONFIG, SCHEDULER_CONFIG,
+                                POSITION_MANAGER_CONFIG, POSITION_STORE_CONFIG, ADAPTIVE_THRESHOLD_CONFIG)
+from email_notifier import send_trade_email_async
+from analytics.hooks import log_signal, log_position_event
+
+
+class SymbolTrader:
+    """
+    Everything main() used to keep in locals for its one instrument: BotState (via the
+    strategy), leg tracker, last_data_time, the open-position stage state and the order
+    logic. TradingEngine owns one per symbol and feeds it bars.
+    """
+
+    def __init__(self, mt5_conn, symbol=None):
+        self.conn = mt5_conn.for_symbol(symbol) if symbol else mt5_conn
+        self.symbol = self.conn.symbol
+        # Initial state با تنظیمات - مطابق main_saver_copy2.py
+        self.strategy = SwingFibStrategy(latency=latency)
+        self.state = self.strategy.state
+        # لگ‌ها به‌صورت افزایشی روی کندل‌های بسته‌شده محاسبه می‌شوند (threshold ثابت یا بر اساس نوسان).
+        # تغییر رفتار نسبت به get_legs(cache_data) روی هر پنجره‌ی 200 کندلی: tracker از اولین
+        # کندل session جلو می‌رود و لگ‌ها بین فراخوانی‌ها حفظ می‌شوند (همان get_legs روی کل تاریخچه،
+        # آخرین window_size لگ). لگ اولِ پنجره دیگر با شروع پنجره بریده نمی‌شود؛ بعد از gap ریست می‌شود.
+        indicators = None
+        if ADAPTIVE_THRESHOLD_CONFIG.get('enable'):
+            specs = self.conn.symbol_specs()
+            indicators = VolatilityEngine.from_config(ADAPTIVE_THRESHOLD_CONFIG, fallback=TRADING_CONFIG['threshold'],
+                                                      point=specs.point if specs else None,
+                                                      digits=specs.digits if specs else None)
+        self.leg_tracker = LegTracker(max_legs=TRADING_CONFIG['window_size'], indicators=indicators)
+        self.win_ratio = MT5_CONFIG['win_ratio']
+        self.window_size = TRADING_CONFIG['window_size']
+        self.start_index = 0
+        self.i = 1
+        self.position_open = False
+        self.cache_data = None
+        # اضافه کردن متغیر برای ذخیره آخرین داده
+        self.last_data_time = None
+        self.last_bar_time = None  # epoch ثانیه‌ی آخرین کندل از probe سبک
+        self.bar_close = None  # زمان (ساعت محلی، epoch) بسته شدن کندل در حال پردازش
+        # حالت‌های مدیریت پوزیشن
+        self.stage_plans = {}  # ticket -> StagePlan (مراحل DYNAMIC_RISK_CONFIG کامپایل‌شده)
+        # فقط تیکت‌های باز؛ تیکت بسته‌شده بعد از ثبت در فایل رویدادها حذف می‌شود (_evict_closed)
+        self.position_states = {}  # ticket -> {'entry':..., 'risk':..., 'direction':..., 'done_stages':set(), 'base_tp_R':float, 'commission_locked':False}
+        self.open_tickets = ()  # تیکت‌های باز در آخرین چرخه‌ی مدیریت
+        # position_states بین حلقه‌ی کندل و thread مدیریت پوزیشن مشترک است
+        self.positions_lock = threading.RLock()
+        self.on_order = None  # callback بعد از ارسال سفارش (بیدار کردن PositionManager)
+        self.modifier = None  # ModifyPool؛ None = modify در همان thread
+        self.store = None  # PositionStore برای warm restart (اختیاری)
+        self._stored = set()  # تیکت‌هایی که در store هستند
+        # ticket -> ((k, sl, tp), retry_at): آخرین modify ردشده؛ همان هدف تا retry_at دوباره ارسال نمی‌شود
+        self.modify_backoff = {}
+        self.clock = time.monotonic
+        self.bars_processed = 0
+        # log(...) = INFO ، log.trace برای trace هر کندل (lazy، LOG_CONFIG['bar_trace']) ، log.trade برای سیگنال/سفارش/پوزیشن
+        self.log = ContextLogger(__file__, self.symbol)
+
+    def reset_state_and_window(self):
+        self.state.reset()
+        self.start_index = max(0, len(self.cache_data) - self.window_size)
+        self.log(f'Reset state -> new start_index={self.start_index} (slice len={len(self.cache_data.iloc[self.start_index:])})', color='magenta')
+
+    # ---------- Bars ----------
+    def fetch(self):
+        with latency.span('fetch'):
+            rates = self.conn.get_bars(count=self.window_size * 2)
+        if rates is None:
+            return None
+        with latency.span('frame'):
+            cache_data = self.conn.bars_to_frame(rates)
+            cache_data['status'] = np.where(cache_data['open'] > cache_data['close'], 'bearish', 'bullish')
+        return cache_data
+
+    def on_data(self, cache_data, bar_time, bar_close=None):
+        log = self.log
+        # بررسی تغییر داده - مشابه main_saver_copy2.py
+        current_time = cache_data.index[-1]
+        self.last_bar_time = bar_time
+        if self.last_data_time is None:
+            log(f"🔄 First run - processing data from {current_time}", color='cyan')
+        elif current_time != self.last_data_time:
+            log(f"📊 New data received: {current_time} (previous: {self.last_data_time})", color='cyan')
+        else:
+            # اگر خیلی زیاد انتظار کشیدیم، اجبار به پردازش (در صورت تست)
+            log(f"⚠️ Force processing after {SCHEDULER_CONFIG.get('max_wait', 60)}s without new data", color='magenta')
+        self.last_data_time = current_time
+        self.bar_close = bar_close
+        self.process(cache_data)
+        if bar_close is not None:
+            latency.record('bar_to_processed', time.time() - bar_close)
+
+    def process(self, cache_data):
+        log = self.log
+        self.cache_data = cache_data
+        state = self.state
+        strategy = self.strategy
+        log.trace((' ' * 80 + '\n') * 3)
+        log.trace(lambda: f'Log number {self.i}:', color='lightred_ex')
+        log.trace(lambda: f'📊 Processing {len(cache_data)} data points | Window: {self.window_size}', color='cyan')
+        log.trace(lambda: f'Current time: {cache_data.index[-1]}', color='yellow')
+        log.trace(lambda: f'Start index: {self.start_index}  value: {cache_data.iloc[0].timestamp}  end data: {cache_data.iloc[-2].timestamp}', color='yellow')
+        log.trace(lambda: f'len data: {len(cache_data)} ', color='yellow')
+        log.trace(lambda: f'Current data status: {cache_data.iloc[-1]["status"]} open: {cache_data.iloc[-1]["open"]} close: {cache_data.iloc[-1]["close"]} time: {cache_data.index[-1]}')
+        log.trace(lambda: f'Last data status: {cache_data.iloc[-2]["status"]} open: {cache_data.iloc[-2]["open"]} close: {cache_data.iloc[-2]["close"]} time: {cache_data.index[-2]}')
+        log.trace(' ' * 80)
+        self.i += 1
+        self.bars_processed += 1
+
+        # فقط کندل‌های بسته‌شده‌ی جدید commit می‌شوند؛ کندل در حال تشکیل فقط peek می‌شود
+        with latency.span('legs'):
+            self.leg_tracker.update_from(cache_data.iloc[:-1])
+            legs = self.leg_tracker.peek(cache_data.iloc[-1], last=3)
+        log.trace(lambda: f'First len legs: {len(self.leg_tracker.legs)}', color='green')
+        log.trace(' ' * 80)
+
+        signal = strategy.on_bar(legs, cache_data.iloc[-2], cache_data)
+
+        # بخش معاملات (مطابق منطق main_saver_copy2.py)
+        if signal == 'buy':
+            if not self.open_buy(cache_data):
+                return
+            legs = []
+        if signal == 'sell':
+            if not self.open_sell(cache_data):
+                return
+            legs = []
+
+        log.trace(lambda: f'len(legs): {len(legs)} | start_index: {self.start_index} | {cache_data.iloc[self.start_index].name}', color='lightred_ex')
+        log.trace(' ' * 80)
+        log.trace('-' * 80)
+        log.trace(' ' * 80)
+
+    # ---------- Orders ----------
+    def open_buy(self, cache_data):
+        """Returns False when the signal was skipped by a guard (state already reset)."""
+        log = self.log
+        state = self.state
+        mt5_conn = self.conn
+        symbol = self.symbol
+        win_ratio = self.win_ratio
+        log.trade(f"📈 Buy signal triggered", color='green')
+        last_tick = mt5.symbol_info_tick(symbol)
+        buy_entry_price = last_tick.ask
+
+        # لاگ سیگنال (قبل از ارسال سفارش)
+        try:
+            log_signal(
+                symbol=symbol,
+                strategy="swing_fib_v1",
+                direction="buy",
+                rr=win_ratio,
+                entry=buy_entry_price,
+                sl=float(state.fib_levels['1.0']),
+                tp=None,
+                fib=state.fib_levels,
+                confidence=None,
+                features_json=None,
+                note="triggered_by_pullback"
+            )
+        except Exception:
+            pass
+        log.trace(lambda: f'Start long position income {cache_data.iloc[-1].name}', color='blue')
+        log.trace(lambda: f'current_open_point (market ask): {buy_entry_price}', color='blue')
+        # ENTRY CONTEXT (BUY): fib snapshot + touches
+        try:
+            fib = state.fib_levels or {}
+            fib0_p = fib.get('0.0')
+            fib1_p = fib.get('1.0')
+            log.trade(
+                f"ENTRY_CTX_BUY | fib0_time={state.fib0_time} value={fib0_p} | fib705={fib.get('0.705')} | fib09={fib.get('0.9')} | fib1_time={state.fib1_time} value={fib1_p}",
+                color='cyan'
+            )
+        except Exception:
+            pass
+
+        min_dist = _min_stop_distance(symbol, mt5_conn)
+
+        # همیشه از fib 1.0 استفاده می‌کنیم
+        candidate_sl = state.fib_levels['1.0']
+
+        min_pip_dist = 2  # حداقل 2 پیپ واقعی
+        pip_size = _pip_size_for(symbol, mt5_conn)
+        min_abs_dist = max(min_pip_dist * pip_size, min_dist)
+
+        # گارد جهت - fib 1.0 همیشه باید زیر entry باشد
+        if candidate_sl >= buy_entry_price:
+            log.trade("🚫 Skip BUY: fib 1.0 is above entry price", color='red')
+            state.reset()
+            self.reset_state_and_window()
+            return False
+        # اطمینان از فاصله
+        if (buy_entry_price - candidate_sl) < min_abs_dist:
+            # اگر فاصله خیلی کم است، یا SL را جابه‌جا کن یا معامله را لغو کن
+            adj = buy_entry_price - min_abs_dist
+            if adj <= 0:
+                log.trade("🚫 Skip BUY: invalid SL distance", color='red')
+                state.reset()
+                self.reset_state_and_window()
+                return False
+            candidate_sl = float(adj)
+
+        stop = float(candidate_sl)
+        if stop >= buy_entry_price:
+            log.trade("🚫 Skip BUY: SL still >= entry after adjust", color='red')
+            state.reset()
+            self.reset_state_and_window()
+            return False
+
+        stop_distance = abs(buy_entry_price - stop)
+        reward_end = buy_entry_price + (stop_distance * win_ratio)
+        log.trace(lambda: f'stop = {stop}', color='green')
+        log.trace(lambda: f'reward_end = {reward_end}', color='green')
+
+        # ارسال سفارش BUY با هر stop و reward
+        with latency.span('order_send'):
+            result = mt5_conn.open_buy_position(
+                tick=last_tick,
+                sl=stop,
+                tp=reward_end,
+                comment=f"Bullish Swing {self.strategy.last_swing_type}",
+                risk_pct=0.01  # مثلا 1% ریسک
+            )
+        self._record_bar_to_order()
+        if self.on_order is not None:
+            self.on_order()
+        self._notify_order('BUY', 'Bullish', buy_entry_price, stop, reward_end, result)
+        state.reset()
+
+        self.reset_state_and_window()
+        return True
+
+    def open_sell(self, cache_data):
+        """Returns False when the signal was skipped by a guard (state already reset)."""
+        log = self.log
+        state = self.state
+        mt5_conn = self.conn
+        symbol = self.symbol
+        win_ratio = self.win_ratio
+        log.trade(f"📉 Sell signal triggered", color='red')
+        last_tick = mt5.symbol_info_tick(symbol)
+        sell_entry_price = last_tick.bid
+
+        try:
+            log_signal(
+                symbol=symbol,
+                strategy="swing_fib_v1",
+                direction="sell",
+                rr=win_ratio,
+                entry=sell_entry_price,
+                sl=float(state.fib_levels['1.0']),
+                tp=None,
+                fib=state.fib_levels,
+                confidence=None,
+                features_json=None,
+                note="triggered_by_pullback"
+            )
+        except Exception:
+            pass
+        log.trace(lambda: f'Start short position income {cache_data.iloc[-1].name}', color='red')
+        log.trace(lambda: f'current_open_point (market bid): {sell_entry_price}', color='red')
+        # ENTRY CONTEXT (SELL): fib snapshot + touches
+        try:
+            fib = state.fib_levels or {}
+            fib0_p = fib.get('0.0')
+            fib1_p = fib.get('1.0')
+            log.trade(
+                f"ENTRY_CTX_SELL | fib0_time={state.fib0_time} value={fib0_p} | fib705={fib.get('0.705')} | fib09={fib.get('0.9')} | fib1_time={state.fib1_time} value={fib1_p}",
+                color='cyan'
+            )
+        except Exception:
+            pass
+
+        min_dist = _min_stop_distance(symbol, mt5_conn)
+
+        # همیشه از fib 1.0 استفاده می‌کنیم
+        candidate_sl = state.fib_levels['1.0']
+
+        min_pip_dist = 2.0
+        pip_size = _pip_size_for(symbol, mt5_conn)
+        min_abs_dist = max(min_pip_dist * pip_size, min_dist)
+
+        # گارد جهت - fib 1.0 همیشه باید بالای entry باشد
+        if candidate_sl <= sell_entry_price:
+            log.trade("🚫 Skip SELL: fib 1.0 is below entry price", color='red')
+            state.reset()
+            self.reset_state_and_window()
+            return False
+        if (candidate_sl - sell_entry_price) < min_abs_dist:
+            adj = sell_entry_price + min_abs_dist
+            candidate_sl = float(adj)
+
+        stop = float(candidate_sl)
+        if stop <= sell_entry_price:
+            log.trade("🚫 Skip SELL: SL still <= entry after adjust", color='red')
+            state.reset()
+            self.reset_state_and_window()
+            return False
+
+        stop_distance = abs(sell_entry_price - stop)
+        reward_end = sell_entry_price - (stop_distance * win_ratio)
+        log.trace(lambda: f'stop = {stop}', color='red')
+        log.trace(lambda: f'reward_end = {reward_end}', color='red')
+
+        # ارسال سفارش SELL با هر stop و reward
+        with latency.span('order_send'):
+            result = mt5_conn.open_sell_position(
+                tick=last_tick,
+                sl=stop,
+                tp=reward_end,
+                comment=f"Bearish Swing {self.strategy.last_swing_type}",
+                risk_pct=0.01  # مثلا 1% ریسک
+            )
+        self._record_bar_to_order()
+        if self.on_order is not None:
+            self.on_order()
+        self._notify_order('SELL', 'Bearish', sell_entry_price, stop, reward_end, result)
+        state.reset()
+
+        self.reset_state_and_window()
+        return True
+
+    def _record_bar_to_order(self):
+        # تاخیر کامل: از بسته شدن کندل تا برگشت order_send (تاخیر بروکر + کد خودمان)
+        if self.bar_close is not None:
+            latency.record('bar_to_order', time.time() - self.bar_close)
+
+    def _notify_order(self, side, swing, entry, stop, reward_end, result):
+        log = self.log
+        # ارسال ایمیل غیرمسدودکننده
+        try:
+            send_trade_email_async(
+                subject=f"NEW {side} ORDER {self.symbol} TEST SYSTEM",
+                body=(
+                    f"Time: {datetime.now()}\n"
+                    f"Symbol: {self.symbol}\n"
+                    f"Type: {side} ({swing} Swing)\n"
+                    f"Entry: {entry}\n"
+                    f"SL: {stop}\n"
+                    f"TP: {reward_end}\n"
+                )
+            )
+        except Exception as _e:
+            log(f'Email dispatch failed: {_e}', color='red')
+
+        if result and getattr(result, 'retcode', None) == 10009:
+            log.trade(f'✅ {side} order executed successfully', color='green')
+            log.trade(f'📊 Ticket={result.order} Price={result.price} Volume={result.volume}', color='cyan')
+            # ارسال ایمیل غیرمسدودکننده
+            try:
+                send_trade_email_async(
+                    subject = f"Last order result TEST SYSTEM",
+                    body=(
+                        f"Ticket={result.order}\n"
+                        f"Price={result.price}\n"
+                        f"Volume={result.volume}\n"
+                    )
+                )
+            except Exception as _e:
+                log(f'Email dispatch failed: {_e}', color='red')
+        else:
+            if result:
+                log.trade(f'❌ {side} failed retcode={result.retcode} comment={result.comment}', color='red')
+            else:
+                log.trade(f'❌ {side} failed (no result object)', color='red')
+
+    # ---------- Position management ----------
+    def _digits(self):
+        info = self.conn.symbol_specs()
+        return info.digits if info else 5
+
+    def _round(self, p):
+        return float(f"{p:.{self._digits()}f}")
+
+    def attach_store(self, store, states=None):
+        """Persist position_states to store; states: what store.load() had for this symbol."""
+        states = states or {}
+        with self.positions_lock:
+            self.store = store
+            for ticket, st in states.items():
+                self.position_states.setdefault(ticket, st)
+            self._stored = set(states)
+        if states:
+            self.log(f'♻️ Restored {len(states)} position state(s): {sorted(states)}', color='cyan')
+
+    def _persist(self, ticket):
+        if self.store is None:
+            return
+        self.store.save(self.symbol, ticket, self.position_states[ticket])
+        self._stored.add(ticket)
+
+    def _stage_plan(self, ticket, st):
+        plan = self.stage_plans.get(ticket)
+        if plan is None:
+            plan = self.stage_plans[ticket] = StagePlan(
+                DYNAMIC_RISK_CONFIG.get('stages', []), st['entry'], st['risk'], st['direction'],
+                st.get('commission_trigger_R', 0.1), self._digits(), st['done_stages'])
+        return plan
+
+    def register_position(self, pos):
+        log = self.log
+        # محاسبه R (ریسک اولیه)
+        risk = abs(pos.price_open - pos.sl) if pos.sl else None
+        if not risk or risk == 0:
+            return
+
+        # محاسبه commission در R برای این پوزیشن
+        commission_R = 0.0
+        commission_cfg = DYNAMIC_RISK_CONFIG.get('commission_coverage_stage', {})
+        if commission_cfg.get('enable') and commission_cfg.get('auto_calculate'):
+            commission_per_lot = DYNAMIC_RISK_CONFIG.get('commission_per_lot', 4.5)
+            # محاسبه ارزش پولی 1R
+            # trade_tick_value تازه خوانده می‌شود (برای جفت‌ارزهای غیر USD با نرخ تغییر می‌کند)
+            symbol_info = self.conn.symbol_info(fresh=True)
+            if symbol_info:
+                # برای فارکس: 1 pip value = (contract_size * volume * tick_value) / price
+                # ریسک در pips
+                pip_size = symbol_info.point * (10.0 if symbol_info.digits in (3, 5) else 1.0)
+                risk_pips = risk / pip_size
+
+                # ارزش هر pip
+                pip_value = symbol_info.trade_tick_value * 10.0 if symbol_info.digits in (3, 5) else symbol_info.trade_tick_value
+
+                # ریسک پولی کل = risk_pips * pip_value * volume
+                risk_money = risk_pips * pip_value * pos.volume
+
+                if risk_money > 0:
+                    # کمیسیون به نسبت R
+                    commission_R = commission_per_lot / risk_money
+                    buffer_R = commission_cfg.get('commission_buffer_R', 0.15)
+                    commission_R += buffer_R
+                    log.trade(f'💵 Commission calc: commission=${commission_per_lot:.2f} / risk=${risk_money:.2f} = {commission_R:.4f}R (with buffer: {buffer_R:.3f}R)', color='yellow')
+
+        self.position_states[pos.ticket] = {
+            'entry': pos.price_open,
+            'risk': risk,
+            'direction': 'buy' if pos.type == mt5.POSITION_TYPE_BUY else 'sell',
+            'done_stages': set(),
+            'base_tp_R': DYNAMIC_RISK_CONFIG.get('base_tp_R', 2),
+            'commission_locked': False,
+            'commission_trigger_R': commission_R if commission_R > 0 else 0.1,  # fallback به 0.1R
+            'volume': pos.volume
+        }
+        self._persist(pos.ticket)
+        # رویداد ثبت پوزیشن
+        commission_note = f"commission_trigger={commission_R:.3f}R" if commission_R > 0 else "no_commission_calc"
+        log.trade(f'📋 Position registered: ticket={pos.ticket} | {commission_note} | volume={pos.volume}', color='cyan')
+        try:
+            log_position_event(
+                symbol=self.symbol,
+                ticket=pos.ticket,
+                event='open',
+                direction=self.position_states[pos.ticket]['direction'],
+                entry=pos.price_open,
+                current_price=pos.price_open,
+                sl=pos.sl,
+                tp=pos.tp,
+                profit_R=0.0,
+                stage=0,
+                risk_abs=risk,
+                locked_R=None,
+                volume=pos.volume,
+                note=f'position registered | {commission_note}'
+            )
+        except Exception:
+            pass
+
+    def manage_open_positions(self, positions=None, tick=None, tick_seen=None):
+        """
+        One pass over this symbol's positions: R for all of them from one tick snapshot
+        (numpy), then only the ones at or past their next stage trigger go through their
+        StagePlan. Modifies are sent inline, or through self.modifier (ModifyPool) with at
+        most one in flight per ticket; a target the broker rejected is not resubmitted
+        until its cooldown expires (modify_backoff). tick_seen: perf_counter() when tick was read, for
+        the tick_to_modify latency.
+        """
+        if not DYNAMIC_RISK_CONFIG.get('enable'):
+            return
+        if positions is None:
+            positions = self.conn.get_positions()
+        if not positions:
+            return
+        if tick is None:
+            tick = mt5.symbol_info_tick(self.symbol)
+        if not tick:
+            return
+        position_states = self.position_states
+        rows = []
+        for pos in positions:
+            if pos.ticket not in position_states:
+                self.register_position(pos)
+            st = position_states.get(pos.ticket)
+            if st:
+                rows.append((pos, st, self._stage_plan(pos.ticket, st)))
+        if not rows:
+            return
+
+        n = len(rows)
+        entry = np.fromiter((st['entry'] for _, st, _ in rows), np.float64, n)
+        risk = np.fromiter((st['risk'] for _, st, _ in rows), np.float64, n)
+        sign = np.fromiter((plan.sign for _, _, plan in rows), np.float64, n)
+        next_trigger = np.fromiter((plan.next_trigger() for _, _, plan in rows), np.float64, n)
+        # BUY با bid و SELL با ask بسته می‌شود
+        price = np.where(sign > 0, tick.bid, tick.ask)
+        price_profit = sign * (price - entry)
+        profit_R = price_profit / risk
+        for i, (_, st, _) in enumerate(rows):
+            st['profit_R'] = float(profit_R[i])
+            st['price'] = float(price[i])
+
+        modifier = self.modifier
+        for i in np.flatnonzero(price_profit >= next_trigger):
+            pos, st, plan = rows[i]
+            if modifier is not None and modifier.busy(pos.ticket):
+                continue  # modify قبلی هنوز برنگشته
+            # بالاترین مرحله‌ی R-based که قیمت از آن عبور کرده (یک bisect)؛ مراحل پایین‌تر با همان modify رد می‌شوند
+            k = plan.reached(price[i])
+            if k is None:
+                continue
+            new_sl_r, new_tp, _ = plan.target(k)
+            # Apply only if improves
+            if (new_sl_r - pos.sl) * plan.sign <= 0:
+                continue
+            # همین هدف قبلا رد شده و در cooldown است: نه modify و نه job در ModifyPool
+            if self.backed_off(pos.ticket, (k, new_sl_r, new_tp if new_tp is not None else pos.tp)):
+                continue
+            args = (pos, st, plan, k, float(price[i]), float(profit_R[i]), tick_seen)
+            if modifier is None:
+                self._send_stage(*args)
+            else:
+                modifier.submit(pos.ticket, self._send_stage, *args)
+
+    def _send_stage(self, pos, st, plan, k, cur_price, profit_R, tick_seen=None):
+        """Modify SL/TP to stage k of plan; bookkeeping under positions_lock. Returns True when applied."""
+        log = self.log
+        new_sl_r, new_tp, sid = plan.target(k)
+        # اگر new_tp تعیین نشده باشد (None)، از TP فعلی استفاده کن
+        new_tp_r = new_tp if new_tp is not None else pos.tp
+        target = (k, new_sl_r, new_tp_r)
+        if self.backed_off(pos.ticket, target):
+            return False
+        with latency.span('modify'):
+            res = self.conn.modify_sl_tp(pos.ticket, new_sl=new_sl_r, new_tp=new_tp_r)
+        if not res or getattr(res, 'retcode', None) != 10009:
+            self._modify_rejected(pos.ticket, target, sid, res)
+            return False
+        if tick_seen is not None:
+            latency.record('tick_to_modify', time.perf_counter() - tick_seen)
+        with self.positions_lock:
+            self.modify_backoff.pop(pos.ticket, None)
+            applied = plan.advance(k)
+            st['done_stages'].update(applied)
+            if pos.ticket in self.position_states:
+                self._persist(pos.ticket)
+        tp_msg = f'{new_tp_r}' if new_tp is not None else 'unchanged'
+        skipped = f' (+{len(applied) - 1} superseded)' if len(applied) > 1 else ''
+
+        # پیام ویژه برای مرحله کمیسیون
+        if 'commission' in sid.lower():
+            log.trade(f'💰 Commission Coverage Applied: ticket={pos.ticket} | Profit: {profit_R:.3f}R | SL moved to: {new_sl_r} (after commission) | TP: {tp_msg}', color='green')
+        else:
+            log.trade(f'⚙️ Dynamic Risk Stage {sid} applied{skipped}: ticket={pos.ticket} | Profit: {profit_R:.2f}R | SL: {new_sl_r} | TP: {tp_msg}', color='cyan')
+        try:
+            log_position_event(
+                symbol=self.symbol,
+                ticket=pos.ticket,
+                event=sid,
+                direction=st['direction'],
+                entry=st['entry'],
+                current_price=cur_price,
+                sl=new_sl_r,
+                tp=new_tp_r,
+                profit_R=profit_R,
+                stage=None,
+                risk_abs=st['risk'],
+                locked_R=(new_sl_r - st['entry']) * plan.sign / st['risk'],
+                volume=pos.volume,
+                note=f'stage {sid} trigger{skipped}'
+            )
+        except Exception:
+            pass
+        return True
+
+    def backed_off(self, ticket, target):
+        """True while the last modify of ticket to the same (k, sl, tp) target was rejected less than the cooldown ago."""
+        entry = self.modify_backoff.get(ticket)
+        return entry is not None and entry[0] == target and self.clock() < entry[1]
+
+    def _modify_rejected(self, ticket, target, sid, res):
+        cooldown = POSITION_MANAGER_CONFIG.get('modify_retry_cooldown', 5.0)
+        with self.positions_lock:
+            prev = self.modify_backoff.get(ticket)
+            self.modify_backoff[ticket] = (target, self.clock() + cooldown)
+        # هر هدف فقط یک بار لاگ می‌شود، نه در هر تلاش مجدد
+        if prev is None or prev[0] != target:
+            self.log.trade(f'⛔ Stage {sid} modify rejected: ticket={ticket} | retcode={getattr(res, "retcode", None)} '
+                           f'comment={getattr(res, "comment", None)} | SL={target[1]} TP={target[2]} | '
+                           f'retry in {cooldown:g}s unless the target changes', color='red')
+
+    def _evict_closed(self, open_tickets):
+        """Archive and drop the state of tickets missing from a positions snapshot."""
+        open_set = set(open_tickets)
+        closed = [t for t in self.position_states if t not in open_set]
+        for ticket in closed:
+            self.modify_backoff.pop(ticket, None)
+            st = self.position_states.pop(ticket)
+            self._archive(ticket, st, self.stage_plans.pop(ticket, None))
+        # پوزیشن‌های بسته‌شده از store هم حذف می‌شوند (شامل تیکت‌هایی که در غیاب ربات بسته شده‌اند)
+        gone = self._stored.difference(open_set)
+        if gone:
+            self.store.delete(self.symbol, gone)
+            self._stored -= gone
+
+    def _archive(self, ticket, st, plan=None):
+        """Final state of a closed ticket as a 'closed' row in the position events file."""
+        sl = locked_R = None
+        if plan is not None and plan.level >= 0:
+            sl = plan.target(plan.level)[0]
+            locked_R = (sl - st['entry']) * plan.sign / st['risk']
+        stages = sorted(st.get('done_stages', ()))
+        self.log.trade(f"📦 Position state archived: ticket={ticket} | stages={len(stages)} | last R={st.get('profit_R', 0.0):.2f}", color='yellow')
+        try:
+            log_position_event(
+                symbol=self.symbol,
+                ticket=ticket,
+                event='closed',
+                direction=st['direction'],
+                entry=st['entry'],
+                current_price=st.get('price'),
+                sl=sl,
+                tp=None,
+                profit_R=st.get('profit_R'),
+                stage=len(stages),
+                risk_abs=st['risk'],
+                locked_R=locked_R,
+                volume=st.get('volume'),
+                note=f"state evicted (last seen price/R) | stages: {','.join(stages) or '-'}"
+            )
+        except Exception:
+            pass
+
+    def manage_cycle(self, positions=None, tick=None, tick_seen=None):
+        with self.positions_lock:
+            if positions is None:
+                positions = self.conn.get_positions()
+            self.open_tickets = tuple(p.ticket for p in positions or ())
+            if positions is not None:
+                self._evict_closed(self.open_tickets)
+            # بررسی وضعیت پوزیشن‌های باز
+            if positions is None or len(positions) == 0:
+                if self.position_open:
+                    self.log.trade("🏁 Position closed", color='yellow')
+                    self.position_open = False
+            self.manage_open_positions(positions, tick, tick_seen)
+
+
+class TradingEngine:
+    """
+    Runs several SymbolTraders over one MT5 session and one BarScheduler.
+
+    All M1 bars close together, so each bar check probes every symbol once (one-bar
+    copy), then delta-fetches and processes only the symbols that got a new bar; a
+    symbol whose bar is late (or whose fetch failed) stays pending and only it is
+    re-probed every bar_retry_interval until it catches up or bar_retry_window runs out. Position management reads
+    positions_get() once per cycle for all symbols. The MT5 Python API is one IPC
+    session and not thread-safe, so symbols are interleaved in this loop, not threads;
+    only position management (POSITION_MANAGER_CONFIG) runs on its own thread, with MT5
+    calls serialized by position_manager.serialize_mt5.
+    """
+
+    def __init__(self, mt5_conn, symbols=None, scheduler=None):
+        self.conn = mt5_conn
+        symbols = symbols or MT5_CONFIG.get('symbols') or [mt5_conn.symbol]
+        self.traders = {s: SymbolTrader(mt5_conn, s) for s in symbols}
+        # بیدار شدن در بسته شدن کندل + تاخیر بروکر؛ مدیریت پوزیشن با آهنگ جداگانه
+        self.scheduler = scheduler or BarScheduler.from_config(SCHEDULER_CONFIG)
+        # نگهداری وضعیت قبلی قابلیت معامله برای ریست در انتهای ساعات ترید
+        self.last_can_trade_state = None
+        self.loop_errors = 0
+        # نمادهایی که کندل bar_target را هنوز پردازش نکرده‌اند (retry در bar_retry_window)
+        self.pending = set()
+        self.bar_target = None
+        self.position_manager = None
+        self.modify_pool = None
+        self.log = ContextLogger(__file__, 'TradingEngine')
+        # وضعیت پوزیشن‌ها از اجرای قبلی (یک بار خواندن برای همه‌ی نمادها)
+        self.store = PositionStore.from_config(POSITION_STORE_CONFIG)
+        if self.store is not None:
+            stored = self.store.load()
+            for symbol, trader in self.traders.items():
+                trader.attach_store(self.store, stored.get(symbol))
+
+    # ---------- Per-cycle batches ----------
+    def probe(self, symbols=None):
+        """symbol -> open time of its newest bar (None when MT5 returned nothing)."""
+        return {s: self.traders[s].conn.get_last_bar_time() for s in (symbols or self.traders)}
+
+    def positions_by_symbol(self):
+        positions = mt5.positions_get()
+        grouped = {s: [] for s in self.traders}
+        if positions is None:
+            return None
+        for pos in positions:
+            if pos.symbol in grouped:
+                grouped[pos.symbol].append(pos)
+        return grouped
+
+    def manage_positions(self):
+        with latency.span('manage'):
+            grouped = self.positions_by_symbol()
+            for symbol, trader in self.traders.items():
+                trader.manage_cycle(grouped.get(symbol, []) if grouped is not None else None)
+
+    def manage_cycle(self):
+        # با thread مدیریت پوزیشن، حلقه‌ی اصلی فقط زمان‌بندی را جلو می‌برد
+        if self.position_manager is None or not self.position_manager.running:
+            self.manage_positions()
+        self.scheduler.managed()
+
+    def start_position_manager(self, cfg=None):
+        cfg = POSITION_MANAGER_CONFIG if cfg is None else cfg
+        if not cfg.get('enable') or not DYNAMIC_RISK_CONFIG.get('enable'):
+            return None
+        self.position_manager = PositionManager.from_config(self, cfg).start()
+        workers = cfg.get('modify_workers', 4)
+        self.modify_pool = ModifyPool(workers, log=self.position_manager.log) if workers else None
+        for trader in self.traders.values():
+            trader.on_order = self.position_manager.wake
+            trader.modifier = self.modify_pool
+        self.log(f"🧵 Position manager thread every {self.position_manager.tick_interval * 1000:.0f}ms", color='cyan')
+        return self.position_manager
+
+    def stop_position_manager(self):
+        if self.position_manager is None:
+            return
+        self.position_manager.stop()
+        for trader in self.traders.values():
+            trader.on_order = None
+            trader.modifier = None
+        if self.modify_pool is not None:
+            self.modify_pool.shutdown()
+            self.modify_pool = None
+        self.position_manager = None
+
+    def bar_cycle(self):
+        """One bar check; returns False when MT5 returned no data at all."""
+        log = self.log
+        scheduler = self.scheduler
+        # مرز کندل بر اساس ساعت محلی (زمان کندل‌های MT5 به وقت سرور بروکر است)
+        bar_close = (time.time() // scheduler.bar_seconds) * scheduler.bar_seconds
+        retrying = bool(self.pending)
+        # probe سبک: فقط زمان آخرین کندل؛ در retry فقط نمادهایی که کندل جدید را هنوز نگرفته‌اند
+        with latency.span('probe'):
+            bar_times = self.probe(sorted(self.pending) if retrying else None)
+        if not retrying and all(t is None for t in bar_times.values()):
+            log("❌ Failed to get data from MT5", color='red')
+            return False
+        fresh = [s for s, t in bar_times.items() if t is not None and t != self.traders[s].last_bar_time]
+        if not fresh and not retrying:
+            if not scheduler.wait_expired():
+                waited = scheduler.bar_missing()
+                if waited >= scheduler.retry_window:  # حدودا یک بار در هر کندل
+                    last = {s: str(t.last_data_time) for s, t in self.traders.items()}
+                    log(f"⏳ Waiting for new data... Current: {last} (waited: {waited:.0f}s)", color='yellow', save_to_file=False)
+                return True
+            fresh = [s for s, t in bar_times.items() if t is not None]
+
+        # دریافت داده از MT5 (فقط delta برای نمادهایی که کندل جدید دارند)
+        # خطای یک نماد نباید کندل بقیه‌ی نمادها را عقب بیندازد
+        for symbol in fresh:
+            trader = self.traders[symbol]
+            try:
+                cache_data = trader.fetch()
+                if cache_data is None:
+                    trader.log("❌ Failed to get data from MT5", color='red')
+                    continue
+                with latency.span('bar'):
+                    trader.on_data(cache_data, bar_times[symbol], bar_close)
+            except Exception as e:
+                self.loop_errors += 1
+                trader.log(f"❌ Error: {e}", color='red')
+
+        # نمادهایی که هنوز به جدیدترین کندل نرسیده‌اند (کندل دیرتر رسیده، fetch ناموفق) در همان
+        # پنجره‌ی retry دوباره امتحان می‌شوند؛ bar_received فقط وقتی همه رسیدند یا پنجره تمام شد
+        if not retrying:
+            self.bar_target = max((t for t in bar_times.values() if t is not None), default=None)
+        self.pending = {s for s, t in self.traders.items() if t.last_bar_time != self.bar_target}
+        if self.pending:
+            waited = scheduler.bar_missing()
+            if waited < scheduler.retry_window:
+                return True
+            log(f"⏳ No new bar for {sorted(self.pending)} after {waited:.1f}s; waiting for the next close",
+                color='yellow', save_to_file=False)
+            self.pending = set()
+        scheduler.bar_received()
+        return True
+
+    def check_trading_time(self):
+        can_trade, trade_message = self.conn.can_trade()
+        # اگر از حالت قابل معامله به غیرقابل معامله تغییر کرد => ریست کامل BotState
+        try:
+            if self.last_can_trade_state is True and not can_trade:
+                self.log("🧹 Trading hours ended -> resetting BotState to avoid stale context", color='magenta')
+                for trader in self.traders.values():
+                    trader.state.reset()
+        except Exception:
+            pass
+        finally:
+            self.last_can_trade_state = can_trade
+        return can_trade, trade_message
+
+    def close_all_positions(self):
+        for trader in self.traders.values():
+            trader.conn.close_all_positions()
+
+    def run(self):
+        log = self.log
+        scheduler = self.scheduler
+        self.start_position_manager()
+        while True:
+            try:
+                # بررسی ساعات معاملاتی
+                can_trade, trade_message = self.check_trading_time()
+                if not can_trade:
+                    log(f"⏰ {trade_message}", color='yellow', save_to_file=False)
+                    sleep(60)
+                    continue
+
+                if not scheduler.bar_due():
+                    if scheduler.manage_due():
+                        self.manage_cycle()
+                    scheduler.sleep()
+                    continue
+
+                if not self.bar_cycle():
+                    sleep(5)
+                    continue
+
+                if scheduler.manage_due():
+                    self.manage_cycle()
+                latency.maybe_dump()
+                scheduler.sleep()
+
+            except KeyboardInterrupt:
+                log("🛑 Bot stopped by user", color='yellow')
+                self.stop_position_manager()
+                self.close_all_positions()
+                break
+            except Exception as e:
+                self.loop_errors += 1
+                log.trace(' ' * 80)
+                log(f"❌ Error: {e}", color='red')
+                sleep(5)
+        self.stop_position_manager()
+        if self.store is not None:
+            self.store.close()
+        self.dump_latency()
+
+    def dump_latency(self):
+        """Write a latency snapshot and print p50/p99/max per phase."""
+        for name, st in sorted(latency.dump().items()):
+            if st.get('count'):
+                self.log(f"⏱️ {name}: n={st['count']} p50={st['p50_ms']:.2f}ms p99={st['p99_ms']:.2f}ms max={st['max_ms']:.2f}ms", color='cyan')
+
+
+def _pip_size_for(symbol: str, mt5_conn=None) -> float:
+    info = mt5_conn.symbol_specs(symbol) if mt5_conn else mt5.symbol_info(symbol)
+    if not info:
+        return 0.0001
+    # برای 5/3 رقمی: 1 pip = 10 * point
+    return info.point * (10.0 if info.digits in (3, 5) else 1.0)
+
+def _min_stop_distance(symbol: str, mt5_conn=None) -> float:
+    info = mt5_conn.symbol_specs(symbol) if mt5_conn else mt5.symbol_info(symbol)
+    if not info:
+        return 0.0003
+    point = info.point
+    # حداقل فاصله مجاز بروکر (stops_level) یا 3 پوینت به‌عنوان فfallback
+    return max((getattr(info, 'trade_stops_level', 0) or 0) * point, 3 * point)
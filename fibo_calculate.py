@@ -1,8 +1,9 @@
-def fibonacci_retracement(start_price, end_price):
+def fibonacci_retracement(start_price, end_price, fib_705=0.705, fib_90=0.9):
+    # کلیدهای '0.705' و '0.9' نام سطح ورود و سطح دوم هستند؛ نسبت‌ها قابل تنظیم‌اند (TRADING_CONFIG)
     fib_levels = {
         '0.0': start_price,
-        '0.705': start_price + 0.705 * (end_price - start_price),
-        '0.9': start_price + 0.9 * (end_price - start_price),
+        '0.705': start_price + fib_705 * (end_price - start_price),
+        '0.9': start_price + fib_90 * (end_price - start_price),
         '1.0': end_price
     }
-    return fib_levels
\ No newline at end of file
+    return fib_levels
@@ -1,7 +1,10 @@
+import numpy as np
 from metatrader5_config import TRADING_CONFIG
 
-def get_legs(data, custom_threshold=None, verbose: bool=False):
+def get_legs(data, custom_threshold=None, verbose: bool=False, thresholds=None):
+    """thresholds: optional per-bar thresholds (e.g. VolatilityEngine.thresholds), one per row."""
     threshold = custom_threshold if custom_threshold else TRADING_CONFIG['threshold']
+    thresholds = _per_bar(thresholds, threshold)
     if verbose:
         print(f'Using threshold: {threshold}')
         print('len(data): ', len(data))
@@ -13,6 +16,8 @@ def get_legs(data, custom_threshold=None, verbose: bool=False):
     i = 1
 
     while i < len(data):
+        if thresholds is not None:
+            threshold = thresholds[i]
         
 
     ##################          Current Price      ###############################################################   
@@ -136,6 +141,129 @@ def get_legs(data, custom_threshold=None, verbose: bool=False):
     return legs
 
 
+def _per_bar(thresholds, default):
+    """Per-bar thresholds as a list; NaN (indicator not warmed up) -> default."""
+    if thresholds is None:
+        return None
+    t = np.asarray(thresholds, dtype=np.float64)
+    return np.where(np.isnan(t), default, t).tolist()
+
+
+def get_legs_fast(data, custom_threshold=None, thresholds=None):
+    """Same output as get_legs, computed by get_legs_arrays on plain float64 arrays."""
+    legs = get_legs_arrays(
+        data['open'].to_numpy(dtype=np.float64),
+        data['high'].to_numpy(dtype=np.float64),
+        data['low'].to_numpy(dtype=np.float64),
+        data['close'].to_numpy(dtype=np.float64),
+        custom_threshold=custom_threshold,
+        thresholds=thresholds,
+    )
+    # تبدیل موقعیت‌ها به timestamp فقط در انتها
+    index = data.index
+    for leg in legs:
+        leg['start'] = index[leg['start']]
+        leg['end'] = index[leg['end']]
+    return legs
+
+
+def get_legs_arrays(open_, high, low, close, custom_threshold=None, thresholds=None):
+    """
+    Array engine for get_legs: no pandas lookups inside the loop.
+    Takes float64 open/high/low/close arrays and returns legs whose 'start'/'end'
+    are integer positions into those arrays. thresholds: optional per-bar thresholds.
+    """
+    threshold = custom_threshold if custom_threshold else TRADING_CONFIG['threshold']
+    upper = threshold * 5
+    thresholds = _per_bar(thresholds, threshold)
+    n = len(close)
+    legs = []
+    if n == 0:
+        return legs
+
+    # پیش‌محاسبه‌ی برداری: قیمت شروع هر کندل (high اگر صعودی، وگرنه low)
+    bullish = np.asarray(close) >= np.asarray(open_)
+    o = np.asarray(open_, dtype=np.float64).tolist()
+    h = np.asarray(high, dtype=np.float64).tolist()
+    l = np.asarray(low, dtype=np.float64).tolist()
+    c = np.asarray(close, dtype=np.float64).tolist()
+    bar_price = np.where(bullish, high, low).astype(np.float64).tolist()
+    bullish = bullish.tolist()
+
+    s = 0                  # start_index (position)
+    last_dir = None        # legs[-1]['direction']
+    last_leg = None        # legs[-1]
+    prev_end = -1          # legs[-2]['end'] (position)
+    prev_end_dir = None    # legs[-2]['direction']
+    direction = None
+
+    for i in range(1, n):
+        if thresholds is not None:
+            threshold = thresholds[i]
+            upper = threshold * 5
+        hi = h[i]
+        lo = l[i]
+        if last_dir == 'up' and hi >= h[i-1]:
+            current_price = hi
+        elif last_dir == 'down' and lo <= l[i-1]:
+            current_price = lo
+        else:
+            current_price = hi if bullish[i] else lo
+
+        start_price = bar_price[s]
+        price_diff = abs(current_price - start_price) * 10000
+
+        if price_diff >= threshold and price_diff < upper:
+            direction = 'up' if hi > h[s] or (hi > h[i-1] and c[i] > o[i]) else 'down'
+            if last_dir == direction:
+                last_leg['end'] = i
+                last_leg['end_value'] = current_price
+                last_leg['length'] = price_diff + last_leg['length']
+                s = i
+            elif i - s + 1 >= 3:
+                if last_leg is not None:
+                    end = last_leg['end']
+                    start_price = h[end] if last_dir == 'up' else l[end]
+                    prev_end = end
+                    prev_end_dir = last_dir
+                last_leg = {
+                    'start': s,
+                    'start_value': start_price,
+                    'end': i,
+                    'end_value': current_price,
+                    'length': abs(current_price - start_price) * 10000,
+                    'direction': direction,
+                }
+                legs.append(last_leg)
+                last_dir = direction
+                s = i
+
+        elif last_dir == 'up' and hi >= h[s] and price_diff < threshold:
+            if prev_end >= 0:
+                price_diff = abs(current_price - (h[prev_end] if prev_end_dir == 'up' else l[prev_end])) * 10000
+            else:
+                price_diff += last_leg['length']
+            s = i
+            last_leg['end'] = i
+            last_leg['end_value'] = current_price
+            last_leg['length'] = price_diff
+            # مثل get_legs: آخرین direction محاسبه‌شده روی لگ نوشته می‌شود
+            last_leg['direction'] = direction
+            last_dir = direction
+
+        elif last_dir == 'down' and lo <= l[s] and price_diff < threshold:
+            if prev_end >= 0:
+                price_diff = abs(current_price - (h[prev_end] if prev_end_dir == 'up' else l[prev_end])) * 10000
+            else:
+                price_diff += last_leg['length']
+            s = i
+            last_leg['end'] = i
+            last_leg['end_value'] = current_price
+            last_leg['length'] = price_diff
+
+    return legs
+
+
 def custom_price_diff(data, j, current_price=0, legs=[]):
     
     timestamp_value = legs[j-2]['end']
@@ -147,3 +275,189 @@ def custom_price_diff(data, j, current_price=0, legs=[]):
     else:
         price_diff = abs(current_price - row['low']) * 10000
         return price_diff
+
+
+class LegTracker:
+    """
+    Streaming version of get_legs: keeps legs, start bar and j between calls so
+    every new closed bar costs O(1) instead of re-walking the whole window.
+    Feeding the same bars in the same order gives exactly the legs of get_legs.
+
+    With ``indicators`` (indicators.VolatilityEngine) the threshold follows volatility:
+    every committed bar is fed to the engine after its own step, so each bar uses the
+    threshold of the bars closed before it, exactly like get_legs(thresholds=...).
+    """
+
+    def __init__(self, custom_threshold=None, max_legs=None, indicators=None):
+        self.custom_threshold = custom_threshold
+        self.max_legs = max_legs  # اگر تعیین شود لگ‌های قدیمی دور ریخته می‌شوند (حداقل 2 لگ لازم است)
+        self.indicators = indicators
+        self.reset()
+
+    def reset(self):
+        self.legs = []
+        self.last_time = None
+        self._end_hl = []        # (high, low) of each leg's end bar, parallel to legs
+        self._start = None       # (time, open, high, low, close, position) of start_index bar
+        self._prev = None        # (high, low, close) of bar i-1
+        self._direction = None   # last direction computed in the threshold branch
+        self._count = 0
+        if self.indicators is not None:
+            self.indicators.reset()
+
+    @property
+    def threshold(self):
+        if self.indicators is not None:
+            thr = self.indicators.threshold
+            if thr is not None:
+                return thr
+        return self.custom_threshold if self.custom_threshold else TRADING_CONFIG['threshold']
+
+    # ---------- Feeding ----------
+    def update(self, bar):
+        """Commit one closed bar (DataFrame row or dict with open/high/low/close)."""
+        ts = bar['timestamp'] if 'timestamp' in bar else bar.name
+        o, h, l, c = float(bar['open']), float(bar['high']), float(bar['low']), float(bar['close'])
+        self._step(ts, o, h, l, c)
+        if self.indicators is not None:
+            self.indicators.update(o, h, l, c, bar['spread'] if 'spread' in bar else None)
+        return self.legs
+
+    def update_from(self, data):
+        """Commit every bar of ``data`` newer than the last committed one."""
+        if len(data) == 0:
+            return self.legs
+        if self.last_time is None or data.index[0] > self.last_time:
+            # اولین اجرا یا فاصله‌ای بیشتر از پنجره: از ابتدای همین داده شروع کن
+            self.reset()
+            first = 0
+        else:
+            first = data.index.searchsorted(self.last_time, side='right')
+        if first >= len(data):
+            return self.legs
+        part = data.iloc[first:]
+        bars = zip(part.index, part['open'].tolist(), part['high'].tolist(), part['low'].tolist(), part['close'].tolist())
+        ind = self.indicators
+        if ind is None:
+            for ts, o, h, l, c in bars:
+                self._step(ts, o, h, l, c)
+            return self.legs
+        spreads = part['spread'].tolist() if 'spread' in part.columns else [None] * len(part)
+        for (ts, o, h, l, c), sp in zip(bars, spreads):
+            self._step(ts, o, h, l, c)
+            ind.update(o, h, l, c, sp)
+        return self.legs
+
+    def peek(self, bar, last=None):
+        """
+        Legs as they would be with ``bar`` appended, without committing it.
+        Meant for the still-forming candle whose OHLC keeps changing.
+        Returns copies of the last ``last`` legs (all legs if None).
+        """
+        saved = self._snapshot()
+        try:
+            # فقط لگ‌ها؛ اندیکاتورها با کندل در حال تشکیل به‌روز نمی‌شوند
+            ts = bar['timestamp'] if 'timestamp' in bar else bar.name
+            self._step(ts, float(bar['open']), float(bar['high']), float(bar['low']), float(bar['close']))
+            legs = self.legs if last is None else self.legs[-last:]
+            return [dict(leg) for leg in legs]
+        finally:
+            self._restore(saved)
+
+    # ---------- Core ----------
+    def _snapshot(self):
+        n = len(self.legs)
+        return (n, dict(self.legs[-1]) if n else None, self._end_hl[-1] if n else None,
+                self.last_time, self._start, self._prev, self._direction, self._count)
+
+    def _restore(self, saved):
+        n, last_leg, last_end_hl, self.last_time, self._start, self._prev, self._direction, self._count = saved
+        del self.legs[n:]
+        del self._end_hl[n:]
+        if n:
+            # همان dict قبلی را برگردان تا ارجاع‌های بیرونی معتبر بمانند
+            self.legs[-1].clear()
+            self.legs[-1].update(last_leg)
+            self._end_hl[-1] = last_end_hl
+
+    def _step(self, ts, o, h, l, c):
+        pos = self._count
+        self._count += 1
+        self.last_time = ts
+        if self._start is None:
+            self._start = (ts, o, h, l, c, pos)
+            self._prev = (h, l, c)
+            return
+
+        threshold = self.threshold
+        legs = self.legs
+        j = len(legs)
+        prev_h, prev_l, prev_c = self._prev
+        start_ts, start_o, start_h, start_l, start_c, start_pos = self._start
+
+        # Current price
+        if j > 0 and legs[j-1]['direction'] == 'up' and h >= prev_h:
+            current_price = h
+        elif j > 0 and legs[j-1]['direction'] == 'down' and l <= prev_l:
+            current_price = l
+        else:
+            current_price = h if c >= o else l
+
+        # Start price
+        start_price = start_h if start_c >= start_o else start_l
+        price_diff = abs(current_price - start_price) * 10000
+
+        if price_diff >= threshold and price_diff < threshold * 5:
+            direction = 'up' if h > start_h or (h > prev_h and c > o) else 'down'
+            self._direction = direction
+            if j > 0 and legs[j-1]['direction'] == direction:
+                price_diff += legs[j-1]['length']
+                self._extend_last(ts, h, l, current_price, price_diff, direction)
+                self._start = (ts, o, h, l, c, pos)
+
+            elif pos - start_pos + 1 >= 3:
+                if legs:
+                    end_h, end_l = self._end_hl[-1]
+                    start_price = end_h if legs[-1]['direction'] == 'up' else end_l
+                price_diff = abs(current_price - start_price) * 10000
+                legs.append({
+                    'start': start_ts,
+                    'start_value': start_price,
+                    'end': ts,
+                    'end_value': current_price,
+                    'length': price_diff,
+                    'direction': direction,
+                })
+                self._end_hl.append((h, l))
+                self._start = (ts, o, h, l, c, pos)
+                if self.max_legs and len(legs) > max(self.max_legs, 2):
+                    del legs[0]
+                    del self._end_hl[0]
+
+        elif j > 0 and legs[j-1]['direction'] == 'up' and h >= start_h and price_diff < threshold:
+            price_diff = self._custom_price_diff(j, current_price) if j > 1 else price_diff + legs[j-1]['length']
+            self._start = (ts, o, h, l, c, pos)
+            # مثل get_legs: جهت آخرین محاسبه‌شده (نه لزوما 'up') روی لگ نوشته می‌شود
+            self._extend_last(ts, h, l, current_price, price_diff, self._direction)
+
+        elif j > 0 and legs[j-1]['direction'] == 'down' and l <= start_l and price_diff < threshold:
+            price_diff = self._custom_price_diff(j, current_price) if j > 1 else price_diff + legs[j-1]['length']
+            self._start = (ts, o, h, l, c, pos)
+            self._extend_last(ts, h, l, current_price, price_diff, None)
+
+        self._prev = (h, l, c)
+
+    def _extend_last(self, ts, h, l, current_price, price_diff, direction):
+        leg = self.legs[-1]
+        leg['end'] = ts
+        leg['end_value'] = current_price
+        leg['length'] = price_diff
+        if direction is not None:
+            leg['direction'] = direction
+        self._end_hl[-1] = (h, l)
+
+    def _custom_price_diff(self, j, current_price):
+        end_h, end_l = self._end_hl[j-2]
+        if self.legs[j-2]['direction'] == 'up':
+            return abs(current_price - end_h) * 10000
+        return abs(current_price - end_l) * 10000
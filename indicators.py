@@ -0,0 +1,179 @@
+"""
+Incremental volatility indicators fed by the bar stream.
+
+    vol = VolatilityEngine.from_config(ADAPTIVE_THRESHOLD_CONFIG, fallback=6, point=info.point, digits=info.digits)
+    vol.update(o, h, l, c, spread_points)      # once per closed bar, O(1)
+    vol.threshold                              # leg threshold for the next bar (get_legs units)
+
+ATR is Wilder's (RMA of the true range); the spread is a simple mean over the last
+`window` bars kept as a running sum over a fixed ring, and the range (highest high -
+lowest low of the last `range_window` bars) comes from two monotonic queues, so an update
+never touches the window. The threshold is max(atr_mult * ATR, spread_mult * spread,
+range_mult * range), worked out in pips of the symbol (pip = 10 points on 3/5-digit
+symbols), clamped to min/max_threshold pips and then converted to get_legs units
+(price * LEG_SCALE), so the same config adapts on EURUSD, JPY crosses and gold.
+The threshold for a bar only uses the bars closed before it: LegTracker feeds the engine
+on commit (not on peek), and thresholds() gives the same per-bar series for a whole array
+in one pass (replay / get_legs_arrays).
+"""
+from collections import deque
+
+import numpy as np
+
+LEG_SCALE = 10000  # واحد طول لگ در get_legs: (قیمت) * 10000
+
+
+class _RollingMean:
+    """Mean of the last n values with O(1) update (ring + running sum)."""
+
+    __slots__ = ('n', 'values', 'pos', 'count', 'total')
+
+    def __init__(self, n):
+        self.n = int(n)
+        self.values = [0.0] * self.n
+        self.pos = 0
+        self.count = 0
+        self.total = 0.0
+
+    def push(self, v):
+        if self.count == self.n:
+            self.total -= self.values[self.pos]
+        else:
+            self.count += 1
+        self.values[self.pos] = v
+        self.total += v
+        self.pos = (self.pos + 1) % self.n
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+
+class _RollingMax:
+    """Max of the last n values, O(1) amortized: monotonic queue of (index, value)."""
+
+    __slots__ = ('n', 'items', 'i')
+
+    def __init__(self, n):
+        self.n = int(n)
+        self.items = deque()
+        self.i = 0
+
+    def push(self, v):
+        items = self.items
+        while items and items[-1][1] <= v:
+            items.pop()
+        i = self.i
+        items.append((i, v))
+        if items[0][0] <= i - self.n:
+            items.popleft()
+        self.i = i + 1
+
+    @property
+    def value(self):
+        return self.items[0][1] if self.items else None
+
+
+class VolatilityEngine:
+    def __init__(self, atr_period=14, window=60, atr_mult=3.0, spread_mult=3.0, min_threshold=3.0,
+                 max_threshold=30.0, fallback=None, point=0.00001, digits=5, range_window=20, range_mult=0.0):
+        self.atr_period = int(atr_period)
+        self.window = int(window)
+        self.range_window = int(range_window)
+        self.atr_mult = atr_mult
+        self.spread_mult = spread_mult
+        self.range_mult = range_mult  # 0 = range فقط گزارش می‌شود و در threshold نیست
+        self.min_threshold = min_threshold  # به pip همان نماد
+        self.max_threshold = max_threshold
+        self.fallback = fallback  # threshold ثابت تا وقتی ATR گرم نشده
+        self.point = point        # spread از MT5 به پوینت می‌آید
+        self.pip = point * (10.0 if digits in (3, 5) else 1.0)
+        self.scale = self.pip * LEG_SCALE  # واحد لگ به‌ازای هر pip (EURUSD: 1، USDJPY: 100)
+        self.reset()
+
+    @classmethod
+    def from_config(cls, cfg, fallback=None, point=None, digits=None):
+        """point / digits: the symbol's (symbol_info); the 5-digit defaults otherwise."""
+        return cls(
+            atr_period=cfg.get('atr_period', 14),
+            window=cfg.get('window', 60),
+            atr_mult=cfg.get('atr_mult', 3.0),
+            spread_mult=cfg.get('spread_mult', 3.0),
+            min_threshold=cfg.get('min_threshold', 3.0),
+            max_threshold=cfg.get('max_threshold', 30.0),
+            range_window=cfg.get('range_window', 20),
+            range_mult=cfg.get('range_mult', 0.0),
+            fallback=fallback,
+            point=point or 0.00001,
+            digits=5 if digits is None else digits,
+        )
+
+    def reset(self):
+        self.count = 0
+        self.atr = 0.0
+        self.prev_close = None
+        self.spread = _RollingMean(self.window)
+        self.highs = _RollingMax(self.range_window)
+        self.lows = _RollingMax(self.range_window)  # max(-low) = -min(low)
+
+    @property
+    def ready(self):
+        return self.count >= self.atr_period
+
+    def update(self, o, h, l, c, spread=None):
+        """Feed one closed bar; spread in points (None = not known for this bar)."""
+        rng = h - l
+        pc = self.prev_close
+        tr = rng if pc is None else max(rng, abs(h - pc), abs(l - pc))
+        self.count += 1
+        if self.count <= self.atr_period:
+            # گرم شدن: میانگین ساده‌ی اولین atr_period کندل، بعد RMA
+            self.atr += (tr - self.atr) / self.count
+        else:
+            self.atr += (tr - self.atr) / self.atr_period
+        self.prev_close = c
+        self.highs.push(h)
+        self.lows.push(-l)
+        if spread is not None:
+            self.spread.push(spread * self.point)
+
+    @property
+    def range(self):
+        """Highest high - lowest low of the last range_window bars (price); 0 before the first bar."""
+        return self.highs.value + self.lows.value if self.count else 0.0
+
+    @property
+    def threshold(self):
+        """Leg threshold in get_legs units; fallback until atr_period bars were seen."""
+        if not self.ready:
+            return self.fallback
+        pips = max(self.atr_mult * self.atr, self.spread_mult * self.spread.mean,
+                   self.range_mult * self.range) / self.pip
+        return min(max(pips, self.min_threshold), self.max_threshold) * self.scale
+
+    def snapshot(self):
+        """Current values for logs / metrics (threshold in leg units, ATR, spread and range in pips)."""
+        return {
+            'threshold': self.threshold,
+            'atr': self.atr / self.pip,
+            'spread': self.spread.mean / self.pip,
+            'range': self.range / self.pip,
+            'bars': self.count,
+        }
+
+    def thresholds(self, open_, high, low, close, spread=None):
+        """Per-bar thresholds for whole arrays: element i uses bars 0..i-1 only (resets first)."""
+        self.reset()
+        n = len(close)
+        out = np.empty(n, dtype=np.float64)
+        o = np.asarray(open_, dtype=np.float64).tolist()
+        h = np.asarray(high, dtype=np.float64).tolist()
+        l = np.asarray(low, dtype=np.float64).tolist()
+        c = np.asarray(close, dtype=np.float64).tolist()
+        s = np.asarray(spread, dtype=np.float64).tolist() if spread is not None else [None] * n
+        fallback = np.nan if self.fallback is None else self.fallback
+        for i in range(n):
+            thr = self.threshold
+            out[i] = fallback if thr is None else thr
+            self.update(o[i], h[i], l[i], c[i], s[i])
+        return out
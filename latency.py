@@ -0,0 +1,157 @@
+"""
+Per-phase latency spans for the trading loop.
+
+    with latency.span('fetch'):
+        ...
+    latency.record('bar_to_order', seconds)
+
+Each span name feeds a LatencyHistogram: HDR-style log-linear buckets over integer
+microseconds (about 1.5% relative precision, fixed memory, O(1) record), so p50/p99/max
+stay cheap no matter how long the bot runs. Snapshots are appended as JSON lines to
+LATENCY_CONFIG['dump_file'] every dump_interval seconds (maybe_dump) and on shutdown.
+"""
+import json
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from metatrader5_config import LATENCY_CONFIG
+
+_SUB_BITS = 7                      # 128 زیر-باکت در هر توان 2 (~1.5% دقت)
+_SUB_COUNT = 1 << _SUB_BITS
+_HALF = _SUB_COUNT >> 1
+
+
+def _bucket(v):
+    if v < _SUB_COUNT:
+        return v
+    shift = v.bit_length() - _SUB_BITS
+    return _SUB_COUNT + (shift - 1) * _HALF + (v >> shift) - _HALF
+
+
+def _bucket_value(i):
+    """Highest value (us) that falls into bucket i."""
+    if i < _SUB_COUNT:
+        return i
+    shift = (i - _SUB_COUNT) // _HALF + 1
+    return (((i - _SUB_COUNT) % _HALF + _HALF + 1) << shift) - 1
+
+
+class LatencyHistogram:
+    def __init__(self, max_us=3_600_000_000):
+        self.max_us = max_us
+        self.counts = [0] * (_bucket(max_us) + 1)
+        self.count = 0
+        self.total_us = 0
+        self.min_us = None
+        self.max_seen_us = 0
+
+    def record_us(self, us):
+        us = min(max(int(us), 0), self.max_us)
+        self.counts[_bucket(us)] += 1
+        self.count += 1
+        self.total_us += us
+        if self.min_us is None or us < self.min_us:
+            self.min_us = us
+        if us > self.max_seen_us:
+            self.max_seen_us = us
+
+    def percentile(self, p):
+        """Value (us) at percentile p (0-100); upper edge of its bucket, capped at max."""
+        if not self.count:
+            return 0
+        rank = max(1, int(round(p / 100.0 * self.count + 0.5 - 1e-9)))
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= rank:
+                return min(_bucket_value(i), self.max_seen_us)
+        return self.max_seen_us
+
+    def summary(self):
+        """count, mean/p50/p90/p99/max in milliseconds."""
+        if not self.count:
+            return {'count': 0}
+        return {
+            'count': self.count,
+            'mean_ms': round(self.total_us / self.count / 1000.0, 3),
+            'p50_ms': self.percentile(50) / 1000.0,
+            'p90_ms': self.percentile(90) / 1000.0,
+            'p99_ms': self.percentile(99) / 1000.0,
+            'max_ms': self.max_seen_us / 1000.0,
+        }
+
+
+class LatencyRecorder:
+    def __init__(self, enable=True, dump_file=None, dump_interval=300.0):
+        self.enable = enable
+        self.dump_file = dump_file
+        self.dump_interval = dump_interval
+        self.histograms = {}
+        self._lock = threading.Lock()
+        self._next_dump = time.monotonic() + dump_interval if dump_interval else None
+
+    @classmethod
+    def from_config(cls, cfg):
+        return cls(
+            enable=cfg.get('enable', True),
+            dump_file=cfg.get('dump_file'),
+            dump_interval=cfg.get('dump_interval', 300.0),
+        )
+
+    def record(self, name, seconds):
+        if not self.enable:
+            return
+        with self._lock:
+            h = self.histograms.get(name)
+            if h is None:
+                h = self.histograms[name] = LatencyHistogram()
+            h.record_us(seconds * 1e6)
+
+    @contextmanager
+    def span(self, name):
+        if not self.enable:
+            yield
+            return
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - t0)
+
+    def items(self):
+        """(name, LatencyHistogram) pairs; the histograms are live, not copies."""
+        with self._lock:
+            return list(self.histograms.items())
+
+    def snapshot(self):
+        with self._lock:
+            return {name: h.summary() for name, h in self.histograms.items()}
+
+    def dump(self, path=None):
+        path = path or self.dump_file
+        snap = self.snapshot()
+        if not path or not snap:
+            return snap
+        line = json.dumps({'time': datetime.now().isoformat(timespec='seconds'), 'spans': snap})
+        try:
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+        except Exception as e:
+            print(f"[latency] dump failed: {e}")
+        return snap
+
+    def maybe_dump(self):
+        """Dump when dump_interval has passed since the last one."""
+        if self._next_dump is None or time.monotonic() < self._next_dump:
+            return None
+        self._next_dump = time.monotonic() + self.dump_interval
+        return self.dump()
+
+    def reset(self):
+        with self._lock:
+            self.histograms.clear()
+
+
+latency = LatencyRecorder.from_config(LATENCY_CONFIG)
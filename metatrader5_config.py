@@ -50,6 +50,8 @@ MY_CUSTOM_TIME_IRAN = {
 # تنظیمات MT5
 MT5_CONFIG = {
     'symbol': 'EURUSD',
+    # چند نماد روی یک session (اختیاری)؛ اگر خالی باشد فقط 'symbol' معامله می‌شود
+    'symbols': [],
     'lot_size': 0.01,
     'win_ratio': 2,
     'magic_number': 234000,
@@ -58,6 +60,14 @@ MT5_CONFIG = {
     'min_balance': 1,
     'max_daily_trades': 10,
     'trading_hours': MY_CUSTOM_TIME_IRAN,
+    # TTL (ثانیه) کش اطلاعات MT5؛ None = برای کل session. فقط symbol_specs (point، digits،
+    # volume_*، stops_level، filling_mode) ثابت است؛ symbol_info شامل tick_value/bid/ask است
+    'info_cache_ttl': {
+        'symbol_specs': None,
+        'symbol_info': 1.0,
+        'account_info': 1.0,
+        'terminal_info': 2.0,
+    },
 }
 
 # تنظیمات استراتژی
@@ -73,6 +83,67 @@ TRADING_CONFIG = {
     # 'touch_epsilon_pips': 0.15,
 }
 
+# threshold لگ‌ها بر اساس نوسان (indicators.py)؛ اگر غیرفعال باشد TRADING_CONFIG['threshold'] ثابت
+ADAPTIVE_THRESHOLD_CONFIG = {
+    'enable': False,
+    'atr_period': 14,             # ATR وایلدر روی کندل‌های بسته‌شده
+    'window': 60,                 # میانگین spread روی این تعداد کندل
+    'atr_mult': 3.0,              # threshold = max(atr_mult * ATR, spread_mult * spread, range_mult * range) به pip نماد
+    'spread_mult': 3.0,
+    'range_window': 20,           # بالاترین high - پایین‌ترین low روی این تعداد کندل
+    'range_mult': 0.0,            # سهم range در threshold (0 = فقط در snapshot / metrics)
+    'min_threshold': 3,           # pip نماد (pip = 10 پوینت روی نمادهای 3/5 رقمی)؛ بعد به واحد لگ تبدیل می‌شود
+    'max_threshold': 30,
+}
+
+# زمان‌بندی حلقه اصلی (به جای polling هر 0.5 ثانیه)
+SCHEDULER_CONFIG = {
+    'bar_seconds': 60,            # M1
+    'bar_close_latency': 0.3,     # seconds after the expected bar close before probing MT5
+    'bar_retry_interval': 0.25,   # re-probe interval when the new bar is not there yet
+    'bar_retry_window': 5.0,      # after this many seconds stop fast retries and wait for the next close
+    'manage_interval': 0.5,       # position management cadence
+    'max_wait': 60,               # force processing after this many seconds without a new bar
+}
+
+# هیستوگرام تاخیر هر مرحله از چرخه (latency.py)
+LATENCY_CONFIG = {
+    'enable': True,
+    'dump_file': 'latency_stats.jsonl',   # هر خط یک snapshot (p50/p90/p99/max به میلی‌ثانیه)
+    'dump_interval': 300,                 # seconds
+}
+
+# مدیریت پوزیشن روی thread جدا (position_manager.py)، با تغییر تیک به جای انتهای حلقه‌ی کندل
+POSITION_MANAGER_CONFIG = {
+    'enable': True,
+    'tick_interval': 0.05,        # seconds بین خواندن symbol_info_tick (تا ده‌ها میلی‌ثانیه)
+    'positions_interval': 0.5,    # positions_get کامل برای پوزیشن‌های جدید/بسته‌شده
+    'modify_workers': 4,          # thread pool برای modify_sl_tp (0 = در همان thread)
+    'modify_retry_cooldown': 5.0, # seconds: modify ردشده (مثلا 10016/10025) تا این مدت دوباره ارسال نمی‌شود مگر هدف عوض شود
+    'serialize_mt5': True,        # همه‌ی فراخوانی‌های MetaTrader5 پشت یک lock (یک session IPC)
+}
+
+# وضعیت هر تیکت (done_stages، commission R، ...) روی دیسک برای warm restart (position_store.py)
+POSITION_STORE_CONFIG = {
+    'enable': True,
+    'path': 'position_state.db',  # SQLite (WAL)
+}
+
+# کش محلی کندل‌ها روی دیسک (bar_cache.py):  python bar_cache.py sync EURUSD --from 2025-01-01
+BAR_CACHE_CONFIG = {
+    'root': 'bar_cache',
+    'chunk_days': 7,              # طول هر درخواست copy_rates_range در sync
+    'warm_start': True,           # buffer ربات در شروع از کش پر شود (فقط delta از MT5)
+}
+
+# endpoint اختیاری Prometheus (metrics.py) روی یک thread جدا
+METRICS_CONFIG = {
+    'enable': False,
+    'host': '127.0.0.1',
+    'port': 9108,
+    'count_mt5_calls': True,   # شمارش فراخوانی‌ها و خطاهای API متاتریدر
+}
+
 # مدیریت پویا چند مرحله‌ای جدید - 20 مرحله (پوشش کمیسیون تا 20R)
 # مراحل بر اساس درخواست:
 # 0) Commission Coverage: وقتی سود از کمیسیون عبور کرد، SL را به نقطه بعد از کمیسیون می‌بریم
@@ -217,7 +288,8 @@ DYNAMIC_RISK_CONFIG = {
 
 # تنظیمات لاگ
 LOG_CONFIG = {
-    'log_level': 'INFO',        # DEBUG, INFO, WARNING, ERROR
+    'log_level': 'INFO',        # DEBUG, INFO, TRADE, WARNING, ERROR
+    'bar_trace': True,          # trace هر کندل (swing/fib/legs) در سطح INFO؛ False = فقط وقتی log_level برابر DEBUG است
     'save_to_file': True,       # ذخیره در فایل
     'max_log_size': 10,         # حداکثر حجم فایل لاگ (MB)
 }
@@ -0,0 +1,207 @@
+"""
+Optional Prometheus endpoint (stdlib only).
+
+    server = start_metrics_server(engine)     # METRICS_CONFIG host/port
+    curl http://127.0.0.1:9108/metrics
+
+The trading thread only bumps plain int attributes (no locks); everything is read and
+formatted on the HTTP thread at scrape time. Sources: latency histograms (cycle phases,
+order_send/modify round trips), SymbolTrader counters and position R, MT5Connector
+cache_stats, MT5 call/error counts (instrument_mt5 wraps the module functions), and the
+log / analytics queue depths.
+"""
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from latency import latency
+from save_file import log_queue_depth
+from analytics.hooks import analytics_queue_depth
+
+# نتیجه‌ی None از API متاتریدر یعنی خطا؛ order_send/order_check با retcode هم بررسی می‌شوند
+_ORDER_OK = {0, 10008, 10009}
+
+
+class _CountingCall:
+    """Wraps one MetaTrader5 function: calls / errors as plain ints."""
+
+    def __init__(self, name, fn):
+        self.name = name
+        self.fn = fn
+        self.calls = 0
+        self.errors = 0
+
+    def __call__(self, *args, **kwargs):
+        self.calls += 1
+        res = self.fn(*args, **kwargs)
+        if res is None or res is False:
+            self.errors += 1
+        elif self.name in ('order_send', 'order_check') and getattr(res, 'retcode', 0) not in _ORDER_OK:
+            self.errors += 1
+        return res
+
+
+MT5_FUNCTIONS = (
+    'copy_rates_from_pos', 'copy_rates_from', 'copy_rates_range', 'symbol_info', 'symbol_info_tick',
+    'symbol_select', 'account_info', 'terminal_info', 'positions_get', 'order_send', 'order_check',
+)
+mt5_calls = {}  # name -> _CountingCall
+
+
+def instrument_mt5(module):
+    """Replace the module's functions with counting wrappers (idempotent)."""
+    for name in MT5_FUNCTIONS:
+        fn = getattr(module, name, None)
+        if fn is None or isinstance(fn, _CountingCall):
+            continue
+        wrapper = mt5_calls[name] = _CountingCall(name, fn)
+        setattr(module, name, wrapper)
+
+
+def _label(v):
+    return str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', ' ')
+
+
+class _Writer:
+    """Collects samples grouped per metric family (the text format wants each family contiguous)."""
+
+    def __init__(self):
+        self.families = {}  # name -> (kind, help, [lines])
+
+    def metric(self, name, kind, help_text, value, family=None, **labels):
+        """family: parent summary name for its _sum / _count samples."""
+        fam = self.families.get(family or name)
+        if fam is None:
+            fam = self.families[family or name] = (kind, help_text, [])
+        if labels:
+            lab = ','.join(f'{k}="{_label(v)}"' for k, v in labels.items())
+            fam[2].append(f"{name}{{{lab}}} {float(value):.10g}")
+        else:
+            fam[2].append(f"{name} {float(value):.10g}")
+
+    def text(self):
+        out = []
+        for name, (kind, help_text, lines) in self.families.items():
+            out.append(f"# HELP {name} {help_text}")
+            out.append(f"# TYPE {name} {kind}")
+            out.extend(lines)
+        return '\n'.join(out) + '\n'
+
+
+def render(engine=None, connector=None):
+    w = _Writer()
+
+    # ---------- Latency (cycle phases, order round trips) ----------
+    for phase, h in latency.items():
+        if not h.count:
+            continue
+        for q in (0.5, 0.9, 0.99):
+            w.metric('bot_latency_seconds', 'summary', 'Latency per loop phase', h.percentile(q * 100) / 1e6,
+                     phase=phase, quantile=q)
+        w.metric('bot_latency_seconds_count', 'summary', '', h.count, family='bot_latency_seconds', phase=phase)
+        w.metric('bot_latency_seconds_sum', 'summary', '', h.total_us / 1e6, family='bot_latency_seconds', phase=phase)
+        w.metric('bot_latency_max_seconds', 'gauge', 'Slowest span per phase', h.max_seen_us / 1e6, phase=phase)
+
+    # ---------- Engine / per symbol ----------
+    if engine is not None:
+        w.metric('bot_loop_errors_total', 'counter', 'Exceptions caught by the main loop', engine.loop_errors)
+        connector = connector or engine.conn
+        for symbol, trader in list(engine.traders.items()):
+            w.metric('bot_bars_processed_total', 'counter', 'Bars processed', trader.bars_processed, symbol=symbol)
+            w.metric('bot_leg_threshold', 'gauge', 'Leg threshold in use (get_legs units, price * 10000)', trader.leg_tracker.threshold,
+                     symbol=symbol)
+            ind = trader.leg_tracker.indicators
+            if ind is not None:
+                snap = ind.snapshot()
+                w.metric('bot_atr_pips', 'gauge', 'Rolling ATR of closed bars (pips)', snap['atr'], symbol=symbol)
+                w.metric('bot_range_pips', 'gauge', 'Highest high - lowest low of the range window (pips)',
+                         snap['range'], symbol=symbol)
+            tickets = trader.open_tickets
+            w.metric('bot_open_positions', 'gauge', 'Open positions at the last manage cycle', len(tickets),
+                     symbol=symbol)
+            for ticket in tickets:
+                st = trader.position_states.get(ticket)
+                if not st or 'profit_R' not in st:
+                    continue
+                w.metric('bot_position_profit_r', 'gauge', 'Current profit of an open position in R',
+                         st['profit_R'], symbol=symbol, ticket=ticket, direction=st['direction'])
+                w.metric('bot_position_stages', 'gauge', 'Dynamic risk stages applied',
+                         len(st['done_stages']), symbol=symbol, ticket=ticket)
+
+    # ---------- MT5 ----------
+    if connector is not None:
+        for kind, st in list(connector.cache_stats.items()):
+            hits, misses = st['hits'], st['misses']
+            w.metric('bot_info_cache_hits_total', 'counter', 'MT5 info cache hits', hits, cache=kind)
+            w.metric('bot_info_cache_misses_total', 'counter', 'MT5 info cache misses', misses, cache=kind)
+            w.metric('bot_info_cache_hit_ratio', 'gauge', 'MT5 info cache hit ratio',
+                     hits / (hits + misses) if hits + misses else 0.0, cache=kind)
+    for name, c in list(mt5_calls.items()):
+        w.metric('bot_mt5_calls_total', 'counter', 'MetaTrader5 API calls', c.calls, function=name)
+        w.metric('bot_mt5_errors_total', 'counter', 'MetaTrader5 API calls that failed', c.errors, function=name)
+
+    # ---------- Queues ----------
+    w.metric('bot_log_queue_depth', 'gauge', 'Log lines waiting for the writer thread', log_queue_depth())
+    w.metric('bot_analytics_queue_depth', 'gauge', 'Analytics rows/ticks not yet on disk', analytics_queue_depth())
+    return w.text()
+
+
+class MetricsServer:
+    def __init__(self, engine=None, host='127.0.0.1', port=9108, connector=None):
+        self.engine = engine
+        self.connector = connector
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/metrics', '/'):
+                    self.send_error(404)
+                    return
+                try:
+                    body = render(server.engine, server.connector).encode('utf-8')
+                except Exception as e:
+                    self.send_error(500, str(e))
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # هر scrape در کنسول چاپ نشود
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def address(self):
+        return self.httpd.server_address
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name='metrics-http', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def start_metrics_server(engine=None, cfg=None, connector=None):
+    """Start the endpoint when cfg['enable'] (default METRICS_CONFIG); returns the server or None."""
+    if cfg is None:
+        from metatrader5_config import METRICS_CONFIG
+        cfg = METRICS_CONFIG
+    if not cfg.get('enable'):
+        return None
+    if cfg.get('count_mt5_calls', True):
+        import MetaTrader5
+        instrument_mt5(MetaTrader5)
+    try:
+        server = MetricsServer(engine, cfg.get('host', '127.0.0.1'), cfg.get('port', 9108), connector).start()
+    except OSError as e:
+        print(f"[metrics] could not bind {cfg.get('host')}:{cfg.get('port')}: {e}")
+        return None
+    print(f"📈 Metrics on http://{server.address[0]}:{server.address[1]}/metrics")
+    return server
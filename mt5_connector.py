@@ -1,16 +1,27 @@
+import copy
+from types import SimpleNamespace
 import MetaTrader5 as mt5
 import pandas as pd
 import pytz
+import time as _time
 from datetime import datetime, time
-from metatrader5_config import MT5_CONFIG
+from metatrader5_config import MT5_CONFIG, BAR_CACHE_CONFIG
+from bar_buffer import BarRingBuffer
+from bar_cache import BarCache, timeframe_name
 from analytics.hooks import log_market, log_trade, log_position_event
 
 RET_OK = 10009  # mt5.TRADE_RETCODE_DONE
+# ردهایی که به type_filling مربوط‌اند؛ فقط در این حالت مد دیگری امتحان می‌شود
+# 10030 = TRADE_RETCODE_INVALID_FILL, 10013 = TRADE_RETCODE_INVALID (برخی بروکرها)
+FILLING_RETRY_RETCODES = (10030, 10013)
+# فیلدهای ثابت symbol_info که برای کل session کش می‌شوند (tick_value / bid / ask نه)
+SYMBOL_SPEC_FIELDS = ('point', 'digits', 'volume_min', 'volume_max', 'volume_step', 'trade_stops_level',
+                      'filling_mode', 'trade_tick_size', 'trade_contract_size')
 
 class MT5Connector:
-    def __init__(self):
+    def __init__(self, symbol=None):
         cfg = MT5_CONFIG
-        self.symbol = cfg['symbol']
+        self.symbol = symbol or cfg['symbol']
         self.lot = cfg['lot_size']
         self.deviation = cfg['deviation']
         self.magic = cfg['magic_number']
@@ -21,6 +32,75 @@ class MT5Connector:
         # self.commission_per_lot_side = cfg.get('commission_per_lot_side', 0.0)  # removed
         self.iran_tz = pytz.timezone('Asia/Tehran')
         self.utc_tz = pytz.UTC
+        # timeframe -> BarRingBuffer ؛ فقط کندل‌های جدید از MT5 گرفته می‌شوند
+        self._bar_buffers = {}
+        # کش کندل روی دیسک برای پر کردن اولیه‌ی buffer (None = همیشه از MT5)
+        self.bar_cache_root = BAR_CACHE_CONFIG['root'] if BAR_CACHE_CONFIG.get('warm_start') else None
+        # کش اطلاعات MT5 با TTL جداگانه (None = کل session). symbol_specs فقط فیلدهای ثابت
+        # نماد است؛ symbol_info کامل (trade_tick_value، bid/ask) فقط کوتاه‌مدت کش می‌شود
+        self.info_ttl = {'symbol_specs': None, 'symbol_info': 1.0, 'account_info': 1.0, 'terminal_info': 2.0}
+        self.info_ttl.update(cfg.get('info_cache_ttl', {}))
+        self._info_cache = {}  # (kind, symbol) -> (expires_at, value)
+        self.cache_stats = {kind: {'hits': 0, 'misses': 0} for kind in self.info_ttl}
+        # (symbol, action) -> type_filling موفق قبلی ('auto' = بدون type_filling)
+        self._filling_cache = {}
+
+    def for_symbol(self, symbol):
+        """
+        Connector for another symbol on the same MT5 session. Info cache, its stats and the
+        learned filling modes are shared (their keys include the symbol); bar buffers are not.
+        """
+        if symbol == self.symbol:
+            return self
+        conn = copy.copy(self)
+        conn.symbol = symbol
+        conn._bar_buffers = {}
+        return conn
+
+    # ---------- Cached metadata ----------
+    def _cached_info(self, kind, fetch, symbol=None, fresh=False):
+        key = (kind, symbol)
+        now = _time.monotonic()
+        entry = self._info_cache.get(key)
+        stats = self.cache_stats[kind]
+        if not fresh and entry is not None and (entry[0] is None or now < entry[0]):
+            stats['hits'] += 1
+            return entry[1]
+        stats['misses'] += 1
+        value = fetch()
+        if value is not None:
+            ttl = self.info_ttl.get(kind)
+            self._info_cache[key] = (None if ttl is None else now + ttl, value)
+        return value
+
+    def symbol_info(self, symbol=None, fresh=False):
+        """Full SymbolInfo (short TTL); fresh=True skips the cache (tick value for sizing / commission R)."""
+        symbol = symbol or self.symbol
+        return self._cached_info('symbol_info', lambda: mt5.symbol_info(symbol), symbol, fresh)
+
+    def symbol_specs(self, symbol=None):
+        """Static contract specs of the symbol (SYMBOL_SPEC_FIELDS), cached for the session."""
+        symbol = symbol or self.symbol
+
+        def fetch():
+            info = mt5.symbol_info(symbol)
+            if info is None:
+                return None
+            return SimpleNamespace(**{f: getattr(info, f, None) for f in SYMBOL_SPEC_FIELDS})
+
+        return self._cached_info('symbol_specs', fetch, symbol)
+
+    def account_info(self):
+        return self._cached_info('account_info', mt5.account_info)
+
+    def terminal_info(self):
+        return self._cached_info('terminal_info', mt5.terminal_info)
+
+    def invalidate_info(self, *kinds):
+        """Drop cached entries of the given kinds (all if none given)."""
+        kinds = kinds or tuple(self.info_ttl)
+        for key in [k for k in self._info_cache if k[0] in kinds]:
+            del self._info_cache[key]
 
     # ---------- Time / Session ----------
     def get_iran_time(self):
@@ -45,12 +125,12 @@ class MT5Connector:
             return False, "Weekend - trading disabled"
         if not self.is_trading_time():
             return False, "Outside configured trading hours"
-        ti = mt5.terminal_info()
+        ti = self.terminal_info()
         if not ti:
             return False, "Terminal info unavailable"
         if not ti.trade_allowed:
             return False, "Terminal AutoTrading disabled"
-        acc = mt5.account_info()
+        acc = self.account_info()
         if not acc:
             return False, "Account info unavailable"
         if acc.balance < self.min_balance:
@@ -79,10 +159,11 @@ class MT5Connector:
             return None
         # try logging market tick
         try:
-            info = mt5.symbol_info(self.symbol)
+            info = self.symbol_specs()
             if info:
                 log_market(self.symbol, getattr(tick, "bid", None), getattr(tick, "ask", None),
-                           getattr(tick, "last", None), info.point, info.digits, source="mt5", session="bot")
+                           getattr(tick, "last", None), info.point, info.digits, source="mt5", session="bot",
+                           time_msc=getattr(tick, "time_msc", None) or None)
         except Exception:
             pass
         spread = (tick.ask - tick.bid) * 10000
@@ -98,9 +179,57 @@ class MT5Connector:
         }
 
     def get_historical_data(self, timeframe=mt5.TIMEFRAME_M1, count=500):
-        rates = mt5.copy_rates_from_pos(self.symbol, timeframe, 0, count)
+        rates = self.get_bars(timeframe, count)
         if rates is None:
             return None
+        return self.bars_to_frame(rates)
+
+    def get_bars(self, timeframe=mt5.TIMEFRAME_M1, count=500):
+        """
+        Newest ``count`` bars as a zero-copy structured numpy view of the ring buffer.
+        After the first call (or a warm start from the bar cache) only the bars from the
+        last stored one onward are fetched.
+        """
+        buf = self._bar_buffers.get(timeframe)
+        if buf is None or buf.capacity < count:
+            buf = self._bar_buffers[timeframe] = BarRingBuffer(count)
+        if len(buf) == 0:
+            cached = self._cached_bars(timeframe, count)
+            if cached is None:
+                rates = mt5.copy_rates_from_pos(self.symbol, timeframe, 0, count)
+                if rates is None:
+                    return None
+                buf.extend(rates)
+                return buf.view(count)
+            buf.extend(cached)
+
+        # delta: کندل در حال تشکیل قبلی + کندل‌های جدید؛ در صورت gap تعداد را بیشتر کن
+        n = 2
+        while True:
+            rates = mt5.copy_rates_from_pos(self.symbol, timeframe, 0, n)
+            if rates is None:
+                return None
+            if buf.merge(rates):
+                break
+            if n >= count:
+                buf.clear()
+                buf.extend(rates)
+                break
+            n = min(n * 4, count)
+        return buf.view(count)
+
+    def _cached_bars(self, timeframe, count):
+        """Newest count bars from the local bar cache, or None."""
+        name = timeframe_name(mt5, timeframe) if self.bar_cache_root else None
+        if name is None:
+            return None
+        try:
+            rates = BarCache(self.bar_cache_root, self.symbol, name).tail(count)
+        except (OSError, ValueError):
+            return None
+        return rates if rates is not None and len(rates) else None
+
+    def bars_to_frame(self, rates):
         df = pd.DataFrame(rates)
         df['time'] = pd.to_datetime(df['time'], unit='s', utc=True).dt.tz_convert(self.iran_tz)
         df.set_index('time', inplace=True)
@@ -108,9 +237,16 @@ class MT5Connector:
         df['timestamp'] = df.index
         return df
 
+    def get_last_bar_time(self, timeframe=mt5.TIMEFRAME_M1):
+        """Cheap probe: open time (epoch seconds) of the newest bar, without building a DataFrame."""
+        rates = mt5.copy_rates_from_pos(self.symbol, timeframe, 0, 1)
+        if rates is None or len(rates) == 0:
+            return None
+        return int(rates[0]['time'])
+
     # ---------- Broker capability helpers ----------
     def test_filling_modes(self):
-        info = mt5.symbol_info(self.symbol)
+        info = self.symbol_specs()
         if not info:
             print("Symbol info not available")
             return None
@@ -118,7 +254,7 @@ class MT5Connector:
         return info.filling_mode
 
     def get_supported_filling_modes(self):
-        info = mt5.symbol_info(self.symbol)
+        info = self.symbol_specs()
         if not info:
             return []
         fm = getattr(info, 'filling_mode', 0)
@@ -134,41 +270,6 @@ class MT5Connector:
                     modes.append(m)
         return modes
 
-    def try_all_filling_modes(self, request):
-        tried = []
-        modes = self.get_supported_filling_modes()
-
-        # 1) اول مدهای اعلام‌شده‌ی بروکر
-        for m in modes:
-            req = dict(request)
-            req["type_filling"] = m
-            res = mt5.order_send(req)
-            tried.append((m, getattr(res, 'retcode', None)))
-            if res and res.retcode in (RET_OK, mt5.TRADE_RETCODE_PLACED):
-                return res
-
-        # 2) یک بار بدون type_filling (auto)
-        req = dict(request)
-        req.pop("type_filling", None)
-        res = mt5.order_send(req)
-        tried.append(("auto", getattr(res, 'retcode', None)))
-        if res and res.retcode in (RET_OK, mt5.TRADE_RETCODE_PLACED):
-            return res
-
-        # 3) در نهایت brute-force برای حالتی که flags نادرست گزارش شده
-        for m in (mt5.ORDER_FILLING_IOC, mt5.ORDER_FILLING_FOK, mt5.ORDER_FILLING_RETURN):
-            if m in modes:
-                continue
-            req = dict(request)
-            req["type_filling"] = m
-            res = mt5.order_send(req)
-            tried.append((m, getattr(res, 'retcode', None)))
-            if res and res.retcode in (RET_OK, mt5.TRADE_RETCODE_PLACED):
-                return res
-
-        print(f"[order_send] filling mode attempts: {tried}")
-        return res  # آخرین نتیجه
-
     # ---------- Stop validation ----------
     def calculate_valid_stops(self, entry_price, sl_price, tp_price, order_type):
         """
@@ -177,7 +278,7 @@ class MT5Connector:
         - 1 pip = 10 * point برای نمادهای 5 یا 3 رقمی، در غیر این صورت = point
         - هیچ تغییری روی SL/TP اعمال نمی‌شود؛ فقط در صورت نامعتبر بودن None برمی‌گرداند.
         """
-        info = mt5.symbol_info(self.symbol)
+        info = self.symbol_specs()
         if not info:
             print("Symbol info unavailable")
             return None, None
@@ -212,41 +313,79 @@ class MT5Connector:
         return norm(sl_price), norm(tp_price)
 
     # ---------- Order sending core ----------
+    def _filling_candidates(self):
+        modes = self.get_supported_filling_modes()
+        # 1) اول مدهای اعلام‌شده‌ی بروکر  2) یک بار بدون type_filling (auto)
+        # 3) در نهایت brute-force برای حالتی که flags نادرست گزارش شده
+        rest = [m for m in (mt5.ORDER_FILLING_IOC, mt5.ORDER_FILLING_FOK, mt5.ORDER_FILLING_RETURN) if m not in modes]
+        return modes + ["auto"] + rest
+
+    @staticmethod
+    def _with_filling(request, mode):
+        req = dict(request)
+        if mode == "auto":
+            req.pop("type_filling", None)
+        else:
+            req["type_filling"] = mode
+        return req
+
     def try_all_filling_modes(self, request):
+        key = (request.get("symbol", self.symbol), request.get("action"))
         tried = []
-        modes = self.get_supported_filling_modes()
+        res = None
+        cached = self._filling_cache.get(key)
 
-        # 1) اول مدهای اعلام‌شده‌ی بروکر
-        for m in modes:
-            req = dict(request)
-            req["type_filling"] = m
-            res = mt5.order_send(req)
-            tried.append((m, getattr(res, 'retcode', None)))
+        # مد موفق قبلی: معمولا یک round-trip کافی است
+        if cached is not None:
+            res = mt5.order_send(self._with_filling(request, cached))
+            tried.append((cached, getattr(res, 'retcode', None)))
             if res and res.retcode in (RET_OK, mt5.TRADE_RETCODE_PLACED):
                 return res
+            if res is not None and res.retcode not in FILLING_RETRY_RETCODES:
+                return res  # رد به دلیل دیگری است؛ تعویض مد کمکی نمی‌کند
+            del self._filling_cache[key]
 
-        # 2) یک بار بدون type_filling (auto)
-        req = dict(request)
-        req.pop("type_filling", None)
-        res = mt5.order_send(req)
-        tried.append(("auto", getattr(res, 'retcode', None)))
-        if res and res.retcode in (RET_OK, mt5.TRADE_RETCODE_PLACED):
-            return res
-
-        # 3) در نهایت brute-force برای حالتی که flags نادرست گزارش شده
-        for m in (mt5.ORDER_FILLING_IOC, mt5.ORDER_FILLING_FOK, mt5.ORDER_FILLING_RETURN):
-            if m in modes:
+        for m in self._filling_candidates():
+            if m == cached:
                 continue
-            req = dict(request)
-            req["type_filling"] = m
-            res = mt5.order_send(req)
+            res = mt5.order_send(self._with_filling(request, m))
             tried.append((m, getattr(res, 'retcode', None)))
             if res and res.retcode in (RET_OK, mt5.TRADE_RETCODE_PLACED):
+                self._filling_cache[key] = m
                 return res
+            if res is not None and res.retcode not in FILLING_RETRY_RETCODES:
+                break
 
         print(f"[order_send] filling mode attempts: {tried}")
         return res  # آخرین نتیجه
 
+    def probe_filling_modes(self, action=None):
+        """
+        Learn a working type_filling once at startup with mt5.order_check (nothing is
+        executed), so the first real order needs a single order_send.
+        """
+        action = mt5.TRADE_ACTION_DEAL if action is None else action
+        tick = mt5.symbol_info_tick(self.symbol)
+        info = self.symbol_specs()
+        if not tick or not info:
+            return None
+        request = {
+            "action": action,
+            "symbol": self.symbol,
+            "volume": info.volume_min or self.lot,
+            "type": mt5.ORDER_TYPE_BUY,
+            "price": tick.ask,
+            "deviation": self.deviation,
+            "magic": self.magic,
+            "type_time": mt5.ORDER_TIME_GTC,
+        }
+        for m in self._filling_candidates():
+            res = mt5.order_check(self._with_filling(request, m))
+            if res is not None and res.retcode == 0:
+                self._filling_cache[(self.symbol, action)] = m
+                return m
+        return None
+
     # ---------- Trading ----------
     def open_buy_position(self, tick, sl, tp, comment="", volume=None, risk_pct=None):
         if not tick:
@@ -272,6 +411,7 @@ class MT5Connector:
         }
         print(f"📤 BUY {self.symbol} @ {entry} VOL={vol} SL={sl_adj} TP={tp_adj}")
         result = self.try_all_filling_modes(request)
+        self.invalidate_info('account_info')
         try:
             log_trade(self.symbol, "BUY", request, result, reason="strategy_signal")
             if result and getattr(result, 'retcode', None) == RET_OK:
@@ -320,6 +460,7 @@ class MT5Connector:
         }
         print(f"📤 SELL {self.symbol} @ {entry} VOL={vol} SL={sl_adj} TP={tp_adj}")
         result = self.try_all_filling_modes(request)
+        self.invalidate_info('account_info')
         try:
             log_trade(self.symbol, "SELL", request, result, reason="strategy_signal")
             if result and getattr(result, 'retcode', None) == RET_OK:
@@ -371,6 +512,7 @@ class MT5Connector:
                 "type_filling": mt5.ORDER_FILLING_IOC,
             }
             mt5.order_send(request)
+        self.invalidate_info('account_info')
 
     def get_positions(self):
         return mt5.positions_get(symbol=self.symbol)
@@ -386,16 +528,17 @@ class MT5Connector:
         return True
 
     def check_symbol_properties(self):
-        info = mt5.symbol_info(self.symbol)
+        info = self.symbol_info()
         if not info:
             print("Symbol info not found")
             return
         if not info.visible:
             mt5.symbol_select(self.symbol, True)
+            self.invalidate_info('symbol_info', 'symbol_specs')
 
     # ---------- Volume helpers ----------
     def _normalize_volume(self, vol: float) -> float:
-        info = mt5.symbol_info(self.symbol)
+        info = self.symbol_specs()
         if not info:
             return vol
         step = info.volume_step or 0.01
@@ -424,8 +567,8 @@ class MT5Connector:
 
     def calculate_volume_by_risk(self, entry: float, sl: float, tick, risk_pct: float = 0.01) -> float:
         """Position sizing with price risk + current spread (commission removed)."""
-        acc = mt5.account_info()
-        info = mt5.symbol_info(self.symbol)
+        acc = self.account_info()
+        info = self.symbol_info(fresh=True)  # trade_tick_value با نرخ لحظه‌ای ارز عوض می‌شود
         if not acc or not info:
             return self.lot
 
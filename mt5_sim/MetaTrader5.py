@@ -0,0 +1,492 @@
+"""
+Offline stand-in for the MetaTrader5 package.
+
+Put this directory first on the import path and the bot runs unchanged against recorded
+data:
+
+    MT5SIM_BARS=bars.csv PYTHONPATH=mt5_sim python main_metatrader_new.py
+
+It implements what MT5Connector / main() call (initialize, copy_rates_*, symbol_info,
+symbol_info_tick, order_send, order_check, positions_get, account_info, terminal_info, ...)
+on top of a bar file (CSV with time, open, high, low, close[, spread]) and, optionally,
+analytics.tick_store tick files. bars may also be {symbol: bars} (per-symbol digits/point in
+`symbols`) for the multi-symbol engine. The simulated clock follows the wall clock (times `speed`)
+from the `start` bar on, so the scheduler and the real loop can be profiled end to end.
+
+Latency (seconds, per function name or '*') and order rejections (seeded, so runs are
+reproducible) can be injected with configure() or the MT5SIM_* environment variables.
+"""
+import os
+import random
+import threading
+import time as _time
+from collections import namedtuple
+
+import numpy as np
+
+# ---------- Constants (values of the real package) ----------
+TIMEFRAME_M1 = 1
+TIMEFRAME_M5 = 5
+TIMEFRAME_M15 = 15
+TIMEFRAME_H1 = 16385
+
+ORDER_TYPE_BUY = 0
+ORDER_TYPE_SELL = 1
+POSITION_TYPE_BUY = 0
+POSITION_TYPE_SELL = 1
+
+TRADE_ACTION_DEAL = 1
+TRADE_ACTION_SLTP = 6
+
+ORDER_FILLING_FOK = 0
+ORDER_FILLING_IOC = 1
+ORDER_FILLING_RETURN = 2
+ORDER_TIME_GTC = 0
+
+TRADE_RETCODE_REQUOTE = 10004
+TRADE_RETCODE_REJECT = 10006
+TRADE_RETCODE_PLACED = 10008
+TRADE_RETCODE_DONE = 10009
+TRADE_RETCODE_INVALID = 10013
+TRADE_RETCODE_INVALID_VOLUME = 10014
+TRADE_RETCODE_INVALID_STOPS = 10016
+TRADE_RETCODE_POSITION_CLOSED = 10036
+TRADE_RETCODE_INVALID_FILL = 10030
+
+RATES_DTYPE = np.dtype([('time', '<i8'), ('open', '<f8'), ('high', '<f8'), ('low', '<f8'), ('close', '<f8'),
+                        ('tick_volume', '<u8'), ('spread', '<i4'), ('real_volume', '<u8')])
+
+Tick = namedtuple('Tick', 'time bid ask last volume time_msc flags volume_real')
+SymbolInfo = namedtuple('SymbolInfo', 'name visible digits point spread trade_tick_size trade_tick_value '
+                                      'trade_contract_size trade_stops_level volume_min volume_max volume_step '
+                                      'filling_mode bid ask')
+AccountInfo = namedtuple('AccountInfo', 'login balance equity profit margin margin_free leverage currency')
+TerminalInfo = namedtuple('TerminalInfo', 'connected trade_allowed name')
+TradePosition = namedtuple('TradePosition', 'ticket time type magic volume price_open sl tp price_current '
+                                            'profit symbol comment')
+OrderSendResult = namedtuple('OrderSendResult', 'retcode deal order volume price bid ask comment request_id request')
+
+_DEFAULTS = {
+    'bars': None,              # path or structured array / DataFrame, or {symbol: bars}
+    'ticks_dir': None,         # analytics.tick_store root (optional)
+    'symbol': 'EURUSD',        # symbol of a single bar source; the clock follows this one
+    'symbols': {},             # per-symbol overrides: {'USDJPY': {'digits': 3, 'point': 0.001}}
+    'start': 200,              # index of the first "live" bar
+    'speed': 1.0,
+    'balance': 10_000.0,
+    'latency': {},             # {'order_send': 0.05, '*': 0.001}
+    'reject_rate': 0.0,        # probability that order_send is rejected
+    'reject_retcode': TRADE_RETCODE_REQUOTE,
+    'filling_modes': (ORDER_FILLING_IOC, ORDER_FILLING_FOK),  # accepted type_filling values
+    'digits': 5,
+    'point': 0.00001,
+    'contract_size': 100_000.0,
+    'spread_points': 10,
+    'seed': 0,
+}
+_SPEC_KEYS = ('digits', 'point', 'contract_size', 'spread_points')
+
+
+class _Feed:
+    """Bars (and optional ticks) of one symbol."""
+
+    def __init__(self, rates, ticks, spec):
+        self.rates = rates
+        self.times = rates['time']
+        self.ticks = ticks
+        self.spec = spec
+
+    def bar_index(self, t):
+        return int(np.searchsorted(self.times, t, side='right')) - 1
+
+    def forming_bar(self, t):
+        """Bar containing t, with OHLC built from its open up to t (interpolated)."""
+        k = self.bar_index(t)
+        bar = self.rates[k].copy()
+        frac = min(max((t - bar['time']) / 60.0, 0.0), 1.0)
+        price = bar['open'] + (bar['close'] - bar['open']) * frac
+        bar['high'] = max(bar['open'], price)
+        bar['low'] = min(bar['open'], price)
+        bar['close'] = price
+        return k, bar
+
+    def spread(self, bar):
+        return (int(bar['spread']) or self.spec['spread_points']) * self.spec['point']
+
+    def tick(self, t):
+        if self.ticks is not None and len(self.ticks['time']):
+            i = int(np.searchsorted(self.ticks['time'], int(t * 1000), side='right')) - 1
+            if i >= 0:
+                bid, ask = float(self.ticks['bid'][i]), float(self.ticks['ask'][i])
+                return Tick(int(t), bid, ask, 0.0, 0, int(self.ticks['time'][i]), 0, 0.0)
+        k, bar = self.forming_bar(t)
+        digits = self.spec['digits']
+        bid = round(float(bar['close']), digits)
+        return Tick(int(t), bid, round(bid + self.spread(bar), digits), 0.0, 0, int(t * 1000), 0, 0.0)
+
+
+class _Sim:
+    def __init__(self, **cfg):
+        self.cfg = dict(_DEFAULTS, **cfg)
+        self.lock = threading.RLock()
+        self.rng = random.Random(self.cfg['seed'])
+        bars = self.cfg['bars']
+        if not isinstance(bars, dict):
+            bars = {self.cfg['symbol']: bars}
+        elif self.cfg['symbol'] not in bars:
+            self.cfg['symbol'] = next(iter(bars))
+        self.feeds = {}
+        for symbol, src in bars.items():
+            spec = {k: self.cfg[k] for k in _SPEC_KEYS}
+            spec.update(self.cfg['symbols'].get(symbol, {}))
+            ticks = _load_ticks(self.cfg['ticks_dir'], symbol) if self.cfg['ticks_dir'] else None
+            self.feeds[symbol] = _Feed(_load_rates(src), ticks, spec)
+        main = self.feeds[self.cfg['symbol']]
+        self.rates, self.times, self.ticks = main.rates, main.times, main.ticks
+        start = min(int(self.cfg['start']), len(self.rates) - 1)
+        wall = _time.time()
+        # ساعت شبیه‌ساز با مرز دقیقه‌ی ساعت واقعی هم‌تراز است (برای BarScheduler)
+        self.sim_anchor = int(self.times[start]) + int(wall) % 60
+        self.wall_anchor = wall
+        self.balance = float(self.cfg['balance'])
+        self.positions = {}
+        self.next_ticket = 1
+        self.last_checked = self.sim_anchor
+        self.calls = {}
+        self.last_error = (1, 'Success')
+
+    # ---------- Clock / prices ----------
+    def now(self):
+        return self.sim_anchor + (_time.time() - self.wall_anchor) * self.cfg['speed']
+
+    def set_time(self, t, speed=0.0):
+        """Move the clock to epoch t; with speed 0 it stays there (benchmarks, step-by-step replay)."""
+        self.sim_anchor = t
+        self.wall_anchor = _time.time()
+        self.cfg['speed'] = speed
+
+    def feed(self, symbol=None):
+        return self.feeds.get(self.cfg['symbol'] if symbol is None else symbol)
+
+    def bar_index(self, t, symbol=None):
+        return self.feed(symbol).bar_index(t)
+
+    def forming_bar(self, t, symbol=None):
+        return self.feed(symbol).forming_bar(t)
+
+    def tick(self, t=None, symbol=None):
+        return self.feed(symbol).tick(self.now() if t is None else t)
+
+    # ---------- Positions ----------
+    def check_stops(self):
+        """Close positions whose SL/TP were hit by the bars since the last check."""
+        now = self.now()
+        for symbol in {p['symbol'] for p in self.positions.values()}:
+            feed = self.feed(symbol)
+            if feed is not None:
+                self._check_feed(symbol, feed, now)
+        self.last_checked = now
+
+    def _check_feed(self, symbol, feed, now):
+        k0, k1 = feed.bar_index(self.last_checked), feed.bar_index(now)
+        if k1 < 0:
+            return
+        for k in range(max(k0, 0), k1 + 1):
+            bar = feed.forming_bar(now)[1] if k == k1 else feed.rates[k]
+            spread = feed.spread(bar)
+            for ticket, pos in list(self.positions.items()):
+                if pos['symbol'] != symbol or pos['time'] > int(bar['time']) + 59:
+                    continue
+                if pos['type'] == POSITION_TYPE_BUY:
+                    if pos['sl'] and bar['low'] <= pos['sl']:
+                        self.close(ticket, pos['sl'])
+                    elif pos['tp'] and bar['high'] >= pos['tp']:
+                        self.close(ticket, pos['tp'])
+                else:
+                    if pos['sl'] and bar['high'] + spread >= pos['sl']:
+                        self.close(ticket, pos['sl'])
+                    elif pos['tp'] and bar['low'] + spread <= pos['tp']:
+                        self.close(ticket, pos['tp'])
+
+    def profit(self, pos, tick=None):
+        tick = tick or self.tick(symbol=pos['symbol'])
+        sign = 1 if pos['type'] == POSITION_TYPE_BUY else -1
+        price = tick.bid if pos['type'] == POSITION_TYPE_BUY else tick.ask
+        return sign * (price - pos['price_open']) * self.feed(pos['symbol']).spec['contract_size'] * pos['volume']
+
+    def close(self, ticket, price):
+        pos = self.positions.pop(ticket)
+        sign = 1 if pos['type'] == POSITION_TYPE_BUY else -1
+        self.balance += (sign * (price - pos['price_open']) * self.feed(pos['symbol']).spec['contract_size']
+                         * pos['volume'])
+
+    def delay(self, name):
+        self.calls[name] = self.calls.get(name, 0) + 1
+        lat = self.cfg['latency']
+        d = lat.get(name, lat.get('*', 0.0))
+        if d:
+            _time.sleep(d)
+
+
+_sim = None
+
+
+def _load_rates(src):
+    if src is None:
+        raise RuntimeError("MetaTrader5 simulator: no bars configured (configure(bars=...) or MT5SIM_BARS)")
+    if isinstance(src, np.ndarray):
+        return src.astype(RATES_DTYPE)
+    import pandas as pd
+    df = src if isinstance(src, pd.DataFrame) else pd.read_csv(src)
+    if 'time' not in df.columns:
+        df = df.reset_index()
+    t = df['time']
+    if pd.api.types.is_datetime64_any_dtype(t) or t.dtype == object:
+        # هر واحد زمانی (ns/us/s) و هر timezone → ثانیه‌ی epoch
+        t = (pd.to_datetime(t, utc=True) - pd.Timestamp(0, tz='UTC')) // pd.Timedelta('1s')
+    out = np.zeros(len(df), dtype=RATES_DTYPE)
+    out['time'] = t.to_numpy()
+    for name in ('open', 'high', 'low', 'close'):
+        out[name] = df[name].to_numpy()
+    if 'spread' in df.columns:
+        out['spread'] = df['spread'].to_numpy()
+    if 'tick_volume' in df.columns:
+        out['tick_volume'] = df['tick_volume'].to_numpy()
+    return out
+
+
+def _load_ticks(root, symbol):
+    from pathlib import Path
+    from analytics.tick_store import read_ticks
+    days = sorted(p.name for p in (Path(root) / symbol).iterdir() if p.is_dir())
+    parts = [read_ticks(root, symbol, d)[0] for d in days]
+    if not parts:
+        return None
+    return {name: np.concatenate([p[name] for p in parts]) for name in ('time', 'bid', 'ask')}
+
+
+def configure(**cfg):
+    """(Re)start the simulator; see _DEFAULTS for the options."""
+    global _sim
+    _sim = _Sim(**cfg)
+    return _sim
+
+
+def _env_config():
+    cfg = {}
+    if os.environ.get('MT5SIM_BARS'):
+        cfg['bars'] = os.environ['MT5SIM_BARS']
+    if os.environ.get('MT5SIM_TICKS'):
+        cfg['ticks_dir'] = os.environ['MT5SIM_TICKS']
+    for key, cast in (('symbol', str), ('start', int), ('speed', float), ('balance', float),
+                      ('reject_rate', float), ('seed', int)):
+        v = os.environ.get(f'MT5SIM_{key.upper()}')
+        if v:
+            cfg[key] = cast(v)
+    if os.environ.get('MT5SIM_LATENCY_MS'):
+        cfg['latency'] = {'*': float(os.environ['MT5SIM_LATENCY_MS']) / 1000.0}
+    return cfg
+
+
+def _require():
+    if _sim is None:
+        configure(**_env_config())
+    return _sim
+
+
+def simulator():
+    """The running simulator (call counts in .calls, positions, balance)."""
+    return _require()
+
+
+# ---------- Terminal ----------
+def initialize(*args, **kwargs):
+    try:
+        _require().delay('initialize')
+    except Exception as e:
+        print(f"[mt5_sim] {e}")
+        return False
+    return True
+
+
+def shutdown():
+    return True
+
+
+def last_error():
+    return _sim.last_error if _sim else (-1, 'Not initialized')
+
+
+def terminal_info():
+    s = _require()
+    s.delay('terminal_info')
+    return TerminalInfo(True, True, 'mt5_sim')
+
+
+def account_info():
+    s = _require()
+    s.delay('account_info')
+    with s.lock:
+        s.check_stops()
+        profit = sum(s.profit(p) for p in s.positions.values())
+        equity = s.balance + profit
+        return AccountInfo(1, s.balance, equity, profit, 0.0, equity, 100, 'USD')
+
+
+def symbol_info(symbol):
+    s = _require()
+    s.delay('symbol_info')
+    feed = s.feeds.get(symbol)
+    if feed is None:
+        return None
+    tick = s.tick(symbol=symbol)
+    mask = 0
+    for m in s.cfg['filling_modes']:
+        mask |= {ORDER_FILLING_FOK: 1, ORDER_FILLING_IOC: 2}.get(m, 0)
+    spec = feed.spec
+    return SymbolInfo(symbol, True, spec['digits'], spec['point'], spec['spread_points'], spec['point'],
+                      spec['contract_size'] * spec['point'], spec['contract_size'], 0, 0.01, 100.0, 0.01,
+                      mask, tick.bid, tick.ask)
+
+
+def symbol_select(symbol, enable=True):
+    return symbol in _require().feeds
+
+
+def symbol_info_tick(symbol):
+    s = _require()
+    s.delay('symbol_info_tick')
+    if symbol not in s.feeds:
+        return None
+    return s.tick(symbol=symbol)
+
+
+# ---------- Rates ----------
+def copy_rates_from_pos(symbol, timeframe, start_pos, count):
+    s = _require()
+    s.delay('copy_rates_from_pos')
+    feed = s.feeds.get(symbol)
+    if feed is None or timeframe != TIMEFRAME_M1:
+        return None
+    k, forming = feed.forming_bar(s.now())
+    end = k - start_pos + 1
+    if end <= 0:
+        return np.empty(0, dtype=RATES_DTYPE)
+    out = feed.rates[max(0, end - count):end].copy()
+    if start_pos == 0 and len(out):
+        out[-1] = forming
+    return out
+
+
+def copy_rates_from(symbol, timeframe, date_from, count):
+    s = _require()
+    s.delay('copy_rates_from')
+    feed = s.feeds.get(symbol)
+    if feed is None or timeframe != TIMEFRAME_M1:
+        return None
+    t = date_from.timestamp() if hasattr(date_from, 'timestamp') else float(date_from)
+    end = feed.bar_index(min(t, s.now())) + 1
+    return feed.rates[max(0, end - count):end].copy()
+
+
+def copy_rates_range(symbol, timeframe, date_from, date_to):
+    s = _require()
+    s.delay('copy_rates_range')
+    feed = s.feeds.get(symbol)
+    if feed is None or timeframe != TIMEFRAME_M1:
+        return None
+    t0 = date_from.timestamp() if hasattr(date_from, 'timestamp') else float(date_from)
+    t1 = date_to.timestamp() if hasattr(date_to, 'timestamp') else float(date_to)
+    t1 = min(t1, s.now() - 60)  # فقط کندل‌های بسته‌شده
+    i0 = int(np.searchsorted(feed.times, t0, side='left'))
+    i1 = int(np.searchsorted(feed.times, t1, side='right'))
+    return feed.rates[i0:i1].copy()
+
+
+# ---------- Trading ----------
+def positions_get(symbol=None, ticket=None):
+    s = _require()
+    s.delay('positions_get')
+    with s.lock:
+        s.check_stops()
+        out = []
+        for t, p in s.positions.items():
+            if (symbol and p['symbol'] != symbol) or (ticket and t != ticket):
+                continue
+            tick = s.tick(symbol=p['symbol'])
+            price = tick.bid if p['type'] == POSITION_TYPE_BUY else tick.ask
+            out.append(TradePosition(t, p['time'], p['type'], p['magic'], p['volume'], p['price_open'],
+                                     p['sl'], p['tp'], price, s.profit(p, tick), p['symbol'], p['comment']))
+        return tuple(out)
+
+
+def order_check(request):
+    s = _require()
+    s.delay('order_check')
+    fill = request.get('type_filling')
+    if fill is not None and fill not in s.cfg['filling_modes']:
+        return _result(TRADE_RETCODE_INVALID_FILL, request, comment='Unsupported filling mode')
+    return _result(0, request, comment='Done')
+
+
+def order_send(request):
+    s = _require()
+    s.delay('order_send')
+    with s.lock:
+        s.check_stops()
+        action = request.get('action')
+        if action == TRADE_ACTION_SLTP:
+            pos = s.positions.get(request.get('position'))
+            if pos is None:
+                return _result(TRADE_RETCODE_POSITION_CLOSED, request)
+            tick = s.tick(symbol=pos['symbol'])
+            sl, tp = request.get('sl', pos['sl']), request.get('tp', pos['tp'])
+            price = tick.bid if pos['type'] == POSITION_TYPE_BUY else tick.ask
+            if sl and ((pos['type'] == POSITION_TYPE_BUY and sl >= price) or
+                       (pos['type'] == POSITION_TYPE_SELL and sl <= price)):
+                return _result(TRADE_RETCODE_INVALID_STOPS, request, tick=tick, comment='Invalid stops')
+            pos['sl'], pos['tp'] = sl, tp
+            return _result(TRADE_RETCODE_DONE, request, tick=tick, order=request.get('position'))
+
+        closing = s.positions.get(request.get('position'))
+        symbol = closing['symbol'] if closing else request.get('symbol', s.cfg['symbol'])
+        if action != TRADE_ACTION_DEAL or symbol not in s.feeds:
+            return _result(TRADE_RETCODE_INVALID, request)
+        tick = s.tick(symbol=symbol)
+        fill = request.get('type_filling')
+        if fill is not None and fill not in s.cfg['filling_modes']:
+            return _result(TRADE_RETCODE_INVALID_FILL, request, tick=tick, comment='Unsupported filling mode')
+        if s.cfg['reject_rate'] and s.rng.random() < s.cfg['reject_rate']:
+            return _result(s.cfg['reject_retcode'], request, tick=tick, comment='Injected rejection')
+        volume = float(request.get('volume') or 0)
+        if volume <= 0:
+            return _result(TRADE_RETCODE_INVALID_VOLUME, request, tick=tick)
+        is_buy = request.get('type') == ORDER_TYPE_BUY
+        price = tick.ask if is_buy else tick.bid
+
+        if request.get('position'):
+            ticket = request['position']
+            if ticket not in s.positions:
+                return _result(TRADE_RETCODE_POSITION_CLOSED, request, tick=tick)
+            s.close(ticket, price)
+            return _result(TRADE_RETCODE_DONE, request, tick=tick, order=ticket, volume=volume, price=price)
+
+        ticket = s.next_ticket
+        s.next_ticket += 1
+        s.positions[ticket] = {
+            'symbol': symbol,
+            'type': POSITION_TYPE_BUY if is_buy else POSITION_TYPE_SELL,
+            'time': int(s.now()),
+            'volume': volume,
+            'price_open': price,
+            'sl': request.get('sl') or 0.0,
+            'tp': request.get('tp') or 0.0,
+            'magic': request.get('magic', 0),
+            'comment': request.get('comment', ''),
+        }
+        return _result(TRADE_RETCODE_DONE, request, tick=tick, order=ticket, volume=volume, price=price)
+
+
+def _result(retcode, request, tick=None, order=0, volume=0.0, price=0.0, comment=''):
+    return OrderSendResult(retcode, order, order, volume, price, getattr(tick, 'bid', 0.0),
+                           getattr(tick, 'ask', 0.0), comment, 0, request)
@@ -0,0 +1,178 @@
+"""
+Position management on its own thread, driven by tick changes.
+
+    manager = PositionManager.from_config(engine, POSITION_MANAGER_CONFIG).start()
+    ...
+    manager.stop()
+
+Every tick_interval seconds (tens of ms are fine) the thread reads symbol_info_tick for
+each symbol with an open position; when time_msc / bid / ask changed it re-reads that
+symbol's positions and runs SymbolTrader.manage_cycle with the tick. R-stage SL locks so
+no longer wait behind strategy processing, logging or an order_send in the bar loop.
+A full positions_get() for all symbols every positions_interval (and right after an
+order, via wake()) picks up new and closed positions.
+
+Stage modifies go through a ModifyPool (modify_workers threads, one modify in flight per
+ticket), so one slow modify does not hold back the other positions or the next tick.
+
+tick_to_modify (latency.py): from the moment a changed tick was read until modify_sl_tp
+returned. Position state is guarded by SymbolTrader.positions_lock. MetaTrader5 is one
+IPC session, so by default (serialize_mt5) its functions go through one lock and each
+thread waits at most for the call another one has in flight; the modifies then reach the
+terminal one at a time and the pool only keeps them off the manager thread.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import MetaTrader5 as mt5
+
+from latency import latency
+from save_file import ContextLogger
+
+mt5_lock = threading.RLock()
+
+
+class _LockedCall:
+    """Wraps one MetaTrader5 function so only one thread talks to the terminal at a time."""
+
+    def __init__(self, fn, lock):
+        self.fn = fn
+        self.lock = lock
+
+    def __call__(self, *args, **kwargs):
+        with self.lock:
+            return self.fn(*args, **kwargs)
+
+
+def serialize_mt5(module, lock=mt5_lock):
+    """Route every public function of the module through lock (idempotent)."""
+    for name in dir(module):
+        if name.startswith('_'):
+            continue
+        fn = getattr(module, name)
+        if isinstance(fn, (_LockedCall, type)) or not callable(fn):
+            continue
+        setattr(module, name, _LockedCall(fn, lock))
+
+
+class ModifyPool:
+    """SL/TP modifies on a small thread pool; at most one in flight per ticket."""
+
+    def __init__(self, workers=4, log=None):
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='modify')
+        self._inflight = set()
+        self._lock = threading.Lock()
+        self.log = log
+
+    def busy(self, ticket):
+        return ticket in self._inflight
+
+    def submit(self, ticket, fn, *args):
+        """Run fn(*args) on the pool; returns None (not queued) while ticket has one in flight."""
+        with self._lock:
+            if ticket in self._inflight:
+                return None
+            self._inflight.add(ticket)
+        try:
+            future = self._pool.submit(fn, *args)
+        except RuntimeError:  # pool بسته شده
+            self._inflight.discard(ticket)
+            return None
+        future.add_done_callback(lambda f: self._done(ticket, f))
+        return future
+
+    def _done(self, ticket, future):
+        with self._lock:
+            self._inflight.discard(ticket)
+        e = future.exception()
+        if e is not None and self.log is not None:
+            self.log(f"❌ Modify for ticket {ticket} failed: {e}", color='red')
+
+    def shutdown(self, wait=True):
+        self._pool.shutdown(wait=wait)
+
+
+class PositionManager:
+    def __init__(self, engine, tick_interval=0.05, positions_interval=0.5, serialize=True):
+        self.engine = engine
+        self.tick_interval = tick_interval
+        self.positions_interval = positions_interval
+        self.serialize = serialize
+        self.last_ticks = {}  # symbol -> (time_msc, bid, ask)
+        self.errors = 0
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+        self.log = ContextLogger(__file__, 'PositionManager')
+
+    @classmethod
+    def from_config(cls, engine, cfg):
+        return cls(
+            engine,
+            tick_interval=cfg.get('tick_interval', 0.05),
+            positions_interval=cfg.get('positions_interval', 0.5),
+            serialize=cfg.get('serialize_mt5', True),
+        )
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.serialize:
+            serialize_mt5(mt5)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='position-manager', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._thread = None
+
+    def wake(self):
+        """Re-read all positions on the next pass (e.g. right after an order)."""
+        self._wake.set()
+
+    # ---------- Passes ----------
+    def sync(self):
+        """positions_get() for every symbol: registers new tickets, notices closed ones."""
+        self.engine.manage_positions()
+
+    def poll_ticks(self):
+        """Manage the symbols whose tick changed since the last pass."""
+        for symbol, trader in self.engine.traders.items():
+            if not trader.open_tickets:
+                continue
+            tick = mt5.symbol_info_tick(symbol)
+            seen = time.perf_counter()
+            if not tick:
+                continue
+            key = (tick.time_msc, tick.bid, tick.ask)
+            if self.last_ticks.get(symbol) == key:
+                continue
+            self.last_ticks[symbol] = key
+            with latency.span('tick_manage'):
+                trader.manage_cycle(tick=tick, tick_seen=seen)
+
+    def _run(self):
+        next_sync = 0.0
+        while not self._stop.is_set():
+            t0 = time.monotonic()
+            try:
+                if self._wake.is_set() or t0 >= next_sync:
+                    self._wake.clear()
+                    self.sync()
+                    next_sync = t0 + self.positions_interval
+                else:
+                    self.poll_ticks()
+            except Exception as e:
+                self.errors += 1
+                self.log(f"❌ Position manager error: {e}", color='red')
+                self._stop.wait(1.0)
+            # wake() خواب را کوتاه می‌کند
+            self._wake.wait(max(0.0, self.tick_interval - (time.monotonic() - t0)))
@@ -0,0 +1,91 @@
+"""
+Durable per-ticket position state (SQLite, WAL).
+
+    store = PositionStore('position_state.db')
+    states = store.load()                       # symbol -> {ticket: state}, one read
+    store.save('EURUSD', ticket, state)         # on register and on every stage change
+    store.delete('EURUSD', [ticket])            # once the position is closed
+
+After a restart the engine seeds SymbolTrader.position_states from load(), so open
+tickets keep their entry/risk, commission R and done_stages instead of going back
+through register_position (fresh symbol_info calls, stages re-sent as modifies).
+Each save is one small upsert committed in WAL mode with synchronous=NORMAL.
+"""
+import json
+import sqlite3
+import threading
+import time
+
+
+def _encode(state):
+    st = dict(state)
+    st['done_stages'] = sorted(st.get('done_stages', ()))
+    return json.dumps(st)
+
+
+def _decode(text):
+    st = json.loads(text)
+    st['done_stages'] = set(st.get('done_stages', ()))
+    return st
+
+
+class PositionStore:
+    def __init__(self, path):
+        self.path = path
+        # هم حلقه‌ی اصلی و هم thread مدیریت پوزیشن می‌نویسند
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS positions ('
+            'ticket INTEGER PRIMARY KEY, symbol TEXT NOT NULL, state TEXT NOT NULL, updated REAL NOT NULL)'
+        )
+
+    @classmethod
+    def from_config(cls, cfg):
+        """PositionStore for cfg['path'] when cfg['enable'], else None."""
+        if not cfg.get('enable'):
+            return None
+        try:
+            return cls(cfg.get('path', 'position_state.db'))
+        except sqlite3.Error as e:
+            print(f"[position_store] could not open {cfg.get('path')}: {e}")
+            return None
+
+    def load(self):
+        """symbol -> {ticket: state} for every stored ticket."""
+        out = {}
+        with self._lock:
+            rows = self._db.execute('SELECT ticket, symbol, state FROM positions').fetchall()
+        for ticket, symbol, text in rows:
+            try:
+                out.setdefault(symbol, {})[ticket] = _decode(text)
+            except ValueError:
+                continue
+        return out
+
+    def save(self, symbol, ticket, state):
+        try:
+            with self._lock:
+                self._db.execute(
+                    'INSERT OR REPLACE INTO positions (ticket, symbol, state, updated) VALUES (?, ?, ?, ?)',
+                    (ticket, symbol, _encode(state), time.time()),
+                )
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            print(f"[position_store] save {ticket} failed: {e}")
+
+    def delete(self, symbol, tickets):
+        tickets = list(tickets)
+        if not tickets:
+            return
+        try:
+            with self._lock:
+                self._db.executemany('DELETE FROM positions WHERE symbol = ? AND ticket = ?',
+                                     [(symbol, t) for t in tickets])
+        except sqlite3.Error as e:
+            print(f"[position_store] delete failed: {e}")
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -1,17 +1,209 @@
+import atexit
+import os
+import queue
+import sys
+import threading
+import time
 from datetime import datetime
 from colorama import init, Fore
+from metatrader5_config import LOG_CONFIG
 
 # راه‌اندازی colorama
 init(autoreset=True)
 
+LOG_QUEUE_SIZE = 10000     # حداکثر خطوط در صف؛ اگر پر شود خط دور ریخته و شمرده می‌شود
+LOG_FLUSH_LINES = 200      # نوشتن دسته‌ای پس از این تعداد خط
+LOG_FLUSH_INTERVAL = 1.0   # یا حداکثر پس از این چند ثانیه
+
+
+class _AsyncLogWriter:
+    """
+    Background writer for the daily swing_logs_YYYY-MM-DD.txt files. log() only
+    enqueues; a daemon thread writes lines in batches through one open handle and
+    switches to the new file when the date changes.
+    """
+
+    _STOP = object()
+
+    def __init__(self, maxsize=LOG_QUEUE_SIZE, flush_lines=LOG_FLUSH_LINES, flush_interval=LOG_FLUSH_INTERVAL):
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.flush_lines = flush_lines
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._thread = None
+        self._lock = threading.Lock()
+        self._fh = None
+        self._fh_name = None
+
+    def write(self, filename, line):
+        thread = self._thread
+        if thread is None or not thread.is_alive():
+            self._start()
+        try:
+            self.queue.put_nowait((filename, line))
+        except queue.Full:
+            self.dropped += 1
+
+    def depth(self):
+        return self.queue.qsize()
+
+    def close(self):
+        thread = self._thread
+        if thread is None:
+            return
+        if not thread.is_alive():
+            if self.queue.empty():
+                self._thread = None
+                return
+            # خطوطی که بعد از خروج writer قبلی صف شده‌اند
+            self._start()
+            thread = self._thread
+        self.queue.put(self._STOP)
+        thread.join(timeout=5)
+        # اگر هنوز در حال نوشتن است _thread نگه داشته می‌شود تا write یک writer دوم روی همان فایل راه نیندازد
+        if not thread.is_alive() and self._thread is thread:
+            self._thread = None
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            timeout = max(0.0, deadline - time.monotonic())
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            if item is self._STOP:
+                self._write(batch)
+                self._close_file()
+                return
+            if item is not None:
+                batch.append(item)
+            if len(batch) >= self.flush_lines or time.monotonic() >= deadline:
+                self._write(batch)
+                batch = []
+                deadline = time.monotonic() + self.flush_interval
+
+    def _write(self, batch):
+        if self.dropped:
+            dropped, self.dropped = self.dropped, 0
+            batch.append((batch[-1][0] if batch else _log_filename(), f"[log] {dropped} lines dropped (queue full)"))
+        if not batch:
+            return
+        try:
+            for filename, line in batch:
+                if filename != self._fh_name:
+                    # چرخش فایل در نیمه‌شب
+                    self._close_file()
+                    self._fh = open(filename, 'a', encoding='utf-8')
+                    self._fh_name = filename
+                self._fh.write(f"{line}\n")
+            self._fh.flush()
+        except Exception as e:
+            print(f"خطا در ذخیره لاگ: {e}")
+
+    def _close_file(self):
+        if self._fh is not None:
+            try:
+                self._fh.close()
+            except Exception:
+                pass
+        self._fh = None
+        self._fh_name = None
+
+
+def _log_filename():
+    return f"swing_logs_{datetime.now().strftime('%Y-%m-%d')}.txt"
+
+
+_writer = _AsyncLogWriter()
+atexit.register(_writer.close)
+
+
 def log(msg, level='info', color=None, save_to_file=True):
     color_prefix = getattr(Fore, color.upper(), '') if color else ''
     print(f"{color_prefix}{msg}")
 
     if save_to_file:
-        log_filename = f"swing_logs_{datetime.now().strftime('%Y-%m-%d')}.txt"
+        _writer.write(_log_filename(), msg)
+
+
+def flush_logs():
+    """Write everything still queued and stop the writer (it restarts on the next log)."""
+    _writer.close()
+
+
+def log_queue_depth():
+    return _writer.depth()
+
+
+DEBUG, INFO, TRADE, WARNING, ERROR = 10, 20, 25, 30, 40
+LEVELS = {'DEBUG': DEBUG, 'INFO': INFO, 'TRADE': TRADE, 'WARNING': WARNING, 'ERROR': ERROR}
+
+
+class ContextLogger:
+    """
+    Leveled logger that prefixes lines with [file:function:line].
+
+    The file is bound once when the logger is created; function and line come from one
+    sys._getframe lookup, done only for lines that are actually emitted (funcname is used
+    for module-level calls). A message may
+    be a %-format string with args or a zero-argument callable (e.g. a lambda around an
+    f-string), so disabled levels never build the text: the cost is one comparison.
+    Calling the logger directly logs at INFO, like save_file.log. trace() is the per-bar
+    swing/fib trace: INFO while LOG_CONFIG['bar_trace'] is on, DEBUG otherwise.
+    """
+
+    def __init__(self, filename, funcname, level=None, save_to_file=None, bar_trace=None):
+        self.prefix = f"[{os.path.basename(filename)}:"
+        self.funcname = funcname
+        level = LOG_CONFIG.get('log_level', 'INFO') if level is None else level
+        self.level = LEVELS.get(str(level).upper(), INFO) if not isinstance(level, int) else level
+        self.save_to_file = LOG_CONFIG.get('save_to_file', True) if save_to_file is None else save_to_file
+        bar_trace = LOG_CONFIG.get('bar_trace', True) if bar_trace is None else bar_trace
+        self.trace_level = INFO if bar_trace else DEBUG
+
+    def enabled(self, level):
+        return level >= self.level
+
+    def __call__(self, message, *args, color=None, save_to_file=True):
+        if INFO >= self.level:
+            self._emit(message, args, color, save_to_file)
+
+    def debug(self, message, *args, color=None, save_to_file=True):
+        if DEBUG >= self.level:
+            self._emit(message, args, color, save_to_file)
+
+    def trace(self, message, *args, color=None, save_to_file=True):
+        if self.trace_level >= self.level:
+            self._emit(message, args, color, save_to_file)
+
+    def info(self, message, *args, color=None, save_to_file=True):
+        if INFO >= self.level:
+            self._emit(message, args, color, save_to_file)
+
+    def trade(self, message, *args, color=None, save_to_file=True):
+        if TRADE >= self.level:
+            self._emit(message, args, color, save_to_file)
+
+    def _emit(self, message, args, color, save_to_file):
         try:
-            with open(log_filename, 'a', encoding='utf-8') as f:
-                f.write(f"{msg}\n")
-        except Exception as e:
-            print(f"خطا در ذخیره لاگ: {e}")
\ No newline at end of file
+            if callable(message):
+                message = message()
+            elif args:
+                message = message % args
+            frame = sys._getframe(2)
+            func = frame.f_code.co_name
+            if func == '<module>':
+                func = self.funcname
+            log(f"{self.prefix}{func}:{frame.f_lineno}] {message}", color=color,
+                save_to_file=save_to_file and self.save_to_file)
+        except Exception:
+            # Fallback to plain log if anything goes wrong
+            log(str(message), color=color, save_to_file=save_to_file)
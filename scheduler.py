@@ -0,0 +1,76 @@
+import time
+
+
+class BarScheduler:
+    """
+    Drives the main loop from bar closes instead of fixed 0.5s polling:
+    - the bar check is due right after the next expected bar close (+ broker latency)
+    - if the probe finds no new bar yet, it retries shortly for a few seconds, then
+      waits for the next close
+    - position management keeps its own, faster cadence
+    """
+
+    def __init__(self, bar_seconds=60, close_latency=0.3, retry_interval=0.25, retry_window=5.0,
+                 manage_interval=0.5, max_wait=60, clock=time.time, sleeper=time.sleep):
+        self.bar_seconds = bar_seconds
+        self.close_latency = close_latency
+        self.retry_interval = retry_interval
+        self.retry_window = retry_window
+        self.manage_interval = manage_interval
+        self.max_wait = max_wait
+        self.clock = clock
+        self.sleeper = sleeper
+        # اولین فراخوانی بلافاصله داده می‌گیرد
+        self.next_bar_check = 0.0
+        self.next_manage = 0.0
+        self.waiting_since = None
+
+    @classmethod
+    def from_config(cls, cfg):
+        return cls(
+            bar_seconds=cfg.get('bar_seconds', 60),
+            close_latency=cfg.get('bar_close_latency', 0.3),
+            retry_interval=cfg.get('bar_retry_interval', 0.25),
+            retry_window=cfg.get('bar_retry_window', 5.0),
+            manage_interval=cfg.get('manage_interval', 0.5),
+            max_wait=cfg.get('max_wait', 60),
+        )
+
+    def next_bar_close(self, now):
+        return (now // self.bar_seconds + 1) * self.bar_seconds + self.close_latency
+
+    # ---------- Bars ----------
+    def bar_due(self):
+        return self.clock() >= self.next_bar_check
+
+    def bar_received(self):
+        self.waiting_since = None
+        self.next_bar_check = self.next_bar_close(self.clock())
+
+    def bar_missing(self):
+        """Probe found no new bar; schedule the next probe. Returns seconds waited so far."""
+        now = self.clock()
+        if self.waiting_since is None:
+            self.waiting_since = now
+        waited = now - self.waiting_since
+        if waited < self.retry_window:
+            self.next_bar_check = now + self.retry_interval
+        else:
+            # بازار کم‌تحرک است؛ تا بسته شدن کندل بعدی صبر کن
+            self.next_bar_check = min(self.next_bar_close(now), self.waiting_since + self.max_wait)
+        return waited
+
+    def wait_expired(self):
+        return self.waiting_since is not None and self.clock() - self.waiting_since >= self.max_wait
+
+    # ---------- Positions ----------
+    def manage_due(self):
+        return self.clock() >= self.next_manage
+
+    def managed(self):
+        self.next_manage = self.clock() + self.manage_interval
+
+    def sleep(self):
+        delay = min(self.next_bar_check, self.next_manage) - self.clock()
+        if delay > 0:
+            self.sleeper(delay)
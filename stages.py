@@ -0,0 +1,87 @@
+"""
+DYNAMIC_RISK_CONFIG['stages'] compiled once per position.
+
+StagePlan resolves the 'auto' values, sorts the stages by trigger and keeps trigger
+distances, SL locks and TPs in price space (already rounded to the symbol's digits).
+Per tick, reached(price) is one bisect for the highest crossed stage; its SL/TP go out in
+one modify and the lower stages it supersedes are marked done with it, so the cost does
+not grow with the number of stages. Shared by SymbolTrader.manage_open_positions and
+Backtester._apply_stages.
+"""
+from bisect import bisect_right
+
+
+def resolve_stage(stage_cfg, commission_trigger_R):
+    """(trigger_R, sl_lock_R) of one stage with 'auto' resolved, or None when unusable."""
+    trigger_R = stage_cfg.get('trigger_R')
+    sl_lock_R = stage_cfg.get('sl_lock_R')
+    # مرحله‌ی کمیسیون: trigger و قفل SL روی نقطه‌ی پوشش کمیسیون
+    if trigger_R == 'auto':
+        trigger_R = commission_trigger_R
+        sl_lock_R = trigger_R
+    if sl_lock_R == 'auto':
+        sl_lock_R = trigger_R
+    if trigger_R is None or sl_lock_R is None or isinstance(trigger_R, str) or isinstance(sl_lock_R, str):
+        return None
+    return float(trigger_R), float(sl_lock_R)
+
+
+class StagePlan:
+    __slots__ = ('entry', 'sign', 'ids', 'triggers', 'sls', 'tps', 'best', 'last_tp', 'level')
+
+    def __init__(self, stages_cfg, entry, risk, direction, commission_trigger_R=0.1, digits=5, done_stages=()):
+        sign = 1 if direction == 'buy' else -1
+        rows = []
+        for order, cfg in enumerate(stages_cfg):
+            resolved = resolve_stage(cfg, commission_trigger_R)
+            if resolved is None:
+                continue
+            trigger_R, sl_lock_R = resolved
+            tp_R = cfg.get('tp_R')
+            rows.append((trigger_R, order, cfg.get('id'),
+                         round(entry + sign * sl_lock_R * risk, digits),
+                         round(entry + sign * tp_R * risk, digits) if tp_R is not None else None))
+        rows.sort(key=lambda r: (r[0], r[1]))
+        self.entry = entry
+        self.sign = sign
+        self.ids = [r[2] for r in rows]
+        self.triggers = [r[0] * risk for r in rows]  # فاصله‌ی سود (قیمت) برای هر trigger
+        self.sls = [r[3] for r in rows]
+        self.tps = [r[4] for r in rows]  # None = TP فعلی حفظ شود
+        # best[i]: مرحله‌ای از 0..i که محافظ‌ترین SL را دارد
+        self.best = []
+        # last_tp[i]: TP آخرین مرحله‌ی 0..i که tp_R دارد (مرحله‌ی best ممکن است tp_R=None داشته باشد)
+        self.last_tp = []
+        b = tp = None
+        for i, sl in enumerate(self.sls):
+            if b is None or sign * sl > sign * self.sls[b]:
+                b = i
+            if self.tps[i] is not None:
+                tp = self.tps[i]
+            self.best.append(b)
+            self.last_tp.append(tp)
+        done = [i for i, sid in enumerate(self.ids) if sid in done_stages]
+        self.level = max(done) if done else -1  # بالاترین مرحله‌ی اعمال‌شده
+
+    def __len__(self):
+        return len(self.ids)
+
+    def next_trigger(self):
+        """Profit distance (price) of the next stage not applied yet; inf when none is left."""
+        i = self.level + 1
+        return self.triggers[i] if i < len(self.triggers) else float('inf')
+
+    def reached(self, price):
+        """Index of the highest stage crossed at price and not applied yet, else None."""
+        k = bisect_right(self.triggers, self.sign * (price - self.entry)) - 1
+        return k if k > self.level else None
+
+    def target(self, k):
+        """(sl, tp, stage id) to send when stage k is reached; tp None = keep the current TP."""
+        return self.sls[self.best[k]], self.last_tp[k], self.ids[k]
+
+    def advance(self, k):
+        """Mark stages up to k as applied; returns their ids."""
+        ids = self.ids[self.level + 1:k + 1]
+        self.level = max(self.level, k)
+        return ids
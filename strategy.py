@@ -0,0 +1,146 @@
+from contextlib import nullcontext
+
+from fibo_calculate import fibonacci_retracement
+from metatrader5_config import TRADING_CONFIG
+from save_file import ContextLogger
+from swing import get_swing_points
+from utils import BotState
+
+
+class SwingFibStrategy:
+    """
+    Phase 1/2/3 of the swing/fib strategy, shared by main() and the backtester.
+
+    on_bar() gets the last legs (at most 3, including the forming candle), the last closed
+    candle (a row or dict with open/high/low/close/status/timestamp) and the data used by
+    get_swing_points. It updates self.state / self.last_swing_type and returns 'buy',
+    'sell' or None.
+
+    fib_705 / fib_90 are the retracement ratios of the entry and second levels (defaults:
+    TRADING_CONFIG['fib_705'] / ['fib_90']); the fib_levels keys stay '0.705' and '0.9'.
+    latency: optional latency.LatencyRecorder for 'swing' / 'fib' spans (off in backtests).
+    """
+
+    def __init__(self, log=None, fib_705=None, fib_90=None, latency=None):
+        self.state = BotState()
+        self.last_swing_type = None
+        self.fib_705 = fib_705 if fib_705 is not None else TRADING_CONFIG.get('fib_705', 0.705)
+        self.fib_90 = fib_90 if fib_90 is not None else TRADING_CONFIG.get('fib_90', 0.9)
+        self.log = log or ContextLogger(__file__, 'SwingFibStrategy')
+        self.latency = latency
+
+    def _span(self, name):
+        return self.latency.span(name) if self.latency is not None else nullcontext()
+
+    def on_bar(self, legs, closed, data, **swing_kwargs):
+        state = self.state
+        log = self.log
+
+        if len(legs) > 2:
+            log.trace('legs > 2', color='blue')
+            legs = legs[-3:]
+            log.trace(lambda: f"{legs[0]['start']} {legs[0]['end']} "
+                              f"{legs[1]['start']} {legs[1]['end']} "
+                              f"{legs[2]['start']} {legs[2]['end']}", color='yellow')
+            try:
+                with self._span('swing'):
+                    swing_type, is_swing = get_swing_points(data=data, legs=legs, **swing_kwargs)
+            except KeyError:
+                # پولبک از پنجره‌ی داده بیرون زده و کندل‌هایش برای بررسی سوینگ در دسترس نیست
+                swing_type, is_swing = '', False
+
+            # Phase 1 Initialization fib_levels or change by new fib
+            if is_swing:
+                log.trace(lambda: f"is_swing: {swing_type}")
+                if swing_type == 'bullish' and closed['close'] > legs[1]['start_value']:
+                    state.reset()
+                    state.fib_levels = self._fib(start_price=legs[2]['end_value'], end_price=legs[2]['start_value'])
+                    state.fib0_time = legs[2]['start']
+                    state.fib1_time = legs[2]['end']
+                    self.last_swing_type = swing_type
+                    log(f"📈 New fibonacci created: fib1:{state.fib_levels['1.0']} time:{legs[2]['start']} - fib0.705:{state.fib_levels['0.705']} - fib0:{state.fib_levels['0.0']} time:{legs[2]['end']}", color='green')
+
+                elif swing_type == 'bearish' and closed['close'] < legs[1]['start_value']:
+                    state.reset()
+                    state.fib_levels = self._fib(start_price=legs[2]['end_value'], end_price=legs[2]['start_value'])
+                    state.fib0_time = legs[2]['start']
+                    state.fib1_time = legs[2]['end']
+                    self.last_swing_type = swing_type
+                    log(f"📉 New fibonacci created: fib1:{state.fib_levels['1.0']} time:{legs[2]['start']} - fib0.705:{state.fib_levels['0.705']} - fib0:{state.fib_levels['0.0']} time:{legs[2]['end']}", color='green')
+
+            # Phase 2
+            if state.fib_levels:
+                log.trace('📊 Phase 2', color='blue')
+                with self._span('fib'):
+                    self._update_fib(closed)
+
+        else:
+            # Phase 3
+            if state.fib_levels:
+                log.trace("📊 Phase 3", color='blue')
+                with self._span('fib'):
+                    self._update_fib(closed)
+
+            if len(legs) == 2:
+                log.trace('legs = 2', color='blue')
+                log.trace(lambda: f'leg0: {legs[0]["start"]}, {legs[0]["end"]}, leg1: {legs[1]["start"]}, {legs[1]["end"]}', color='lightcyan_ex')
+            elif len(legs) == 1:
+                log.trace('legs = 1', color='blue')
+                log.trace(lambda: f'leg0: {legs[0]["start"]}, {legs[0]["end"]}', color='lightcyan_ex')
+
+        if self.last_swing_type == 'bullish' and state.second_touch:
+            return 'buy'
+        if self.last_swing_type == 'bearish' and state.second_touch:
+            return 'sell'
+        return None
+
+    def _fib(self, start_price, end_price):
+        return fibonacci_retracement(start_price, end_price, self.fib_705, self.fib_90)
+
+    def _update_fib(self, closed):
+        """Move fib 0 with new extremes, reset beyond fib 1, track touches of 0.705."""
+        state = self.state
+        log = self.log
+        if self.last_swing_type == 'bullish':
+            if closed['high'] > state.fib_levels['0.0']:
+                state.fib_levels = self._fib(start_price=closed['high'], end_price=state.fib_levels['1.0'])
+                state.fib0_time = closed['timestamp']
+                state.first_touch = False
+                state.first_touch_value = None
+                # Should it be reset???
+                log(f"📈 Updated fibonacci: fib1:{state.fib_levels['1.0']} - fib0.705:{state.fib_levels['0.705']} - fib0:{state.fib_levels['0.0']}", color='green')
+            elif closed['low'] < state.fib_levels['1.0']:
+                state.reset()
+                log(f"📈 Price dropped below fib1 on bullish and reset fib levels", color='red')
+            elif closed['low'] <= state.fib_levels['0.705']:
+                log(f"📈 Price touched fib0.705 on bullish -- cache_data status is {closed['status']}", color='red')
+                if not state.first_touch:
+                    state.first_touch_value = closed
+                    state.first_touch = True
+                    log(f"📈 First touch on bullish: {state.first_touch_value['timestamp']}  first touch status is {state.first_touch_value['status']}", color='green')
+                elif state.first_touch and not state.second_touch and closed['status'] != state.first_touch_value['status']:
+                    state.second_touch_value = closed
+                    state.second_touch = True
+                    log(f"📈 Second touch on bullish: {state.second_touch_value['timestamp']}  second touch status is {state.second_touch_value['status']}", color='green')
+
+        elif self.last_swing_type == 'bearish':
+            if closed['low'] < state.fib_levels['0.0']:
+                state.fib_levels = self._fib(start_price=closed['low'], end_price=state.fib_levels['1.0'])
+                state.fib0_time = closed['timestamp']
+                state.first_touch = False
+                state.first_touch_value = None
+                # Should it be reset???
+                log(f"📉 Updated fibonacci: fib1:{state.fib_levels['1.0']} - fib0.705:{state.fib_levels['0.705']} - fib0:{state.fib_levels['0.0']}", color='green')
+            elif closed['high'] > state.fib_levels['1.0']:
+                state.reset()
+                log(f"📉 Price dropped below fib1 on bearish and reset fib levels", color='red')
+            elif closed['high'] >= state.fib_levels['0.705']:
+                log(f"📉 Price touched fib0.705 on bearish -- cache_data status is {closed['status']}", color='red')
+                if not state.first_touch:
+                    state.first_touch_value = closed
+                    state.first_touch = True
+                    log(f"📉 First touch on bearish: {state.first_touch_value['timestamp']}  first touch status is {state.first_touch_value['status']}", color='red')
+                elif state.first_touch and not state.second_touch and closed['status'] != state.first_touch_value['status']:
+                    state.second_touch_value = closed
+                    state.second_touch = True
+                    log(f"📉 Second touch on bearish: {state.second_touch_value['timestamp']}  second touch status is {state.second_touch_value['status']}", color='red')
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Parallel parameter sweep over the backtester.
+
+Every combination of threshold x fib_705 x fib_90 x win_ratio is one Backtester.run() in a
+worker process. The bar history is copied once into a shared-memory block; workers attach
+to it in their initializer, so a task only carries its parameters (no DataFrame pickling,
+and it also works with the 'spawn' start method used on Windows). Results are appended to
+the output CSV as they finish and the final table is ranked by expectancy, then drawdown.
+
+Grid values are comma separated lists or start:stop:step ranges (stop inclusive):
+
+    python sweep.py bars.csv --threshold 4:10:1 --fib-705 0.618,0.705,0.786 --win-ratio 1.5,2,3
+"""
+import argparse
+import itertools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from backtest import Backtester, load_bars
+from metatrader5_config import MT5_CONFIG, TRADING_CONFIG
+
+BAR_COLUMNS = ('open', 'high', 'low', 'close', 'spread')
+RANK_BY = ['expectancy_R', 'max_drawdown_R']
+
+_bars = None   # per-worker DataFrame over the shared block
+_shm = None
+
+
+class SharedBars:
+    """Owner side: bars as one (n, 5) float64 array in a SharedMemory block."""
+
+    def __init__(self, bars):
+        cols = [c for c in BAR_COLUMNS if c in bars.columns]
+        arr = bars[cols].to_numpy(dtype=np.float64)
+        self.shm = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+        view = np.ndarray(arr.shape, dtype=np.float64, buffer=self.shm.buf)
+        view[:] = arr
+        self.spec = {'name': self.shm.name, 'shape': arr.shape, 'columns': cols}
+
+    def close(self):
+        self.shm.close()
+        self.shm.unlink()
+
+
+def _attach(spec):
+    global _bars, _shm
+    _shm = shared_memory.SharedMemory(name=spec['name'])
+    arr = np.ndarray(spec['shape'], dtype=np.float64, buffer=_shm.buf)
+    arr.flags.writeable = False
+    # ستون‌ها view روی حافظه‌ی مشترک هستند (بدون کپی)
+    _bars = pd.DataFrame({c: arr[:, i] for i, c in enumerate(spec['columns'])}, copy=False)
+
+
+def _run_one(params, backtest_kwargs):
+    t0 = time.perf_counter()
+    result = Backtester(_bars, **params, **backtest_kwargs).run()
+    return dict(params, **result, elapsed_s=round(time.perf_counter() - t0, 3))
+
+
+def parse_values(text, cast=float):
+    """'1,2,3' or 'start:stop:step' (stop inclusive)."""
+    if ':' in text:
+        start, stop, step = (float(x) for x in text.split(':'))
+        values = np.arange(start, stop + step / 2, step)
+        return [cast(round(v, 10)) for v in values]
+    return [cast(v) for v in text.split(',') if v.strip()]
+
+
+def param_grid(thresholds, fib_705s, fib_90s, win_ratios):
+    return [
+        {'threshold': th, 'fib_705': f7, 'fib_90': f9, 'win_ratio': wr}
+        for th, f7, f9, wr in itertools.product(thresholds, fib_705s, fib_90s, win_ratios)
+    ]
+
+
+def rank(results):
+    df = pd.DataFrame(results)
+    if df.empty:
+        return df
+    return df.sort_values(RANK_BY, ascending=[False, True]).reset_index(drop=True)
+
+
+def run_sweep(bars, grid, workers=None, out=None, backtest_kwargs=None, progress=True):
+    """Run every parameter set of grid over bars; returns the ranked DataFrame."""
+    backtest_kwargs = backtest_kwargs or {}
+    workers = workers or os.cpu_count() or 1
+    shared = SharedBars(bars)
+    results = []
+    t0 = time.perf_counter()
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_attach, initargs=(shared.spec,)) as pool:
+            futures = [pool.submit(_run_one, params, backtest_kwargs) for params in grid]
+            for done, fut in enumerate(as_completed(futures), 1):
+                row = fut.result()
+                results.append(row)
+                if out:
+                    pd.DataFrame([row]).to_csv(out, mode='a', header=done == 1, index=False)
+                if progress:
+                    print(f"[{done}/{len(grid)}] th={row['threshold']} fib705={row['fib_705']} "
+                          f"fib90={row['fib_90']} wr={row['win_ratio']} -> trades={row['trades']} "
+                          f"exp={row['expectancy_R']:.3f}R dd={row['max_drawdown_R']:.2f}R")
+    finally:
+        shared.close()
+    if progress:
+        print(f"{len(grid)} runs in {time.perf_counter() - t0:.1f}s on {workers} workers")
+    return rank(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parallel parameter sweep of the swing/fib strategy")
+    parser.add_argument('bars', help="CSV with time, open, high, low, close[, spread], or SYMBOL[:TF] from the bar cache")
+    parser.add_argument('--from', dest='start', default=None, help="YYYY-MM-DD (UTC)")
+    parser.add_argument('--to', dest='end', default=None)
+    parser.add_argument('--threshold', default=str(TRADING_CONFIG['threshold']))
+    parser.add_argument('--fib-705', default=str(TRADING_CONFIG.get('fib_705', 0.705)))
+    parser.add_argument('--fib-90', default=str(TRADING_CONFIG.get('fib_90', 0.9)))
+    parser.add_argument('--win-ratio', default=str(MT5_CONFIG['win_ratio']))
+    parser.add_argument('--risk-pct', type=float, default=0.01)
+    parser.add_argument('--workers', type=int, default=None, help="default: os.cpu_count()")
+    parser.add_argument('--out', default=None, help="stream result rows to this CSV")
+    parser.add_argument('--top', type=int, default=20)
+    args = parser.parse_args()
+
+    grid = param_grid(parse_values(args.threshold), parse_values(args.fib_705),
+                      parse_values(args.fib_90), parse_values(args.win_ratio))
+    if args.out and os.path.exists(args.out):
+        os.remove(args.out)
+    ranked = run_sweep(load_bars(args.bars, args.start, args.end), grid, workers=args.workers, out=args.out,
+                       backtest_kwargs={'risk_pct': args.risk_pct})
+    cols = ['threshold', 'fib_705', 'fib_90', 'win_ratio', 'trades', 'win_rate', 'expectancy_R',
+            'max_drawdown_R', 'total_R', 'profit_factor', 'net_pnl']
+    with pd.option_context('display.width', 200):
+        print(ranked[cols].head(args.top).to_string())
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,15 @@
 from colorama import Fore
 
 
-def get_swing_points(data, legs):
+def get_swing_points(data, legs, index_map=None, close=None, status=None, window_start=None):
+    """
+    index_map: optional cached {timestamp: position} for data.index; legs whose
+    'start'/'end' are already integer positions (get_legs_arrays) need neither.
+    close/status: optional precomputed arrays of data['close'] / data['status'].
+    window_start: with integer positions into longer arrays (backtest), the first position
+    of the live data window; a pullback starting before it raises KeyError like get_loc
+    does on the live window.
+    """
     if len(legs) == 3:
         
         s_index = 0
@@ -11,26 +19,12 @@ def get_swing_points(data, legs):
         if legs[1]['end_value'] > legs[0]['start_value'] and legs[0]['end_value'] > legs[1]['end_value']:
             
             ### Chek true swing ###
-            s_index = data.index.tolist().index(legs[1]['start'])
-            e_index = data.index.tolist().index(legs[1]['end'])
-            true_candles = 0
-            first_candle = False
+            s_index = _position(data, legs[1]['start'], index_map, window_start)
+            e_index = _position(data, legs[1]['end'], index_map)
+            close, status = _arrays(data, close, status)
 
-            for k in range(s_index, e_index+1):  # Check the current poolback for have 3 bearish candles
-                
-                if data.iloc[k]['status'] == 'bearish':   # If current candle is bearish for check swing
-                    
-                    if first_candle:  # If first candle of poolback
-                        if data.iloc[k]['close'] < last_candle_close:  # If last close is less than current candle close
-                            true_candles += 1
-                            last_candle_close = data.iloc[k]['close']
-                            
-                    else:  # If not first candle of poolback give value
-                        last_candle_close = data.iloc[k]['close']
-                    
-                    first_candle = True
-            
-            if true_candles >= 3:
+            # Check the current poolback for have 3 bearish candles
+            if _count_true_candles(close, status, s_index, e_index, 'bearish') >= 3:
                 swing_type = 'bullish'
                 is_swing = True
             
@@ -38,27 +32,52 @@ def get_swing_points(data, legs):
         elif legs[1]['end_value'] < legs[0]['start_value'] and legs[0]['end_value'] < legs[1]['end_value']:
 
             ### Chek true swing ###
-            s_index = data.index.tolist().index(legs[1]['start'])
-            e_index = data.index.tolist().index(legs[1]['end'])
-            true_candles = 0
-            first_candle = False
+            s_index = _position(data, legs[1]['start'], index_map, window_start)
+            e_index = _position(data, legs[1]['end'], index_map)
+            close, status = _arrays(data, close, status)
 
-            for k in range(s_index, e_index+1):  # Check the current poolback for have 3 bullish candles
-                
-                if data.iloc[k]['status'] == 'bullish':   # If current candle is bullish for check swing
-                    
-                    if first_candle:  # If first candle of poolback
-                        if data.iloc[k]['close'] > last_candle_close:  # If last close is more than current candle close
-                            true_candles += 1
-                            last_candle_close = data.iloc[k]['close']
-                            
-                    else:  # If not first candle of poolback give value
-                        last_candle_close = data.iloc[k]['close']
-                    
-                    first_candle = True
-                
-            if true_candles >= 3:
+            # Check the current poolback for have 3 bullish candles
+            if _count_true_candles(close, status, s_index, e_index, 'bullish') >= 3:
                 swing_type = 'bearish'
                 is_swing = True
 
-        return swing_type, is_swing
\ No newline at end of file
+        return swing_type, is_swing
+
+
+def _position(data, key, index_map, window_start=None):
+    if isinstance(key, int):
+        if window_start is not None and key < window_start:
+            raise KeyError(key)
+        return key
+    if index_map is not None:
+        return index_map[key]
+    # index یکتا و مرتب است؛ get_loc جستجوی hash/باینری است نه خطی
+    return data.index.get_loc(key)
+
+
+def _arrays(data, close, status):
+    if close is None:
+        close = data['close'].to_numpy()
+    if status is None:
+        status = data['status'].to_numpy()
+    return close, status
+
+
+def _count_true_candles(close, status, s_index, e_index, pullback_status):
+    """
+    Count pullback candles (status == pullback_status) in [s_index, e_index] that close
+    beyond the last counted one: lower for bearish pullbacks, higher for bullish ones.
+    """
+    bearish = pullback_status == 'bearish'
+    true_candles = 0
+    last_candle_close = None
+    for k in range(s_index, e_index + 1):
+        if status[k] != pullback_status:
+            continue
+        candle_close = close[k]
+        if last_candle_close is None:  # first candle of poolback gives the reference value
+            last_candle_close = candle_close
+        elif (candle_close < last_candle_close) if bearish else (candle_close > last_candle_close):
+            true_candles += 1
+            last_candle_close = candle_close
+    return true_candles
@@ -0,0 +1,36 @@
+import importlib.util
+import sys
+import types
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+# ماژول‌های ربات در ریشه‌ی repo هستند (بدون package)؛ MetaTrader5 همیشه شبیه‌ساز mt5_sim است
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / 'mt5_sim'))
+
+# همان کندل‌های مصنوعی bench (UTC، بدون ستون‌های cache_data)
+from bench import random_walk_bars as synthetic_bars  # noqa: E402,F401
+
+
+@pytest.fixture(autouse=True)
+def _tmp_cwd(tmp_path, monkeypatch):
+    # swing_logs_*.txt و فایل‌های runtime نسبت به cwd نوشته می‌شوند
+    monkeypatch.chdir(tmp_path)
+
+
+@pytest.fixture
+def engine_module(monkeypatch):
+    """engine, importable without the local email_config (SMTP credentials, not in the repo)."""
+    if 'engine' not in sys.modules and importlib.util.find_spec('email_config') is None:
+        monkeypatch.setitem(sys.modules, 'email_config', types.SimpleNamespace(
+            EMAIL_HOST_PASSWORD_KEY='', EMAIL_HOST_USER_NAME='', EMAIL_RECIPIENT_USER_NAME=''))
+    import engine
+    # هیچ تستی ایمیل نمی‌فرستد یا در CSVهای analytics و position_state.db واقعی نمی‌نویسد
+    noop = lambda *args, **kwargs: None  # noqa: E731
+    for name in ('send_trade_email_async', 'log_signal', 'log_position_event'):
+        monkeypatch.setattr(engine, name, noop)
+    monkeypatch.setitem(engine.POSITION_STORE_CONFIG, 'enable', False)
+    return engine
+
@@ -0,0 +1,118 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from backtest import Backtester
+from conftest import synthetic_bars
+from swing import get_swing_points
+
+POINT = 0.00001
+RISK_CONFIG = {
+    'enable': True,
+    'commission_per_lot': 0.0,
+    'commission_coverage_stage': {'enable': False},
+    'stages': [
+        {'id': 'lock_1R', 'trigger_R': 1.0, 'sl_lock_R': 0.5, 'tp_R': None},
+        {'id': 'lock_2R', 'trigger_R': 2.0, 'sl_lock_R': 1.5, 'tp_R': 3.0},
+    ],
+}
+
+
+def _bars(rows):
+    """rows: (open, high, low, close) per bar, spread 0."""
+    index = pd.date_range('2025-01-06', periods=len(rows), freq='min', tz='UTC', name='time')
+    df = pd.DataFrame(rows, columns=['open', 'high', 'low', 'close'], index=index)
+    df['spread'] = 0
+    return df
+
+
+def _backtester(bars, win_ratio):
+    # حالت run() برای صدا زدن مستقیم _open / _manage_positions
+    bt = Backtester(bars, win_ratio=win_ratio, risk_config=RISK_CONFIG)
+    bt.balance, bt.positions, bt.trades = bt.initial_balance, [], []
+    return bt
+
+
+def _buy(bt, entry=1.1000, sl=1.0990):
+    # tp = 2R با win_ratio=2
+    return bt._open('buy', SimpleNamespace(fib_levels={'1.0': sl}), 0, entry, 0.0)
+
+
+def test_sl_wins_when_sl_and_tp_hit_on_one_bar():
+    bars = _bars([(1.1, 1.1, 1.1, 1.1), (1.1, 1.1030, 1.0985, 1.1)])
+    bt = _backtester(bars, 2)
+    pos = _buy(bt)
+    assert pos['tp'] == pytest.approx(1.1020)
+    bt._manage_positions(1, *bars.iloc[1][['open', 'high', 'low']], 0.0)
+    assert [t['reason'] for t in bt.trades] == ['sl']
+    assert bt.trades[0]['exit'] == pytest.approx(1.0990)
+    assert bt.trades[0]['R'] == pytest.approx(-1.0)
+
+
+def test_gap_through_sl_fills_at_open():
+    bars = _bars([(1.1, 1.1, 1.1, 1.1), (1.0980, 1.0985, 1.0975, 1.098)])
+    bt = _backtester(bars, 2)
+    _buy(bt)
+    bt._manage_positions(1, *bars.iloc[1][['open', 'high', 'low']], 0.0)
+    assert bt.trades[0]['exit'] == pytest.approx(1.0980)
+
+
+def test_stages_apply_after_the_exit_checks():
+    bars = _bars([(1.1, 1.1, 1.1, 1.1), (1.1, 1.1012, 1.0995, 1.101), (1.101, 1.1022, 1.1008, 1.102)])
+    bt = _backtester(bars, 2)
+    pos = _buy(bt)
+    bt._manage_positions(1, *bars.iloc[1][['open', 'high', 'low']], 0.0)
+    assert pos['sl'] == pytest.approx(1.1005)  # 1R -> قفل روی 0.5R
+    assert pos['done_stages'] == {'lock_1R'}
+    # 2.2R: TP اولیه (2R) همان کندل زده می‌شود؛ مرحله‌ی 2R دیگر اعمال نمی‌شود
+    bt._manage_positions(2, *bars.iloc[2][['open', 'high', 'low']], 0.0)
+    assert [t['reason'] for t in bt.trades] == ['tp']
+    assert bt.trades[0]['stages'] == 1
+
+
+def test_stage_jump_sends_the_highest_lock():
+    bars = _bars([(1.1, 1.1, 1.1, 1.1), (1.1, 1.1019, 1.0995, 1.1018)])
+    bt = _backtester(bars, 4)
+    pos = _buy(bt)
+    bt._manage_positions(1, *bars.iloc[1][['open', 'high', 'low']], 0.0)
+    assert not bt.trades
+    assert pos['sl'] == pytest.approx(1.1005)
+    # 1.9R: فقط مرحله‌ی 1R؛ در 2R هر دو مرحله با یک تغییر
+    bt._apply_stages(pos, 1.1021)
+    assert pos['sl'] == pytest.approx(1.1015)
+    assert pos['tp'] == pytest.approx(1.1030)
+    assert pos['done_stages'] == {'lock_1R', 'lock_2R'}
+
+
+def test_replay_fills_at_next_bar_open_and_is_deterministic():
+    bars = synthetic_bars(6000, seed=3)
+    first = Backtester(bars, risk_config=RISK_CONFIG)
+    summary = first.run()
+    assert summary['trades'] > 0
+    again = Backtester(bars, risk_config=RISK_CONFIG)
+    assert again.run() == summary
+    assert again.trades == first.trades
+    opens = bars['open'].to_numpy()
+    spreads = bars['spread'].to_numpy() * POINT
+    positions = bars.index.get_indexer([t['open_time'] for t in first.trades])
+    for trade, i in zip(first.trades, positions):
+        # سیگنال روی کندل بسته‌شده‌ی i-1، ورود با open کندل i (BUY با ask)
+        expected = opens[i] + spreads[i] if trade['direction'] == 'buy' else opens[i]
+        assert trade['entry'] == pytest.approx(expected)
+
+
+def test_pullback_outside_live_window_is_not_a_swing():
+    # لگ‌ها با موقعیت عددی (مثل backtest)؛ پولبک 3 کندل نزولی با close پایین‌تر
+    close = np.array([1.0, 1.1, 1.2, 1.19, 1.18, 1.17, 1.16, 1.25])
+    status = np.array(['bullish', 'bullish', 'bullish', 'bearish', 'bearish', 'bearish', 'bearish', 'bullish'])
+    legs = [
+        {'start': 0, 'end': 2, 'start_value': 1.0, 'end_value': 1.2},
+        {'start': 2, 'end': 6, 'start_value': 1.2, 'end_value': 1.16},
+        {'start': 6, 'end': 7, 'start_value': 1.16, 'end_value': 1.25},
+    ]
+    assert get_swing_points(None, legs, close=close, status=status) == ('bullish', True)
+    assert get_swing_points(None, legs, close=close, status=status, window_start=2) == ('bullish', True)
+    with pytest.raises(KeyError):
+        get_swing_points(None, legs, close=close, status=status, window_start=3)
@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import MetaTrader5 as mt5
+from bar_buffer import BarRingBuffer
+from bench import _rates
+from conftest import synthetic_bars
+from mt5_connector import MT5Connector
+
+COUNT = 100
+
+
+def _bars(times, close=1.0):
+    out = np.zeros(len(times), dtype=mt5.RATES_DTYPE)
+    out['time'] = times
+    out['close'] = close
+    return out
+
+
+def test_merge_replaces_the_forming_bar():
+    buf = BarRingBuffer(5)
+    buf.extend(_bars([60, 120, 180]))
+    assert buf.merge(_bars([180, 240], close=2.0))
+    assert list(buf.view()['time']) == [60, 120, 180, 240]
+    assert list(buf.view()['close']) == [1.0, 1.0, 2.0, 2.0]
+
+
+def test_merge_reports_a_gap():
+    buf = BarRingBuffer(5)
+    buf.extend(_bars([60, 120]))
+    assert not buf.merge(_bars([240, 300]))
+    assert list(buf.view()['time']) == [60, 120]
+
+
+def test_merge_keeps_the_newest_capacity_bars():
+    buf = BarRingBuffer(3)
+    buf.extend(_bars([60]))
+    for t in range(120, 660, 60):
+        assert buf.merge(_bars([t - 60, t]))
+    assert list(buf.view()['time']) == [480, 540, 600]
+
+
+@pytest.fixture
+def sim():
+    df = synthetic_bars(3000)
+    # تعطیلی آخر هفته بعد از کندل 1500
+    df.index = df.index.where(np.arange(len(df)) < 1500, df.index + pd.Timedelta(days=2))
+    return mt5.configure(bars=_rates(df), start=1000)
+
+
+def _check(conn, sim):
+    got = conn.get_bars(count=COUNT)
+    want = mt5.copy_rates_from_pos('EURUSD', mt5.TIMEFRAME_M1, 0, COUNT)
+    np.testing.assert_array_equal(got, want)
+
+
+def test_get_bars_matches_a_full_fetch(sim):
+    conn = MT5Connector('EURUSD')
+    conn.bar_cache_root = None
+    t0 = int(sim.times[1000])
+    sim.set_time(t0 + 30)
+    _check(conn, sim)
+    for step in (20, 40, 60, 61, 300, 3000):  # همان کندل، کندل بعدی، gap کوچک، gap بزرگ‌تر از COUNT
+        sim.calls.clear()
+        sim.set_time(t0 + 30 + step)
+        _check(conn, sim)
+    # gap بزرگ: 2 → 8 → 32 → 100 و بعد buffer از نو پر می‌شود (+1 fetch کامل در _check)
+    assert sim.calls['copy_rates_from_pos'] == 5
+
+
+def test_get_bars_after_the_weekend(sim):
+    conn = MT5Connector('EURUSD')
+    conn.bar_cache_root = None
+    sim.set_time(int(sim.times[1499]) + 30)  # آخرین کندل قبل از تعطیلی
+    _check(conn, sim)
+    sim.set_time(int(sim.times[1503]) + 10)  # دوشنبه، 4 کندل بعد از باز شدن بازار
+    sim.calls.clear()
+    _check(conn, sim)
+    assert sim.calls['copy_rates_from_pos'] == 3  # 2 → 8 (پوشش تا جمعه) + full fetch مقایسه
+    assert list(np.diff(conn.get_bars(count=COUNT)['time'])).count(60 + 2 * 86400) == 1
@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import MetaTrader5 as mt5
+from bar_cache import BarCache
+from bench import _rates
+from conftest import synthetic_bars
+
+
+@pytest.fixture
+def sim():
+    df = synthetic_bars(3000, start='2025-01-31 12:00')
+    # تعطیلی آخر هفته بعد از کندل 1500 (در ماه فوریه)
+    df.index = df.index.where(np.arange(len(df)) < 1500, df.index + pd.Timedelta(days=2))
+    sim = mt5.configure(bars=_rates(df), start=0)
+    sim.set_time(int(sim.times[-1]) + 120)
+    return sim
+
+
+def test_sync_fills_the_hole_between_two_ranges(tmp_path, sim):
+    t = sim.times
+    cache = BarCache(tmp_path, 'EURUSD')
+    a, b, c, d = int(t[0]), int(t[1000]), int(t[2000]), int(t[-1]) + 60
+    cache.sync(mt5, a, b, chunk_days=0.25, log=lambda *_: None)
+    cache.sync(mt5, c, d, chunk_days=0.25, log=lambda *_: None)
+    assert cache.missing(a, d) == [(b, c)]
+
+    sim.calls.clear()
+    written = cache.sync(mt5, a, d, chunk_days=0.25, log=lambda *_: None)
+    assert written == 1000
+    # فقط بازه‌ی [b, c) (شامل تعطیلی) از MT5 خوانده می‌شود
+    assert sim.calls['copy_rates_range'] == -(-(c - b) // (0.25 * 86400))
+    assert cache.missing(a, d) == []
+    np.testing.assert_array_equal(cache.load(a, d), sim.rates)
+    assert cache.partitions() == ['2025-01', '2025-02']
+    assert cache.gaps == [(int(t[1499]) + 60, int(t[1500]))]
+
+
+def test_sync_covers_only_closed_bars(tmp_path, sim):
+    cache = BarCache(tmp_path, 'EURUSD')
+    end = int(sim.times[-1]) + 3600
+    cache.sync(mt5, int(sim.times[0]), end, log=lambda *_: None)
+    # بعد از آخرین کندل هنوز پوشش نخورده و sync بعدی دوباره می‌پرسد
+    assert cache.missing(int(sim.times[0]), end) == [(int(sim.times[-1]) + 60, end)]
+
+
+def test_gap_at_the_seam_of_two_syncs(tmp_path, sim):
+    t = sim.times
+    cache = BarCache(tmp_path, 'EURUSD')
+    a, d = int(t[0]), int(t[-1]) + 60
+    cache.sync(mt5, int(t[1500]), d, log=lambda *_: None)
+    assert cache.gaps == []  # بازه‌ی قبل از t[1500] هنوز sync نشده؛ gap نیست
+    cache.sync(mt5, a, d, log=lambda *_: None)
+    assert cache.gaps == [(int(t[1499]) + 60, int(t[1500]))]
@@ -0,0 +1,19 @@
+import bench
+
+
+def test_synthetic_bars_is_the_test_fixture_in_cache_data_shape():
+    raw = bench.random_walk_bars(500, seed=4)
+    df = bench.synthetic_bars(500, seed=4)
+    assert str(df.index.tz) == 'Asia/Tehran'
+    assert (df.index == raw.index).all()
+    assert df[raw.columns].reset_index(drop=True).equals(raw.reset_index(drop=True))
+    assert {'timestamp', 'status'} <= set(df.columns)
+
+
+def test_environment_mismatch():
+    here = bench.metadata()
+    assert bench.environment_mismatch(dict(here, git='other', time='x')) == {}
+    patch = '.'.join(here['python'].split('.')[:2]) + '.999'
+    assert bench.environment_mismatch(dict(here, python=patch)) == {}
+    assert bench.environment_mismatch(dict(here, numpy='0.0.1')) == {'numpy': ('0.0.1', here['numpy'])}
+    assert set(bench.environment_mismatch(None)) == set(bench.ENV_KEYS)
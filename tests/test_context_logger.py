@@ -0,0 +1,29 @@
+import pytest
+
+import save_file
+from save_file import ContextLogger
+
+
+@pytest.fixture
+def lines(monkeypatch):
+    out = []
+    monkeypatch.setattr(save_file, 'log', lambda message, color=None, save_to_file=True: out.append(message))
+    return out
+
+
+def test_bar_trace_switch(lines):
+    on = ContextLogger(__file__, 'main', level='INFO', bar_trace=True)
+    off = ContextLogger(__file__, 'main', level='INFO', bar_trace=False)
+    on.trace(lambda: 'swing')
+    off.trace(lambda: 1 / 0)  # غیرفعال: پیام ساخته نمی‌شود
+    off.debug('hidden')
+    ContextLogger(__file__, 'main', level='DEBUG', bar_trace=False).trace('debug run')
+    ContextLogger(__file__, 'bt', level=100, bar_trace=True).trace('backtest')
+    assert [line.split('] ', 1)[1] for line in lines] == ['swing', 'debug run']
+
+
+def test_prefix_names_the_calling_function(lines):
+    def helper(logger):
+        logger('x %d', 3)
+    helper(ContextLogger('/a/engine.py', 'EURUSD', level='INFO'))
+    assert lines[0].startswith('[engine.py:helper:') and lines[0].endswith('] x 3')
@@ -0,0 +1,110 @@
+import pytest
+
+from scheduler import BarScheduler
+
+
+class FakeConn:
+    """Per-symbol connector: only what TradingEngine/SymbolTrader touch in bar_cycle."""
+
+    def __init__(self, symbol, bars):
+        self.symbol = symbol
+        self.bars = bars  # symbol -> open time of the newest bar (None = MT5 returned nothing)
+        self.probes = []
+
+    def for_symbol(self, symbol):
+        return FakeConn(symbol, self.bars) if symbol != self.symbol else self
+
+    def get_last_bar_time(self):
+        self.probes.append(self.symbol)
+        return self.bars[self.symbol]
+
+
+class Clock:
+    def __init__(self, now=960.3):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def setup(engine_module):
+    bars = {'EURUSD': 60, 'USDJPY': 60}
+    clock = Clock()
+    scheduler = BarScheduler(bar_seconds=60, close_latency=0.3, retry_interval=0.25, retry_window=5.0,
+                             clock=clock, sleeper=lambda s: None)
+    eng = engine_module.TradingEngine(FakeConn('EURUSD', bars), ['EURUSD', 'USDJPY'], scheduler=scheduler)
+    processed = []
+    failing = set()
+    for symbol, trader in eng.traders.items():
+        def fetch(symbol=symbol):
+            return None if symbol in failing else 'frame'
+
+        def on_data(cache_data, bar_time, bar_close=None, trader=trader):
+            trader.last_bar_time = bar_time
+            processed.append((trader.symbol, bar_time))
+        trader.fetch = fetch
+        trader.on_data = on_data
+    eng.bar_cycle()  # اولین کندل برای هر دو نماد
+    processed.clear()
+    return eng, bars, clock, processed, failing
+
+
+def _probed(eng):
+    out = []
+    for trader in eng.traders.values():
+        out += trader.conn.probes
+        trader.conn.probes.clear()
+    return sorted(out)
+
+
+def test_late_symbol_is_processed_in_the_retry_window(setup):
+    eng, bars, clock, processed, _ = setup
+    clock.now += 60
+    bars['EURUSD'] = 120  # USDJPY یک probe دیرتر
+    _probed(eng)
+    eng.bar_cycle()
+    assert processed == [('EURUSD', 120)]
+    assert eng.pending == {'USDJPY'}
+    assert eng.scheduler.next_bar_check == pytest.approx(clock.now + 0.25)
+
+    clock.now += 0.25
+    bars['USDJPY'] = 120
+    eng.bar_cycle()
+    assert processed == [('EURUSD', 120), ('USDJPY', 120)]
+    # در retry فقط نماد عقب‌مانده probe می‌شود
+    assert _probed(eng) == ['EURUSD', 'USDJPY', 'USDJPY']
+    assert not eng.pending
+    assert eng.scheduler.next_bar_check == pytest.approx(1080.3)
+
+
+def test_failed_fetch_is_retried(setup):
+    eng, bars, clock, processed, failing = setup
+    clock.now += 60
+    bars['EURUSD'] = bars['USDJPY'] = 120
+    failing.add('USDJPY')
+    eng.bar_cycle()
+    assert eng.pending == {'USDJPY'}
+    failing.clear()
+    clock.now += 0.25
+    eng.bar_cycle()
+    assert processed == [('EURUSD', 120), ('USDJPY', 120)]
+    assert not eng.pending
+
+
+def test_gives_up_after_the_retry_window(setup):
+    eng, bars, clock, processed, _ = setup
+    clock.now += 60
+    bars['EURUSD'] = 120
+    eng.bar_cycle()
+    while eng.pending:
+        clock.now += 0.25
+        eng.bar_cycle()
+    assert processed == [('EURUSD', 120)]
+    assert clock.now - 1020.3 >= 5.0
+    assert eng.scheduler.next_bar_check == pytest.approx(1080.3)
+    # کندل بعدی برای هر دو نماد طبق معمول
+    clock.now = 1080.3
+    bars['EURUSD'] = bars['USDJPY'] = 180
+    eng.bar_cycle()
+    assert processed[-2:] == [('EURUSD', 180), ('USDJPY', 180)]
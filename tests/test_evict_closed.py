@@ -0,0 +1,53 @@
+from types import SimpleNamespace
+
+from position_store import PositionStore
+
+
+class FakeConn:
+    def __init__(self):
+        self.symbol = 'EURUSD'
+        self.spec = SimpleNamespace(point=0.00001, digits=5, trade_tick_value=1.0)
+
+    def for_symbol(self, symbol):
+        return self
+
+    def symbol_specs(self):
+        return self.spec
+
+    def symbol_info(self, fresh=False):
+        return self.spec
+
+    def modify_sl_tp(self, ticket, new_sl=None, new_tp=None):
+        return SimpleNamespace(retcode=10009)
+
+
+def _pos(ticket):
+    return SimpleNamespace(ticket=ticket, type=0, price_open=1.1, sl=1.099, tp=1.102, volume=0.1)
+
+
+def test_only_closed_tickets_are_archived(tmp_path, engine_module, monkeypatch):
+    events = []
+    monkeypatch.setattr(engine_module, 'log_position_event', lambda **kw: events.append(kw))
+    store = PositionStore(str(tmp_path / 'state.db'))
+    # تیکت 99 وقتی ربات خاموش بود بسته شده است
+    store.save('EURUSD', 99, {'entry': 1.1, 'risk': 0.001, 'direction': 'buy', 'done_stages': set()})
+    trader = engine_module.SymbolTrader(FakeConn())
+    trader.attach_store(store, store.load()['EURUSD'])
+    tick = SimpleNamespace(bid=1.1008, ask=1.1009)
+    positions = [_pos(t) for t in (1, 2, 3)]
+    trader.manage_cycle(positions, tick)
+    assert [e['ticket'] for e in events if e['event'] == 'closed'] == [99]
+    assert set(store.load()['EURUSD']) == {1, 2, 3}
+    events.clear()
+
+    trader.manage_cycle([positions[0], positions[2]], tick)
+    closed = [e for e in events if e['event'] == 'closed']
+    assert [e['ticket'] for e in closed] == [2]
+    assert closed[0]['stage'] == 1 and closed[0]['locked_R'] > 0  # مرحله‌ی کمیسیون اعمال شده بود
+    assert set(trader.position_states) == set(trader.stage_plans) == {1, 3}
+    assert set(store.load()['EURUSD']) == {1, 3}
+
+    events.clear()
+    trader.manage_cycle([], tick)
+    assert sorted(e['ticket'] for e in events if e['event'] == 'closed') == [1, 3]
+    assert trader.position_states == {} and trader.stage_plans == {} and store.load() == {}
@@ -0,0 +1,73 @@
+from types import SimpleNamespace
+
+import pytest
+
+import MetaTrader5 as mt5
+from mt5_connector import MT5Connector
+
+REQUEST = {'action': mt5.TRADE_ACTION_DEAL, 'symbol': 'EURUSD', 'volume': 0.1, 'type': mt5.ORDER_TYPE_BUY}
+
+
+class Broker:
+    """order_send that accepts only some type_filling values ('auto' = field missing)."""
+
+    def __init__(self, accepted, reject=10030):
+        self.accepted = set(accepted)
+        self.reject = reject
+        self.sent = []
+        self.retcode = None  # رد ثابت (مثلا requote) بدون توجه به filling
+
+    def __call__(self, request):
+        mode = request.get('type_filling', 'auto')
+        self.sent.append(mode)
+        if self.retcode is not None:
+            return SimpleNamespace(retcode=self.retcode)
+        return SimpleNamespace(retcode=10009 if mode in self.accepted else self.reject)
+
+
+@pytest.fixture
+def conn(monkeypatch):
+    broker = Broker({mt5.ORDER_FILLING_FOK})
+    monkeypatch.setattr(mt5, 'order_send', broker)
+    conn = MT5Connector('EURUSD')
+    # بروکر IOC اعلام می‌کند ولی فقط FOK را قبول دارد
+    conn.get_supported_filling_modes = lambda: [mt5.ORDER_FILLING_IOC]
+    return conn, broker
+
+
+def test_fallback_is_learned(conn):
+    conn, broker = conn
+    assert conn.try_all_filling_modes(REQUEST).retcode == 10009
+    assert broker.sent == [mt5.ORDER_FILLING_IOC, 'auto', mt5.ORDER_FILLING_FOK]
+    broker.sent.clear()
+    conn.try_all_filling_modes(REQUEST)
+    assert broker.sent == [mt5.ORDER_FILLING_FOK]
+
+
+@pytest.mark.parametrize('retcode', [10030, 10013])
+def test_cached_mode_is_dropped_on_filling_retcodes(conn, retcode):
+    conn, broker = conn
+    conn.try_all_filling_modes(REQUEST)
+    broker.accepted, broker.reject = {mt5.ORDER_FILLING_RETURN}, retcode
+    broker.sent.clear()
+    assert conn.try_all_filling_modes(REQUEST).retcode == 10009
+    assert broker.sent == [mt5.ORDER_FILLING_FOK, mt5.ORDER_FILLING_IOC, 'auto', mt5.ORDER_FILLING_RETURN]
+    assert conn._filling_cache[('EURUSD', mt5.TRADE_ACTION_DEAL)] == mt5.ORDER_FILLING_RETURN
+
+
+def test_other_rejections_keep_the_cache(conn):
+    conn, broker = conn
+    conn.try_all_filling_modes(REQUEST)
+    broker.retcode = mt5.TRADE_RETCODE_REQUOTE
+    broker.sent.clear()
+    assert conn.try_all_filling_modes(REQUEST).retcode == mt5.TRADE_RETCODE_REQUOTE
+    assert broker.sent == [mt5.ORDER_FILLING_FOK]
+    assert conn._filling_cache[('EURUSD', mt5.TRADE_ACTION_DEAL)] == mt5.ORDER_FILLING_FOK
+
+
+def test_non_filling_rejection_stops_the_search(conn):
+    conn, broker = conn
+    broker.reject = mt5.TRADE_RETCODE_REJECT
+    assert conn.try_all_filling_modes(REQUEST).retcode == mt5.TRADE_RETCODE_REJECT
+    assert broker.sent == [mt5.ORDER_FILLING_IOC]
+    assert conn._filling_cache == {}
@@ -0,0 +1,66 @@
+import time
+
+import numpy as np
+import pytest
+
+from conftest import synthetic_bars
+from get_legs import get_legs, get_legs_arrays, get_legs_fast
+from indicators import VolatilityEngine
+
+CASES = [(seed, vol) for seed in range(3) for vol in (0.0001, 0.0003, 0.001)]
+
+
+def _thresholds(df):
+    return VolatilityEngine().thresholds(df['open'], df['high'], df['low'], df['close'], df['spread'])
+
+
+@pytest.mark.parametrize('seed,vol', CASES)
+def test_fast_matches_get_legs(seed, vol):
+    df = synthetic_bars(1000, seed=seed, vol=vol)
+    assert get_legs_fast(df) == get_legs(df)
+
+
+@pytest.mark.parametrize('seed,vol', CASES)
+def test_fast_matches_get_legs_with_thresholds(seed, vol):
+    df = synthetic_bars(1000, seed=seed, vol=vol)
+    thresholds = _thresholds(df)
+    assert np.isnan(thresholds[0])  # قبل از گرم شدن ATR -> threshold ثابت (_per_bar)
+    assert get_legs_fast(df, thresholds=thresholds) == get_legs(df, thresholds=thresholds)
+
+
+def test_custom_threshold():
+    df = synthetic_bars(1500, seed=7)
+    assert get_legs_fast(df, custom_threshold=3) == get_legs(df, custom_threshold=3)
+
+
+def test_arrays_return_positions():
+    df = synthetic_bars(1000, seed=5)
+    legs = get_legs_arrays(*(df[c].to_numpy(dtype=np.float64) for c in ('open', 'high', 'low', 'close')))
+    ref = get_legs(df)
+    assert len(legs) == len(ref)
+    for leg, r in zip(legs, ref):
+        assert df.index[leg['start']] == r['start']
+        assert df.index[leg['end']] == r['end']
+        assert leg['direction'] == r['direction']
+        assert leg['length'] == r['length']
+
+
+def test_empty_and_single_bar():
+    df = synthetic_bars(1)
+    assert get_legs_fast(df) == get_legs(df) == []
+
+
+def test_fast_is_much_faster():
+    # ادعای سرعت با حاشیه‌ی زیاد (در bench حدود 200x)؛ عدد دقیق در bench.py --cases get_legs,get_legs_fast
+    df = synthetic_bars(1000, seed=0)
+    t0 = time.perf_counter()
+    get_legs(df)
+    ref = time.perf_counter() - t0
+    fast = min(_timed(get_legs_fast, df) for _ in range(3))
+    assert fast * 10 < ref
+
+
+def _timed(fn, *args):
+    t0 = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - t0
@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import synthetic_bars
+from indicators import VolatilityEngine
+
+PERIOD = 14
+
+
+def _feed(engine, df):
+    out = []
+    for o, h, l, c, s in df[['open', 'high', 'low', 'close', 'spread']].itertuples(index=False):
+        engine.update(o, h, l, c, s)
+        out.append((engine.atr, engine.range, engine.spread.mean))
+    return pd.DataFrame(out, columns=['atr', 'range', 'spread'], index=df.index)
+
+
+@pytest.fixture
+def bars():
+    df = synthetic_bars(2000, seed=5)
+    df['spread'] = np.random.default_rng(5).integers(5, 30, len(df))
+    return df
+
+
+def test_wilder_atr_matches_pandas(bars):
+    h, l, c = bars['high'], bars['low'], bars['close']
+    tr = pd.concat([h - l, (h - c.shift()).abs(), (l - c.shift()).abs()], axis=1).max(axis=1)
+    seed = tr.copy()
+    seed.iloc[PERIOD - 1] = tr.iloc[:PERIOD].mean()  # SMA اولین دوره، بعد RMA با alpha=1/period
+    ref = seed.iloc[PERIOD - 1:].ewm(alpha=1 / PERIOD, adjust=False).mean()
+    got = _feed(VolatilityEngine(atr_period=PERIOD), bars)['atr']
+    np.testing.assert_allclose(got.iloc[PERIOD - 1:], ref, rtol=1e-12)
+
+
+def test_range_and_spread_match_rolling_windows(bars):
+    got = _feed(VolatilityEngine(window=60, range_window=20), bars)
+    ref_range = bars['high'].rolling(20, min_periods=1).max() - bars['low'].rolling(20, min_periods=1).min()
+    ref_spread = bars['spread'].rolling(60, min_periods=1).mean() * 0.00001
+    np.testing.assert_allclose(got['range'], ref_range, rtol=1e-12)
+    np.testing.assert_allclose(got['spread'], ref_spread, rtol=1e-9)
+
+
+def test_range_mult_drives_the_threshold(bars):
+    plain = VolatilityEngine(max_threshold=1000)
+    ranged = VolatilityEngine(max_threshold=1000, range_mult=1.0)
+    _feed(plain, bars)
+    _feed(ranged, bars)
+    assert ranged.range > 3 * max(ranged.atr, ranged.spread.mean)
+    assert ranged.threshold == pytest.approx(ranged.range / 0.0001 * 1.0)
+    assert plain.threshold < ranged.threshold
@@ -0,0 +1,63 @@
+from types import SimpleNamespace
+
+import pytest
+
+import MetaTrader5 as mt5
+import mt5_connector
+from bench import _rates
+from conftest import synthetic_bars
+from mt5_connector import MT5Connector
+
+
+@pytest.fixture
+def conn(monkeypatch):
+    sim = mt5.configure(bars=_rates(synthetic_bars(300)), start=100)
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(mt5_connector, '_time', SimpleNamespace(monotonic=lambda: clock.now))
+    conn = MT5Connector('EURUSD')
+    conn.info_ttl.update({'account_info': 1.0, 'symbol_info': 1.0, 'symbol_specs': None})
+    return conn, sim, clock
+
+
+def test_ttl_expiry(conn):
+    conn, sim, clock = conn
+    first = conn.account_info()
+    clock.now += 0.99
+    assert conn.account_info() is first
+    assert sim.calls['account_info'] == 1
+    clock.now += 0.01
+    conn.account_info()
+    assert sim.calls['account_info'] == 2
+    assert conn.cache_stats['account_info'] == {'hits': 1, 'misses': 2}
+
+
+def test_specs_live_for_the_session_and_fresh_skips_the_cache(conn):
+    conn, sim, clock = conn
+    specs = conn.symbol_specs()
+    clock.now += 10 ** 6
+    assert conn.symbol_specs() is specs
+    conn.symbol_info()
+    conn.symbol_info()
+    conn.symbol_info(fresh=True)
+    assert sim.calls['symbol_info'] == 3  # specs + یک miss + fresh
+
+
+def test_invalidate_info(conn):
+    conn, sim, clock = conn
+    conn.account_info()
+    conn.terminal_info()
+    conn.invalidate_info('account_info')
+    conn.account_info()
+    conn.terminal_info()
+    assert (sim.calls['account_info'], sim.calls['terminal_info']) == (2, 1)
+    conn.invalidate_info()
+    conn.account_info()
+    conn.terminal_info()
+    assert (sim.calls['account_info'], sim.calls['terminal_info']) == (3, 2)
+
+
+def test_unknown_symbol_is_not_cached(conn):
+    conn, sim, clock = conn
+    assert conn.symbol_info('GBPUSD') is None
+    assert conn.symbol_info('GBPUSD') is None
+    assert sim.calls['symbol_info'] == 2
@@ -0,0 +1,53 @@
+import json
+
+import numpy as np
+import pytest
+
+import latency as latency_module
+from latency import LatencyHistogram, LatencyRecorder
+
+REL = 1.0 / 64  # 64 زیر-باکت در نیمه‌ی بالای هر توان 2
+
+
+def test_buckets_round_trip():
+    for v in list(range(0, 5000)) + [2 ** k + d for k in range(12, 31) for d in (-1, 0, 1)]:
+        i = latency_module._bucket(v)
+        assert latency_module._bucket_value(i) >= v
+        assert latency_module._bucket(latency_module._bucket_value(i)) == i
+        assert i == 0 or latency_module._bucket_value(i - 1) < v
+
+
+@pytest.mark.parametrize('seed', [0, 1])
+def test_percentiles_match_numpy(seed):
+    rng = np.random.default_rng(seed)
+    values = np.concatenate([rng.lognormal(7, 1.5, 20_000), rng.uniform(0, 100, 500)]).astype(np.int64)
+    h = LatencyHistogram()
+    for v in values:
+        h.record_us(v)
+    for p in (1, 10, 50, 90, 99, 99.9, 100):
+        want = float(np.percentile(values, p, method='inverted_cdf'))
+        got = h.percentile(p)
+        assert want <= got <= want * (1 + REL) + 1, p
+    assert h.percentile(100) == values.max()
+    s = h.summary()
+    assert s['count'] == len(values)
+    assert s['mean_ms'] == pytest.approx(values.mean() / 1000.0, abs=1e-3)
+
+
+def test_values_are_clamped():
+    h = LatencyHistogram(max_us=1000)
+    h.record_us(-5)
+    h.record_us(10 ** 9)
+    assert (h.min_us, h.max_seen_us, h.percentile(100)) == (0, 1000, 1000)
+
+
+def test_dump_appends_a_json_line(tmp_path):
+    rec = LatencyRecorder(dump_file=str(tmp_path / 'lat.jsonl'), dump_interval=0)
+    with rec.span('fetch'):
+        pass
+    rec.record('fetch', 0.002)
+    rec.dump()
+    rec.dump()
+    lines = (tmp_path / 'lat.jsonl').read_text().splitlines()
+    assert len(lines) == 2
+    assert json.loads(lines[0])['spans']['fetch']['count'] == 2
@@ -0,0 +1,76 @@
+from functools import lru_cache
+
+import pytest
+
+from conftest import synthetic_bars
+from get_legs import LegTracker, get_legs
+
+SEEDS = range(5)
+
+
+@lru_cache(maxsize=None)
+def _reference(seed, n=3000):
+    """(bars, get_legs(bars)); get_legs is slow on 3k bars, so each series is walked once."""
+    df = synthetic_bars(n, seed=seed)
+    return df, get_legs(df)
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_same_legs_as_get_legs(seed):
+    df, ref = _reference(seed)
+    assert LegTracker().update_from(df) == ref
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_incremental_feed_matches_full_walk(seed):
+    # مثل حلقه‌ی زنده: هر بار پنجره‌ی 200 کندلی که یک تا چند کندل جلو رفته
+    df, ref = _reference(seed)
+    tracker = LegTracker()
+    for end in range(200, len(df) + 1, 3):
+        tracker.update_from(df.iloc[end - 200:end])
+    tracker.update_from(df.iloc[-200:])
+    assert tracker.legs == ref
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_max_legs_keeps_the_newest_legs(seed):
+    df, ref = _reference(seed)
+    legs = LegTracker(max_legs=10).update_from(df)
+    assert len(legs) <= 10
+    assert legs == ref[-len(legs):]
+
+
+def test_peek_does_not_commit():
+    df = synthetic_bars(800, seed=1)
+    tracker = LegTracker()
+    tracker.update_from(df.iloc[:-1])
+    before = [dict(leg) for leg in tracker.legs]
+    assert tracker.peek(df.iloc[-1]) == get_legs(df)
+    assert tracker.legs == before
+    assert tracker.update_from(df) == get_legs(df)
+
+
+def test_gap_resets_to_the_new_data():
+    # داده‌ای که بعد از آخرین کندل ثبت‌شده شروع می‌شود (قطع اتصال طولانی) از صفر محاسبه می‌شود
+    df = synthetic_bars(1200, seed=2)
+    tracker = LegTracker()
+    tracker.update_from(df.iloc[:400])
+    assert tracker.update_from(df.iloc[600:]) == get_legs(df.iloc[600:])
+
+
+def test_older_data_is_ignored():
+    # پنجره‌ای که تماما قبل از آخرین کندل ثبت‌شده است چیزی را تغییر نمی‌دهد
+    df = synthetic_bars(1200, seed=3)
+    tracker = LegTracker()
+    tracker.update_from(df)
+    legs = [dict(leg) for leg in tracker.legs]
+    assert tracker.update_from(df.iloc[100:300]) == legs
+    assert tracker.last_time == df.index[-1]
+
+
+def test_reset_then_replay():
+    df = synthetic_bars(1000, seed=4)
+    tracker = LegTracker()
+    tracker.update_from(df.iloc[:500])
+    tracker.reset()
+    assert tracker.update_from(df) == get_legs(df)
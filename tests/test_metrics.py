@@ -0,0 +1,73 @@
+import urllib.error
+import urllib.request
+from types import SimpleNamespace
+
+import pytest
+
+import metrics
+from latency import LatencyRecorder
+
+
+@pytest.fixture
+def fresh(monkeypatch):
+    rec = LatencyRecorder(dump_interval=0)
+    monkeypatch.setattr(metrics, 'latency', rec)
+    monkeypatch.setattr(metrics, 'mt5_calls', {})
+    return rec
+
+
+def test_instrument_counts_calls_and_errors(fresh):
+    module = SimpleNamespace(
+        symbol_info=lambda symbol: None if symbol == 'XXX' else SimpleNamespace(),
+        order_send=lambda request: SimpleNamespace(retcode=request['retcode']),
+    )
+    metrics.instrument_mt5(module)
+    wrapped = module.symbol_info
+    metrics.instrument_mt5(module)
+    assert module.symbol_info is wrapped  # idempotent
+    module.symbol_info('EURUSD')
+    module.symbol_info('XXX')
+    for retcode in (10009, 10004, 10008):
+        module.order_send({'retcode': retcode})
+    calls = metrics.mt5_calls
+    assert (calls['symbol_info'].calls, calls['symbol_info'].errors) == (2, 1)
+    assert (calls['order_send'].calls, calls['order_send'].errors) == (3, 1)
+
+
+def _families(text):
+    """name -> sample lines; every family must be contiguous after its HELP/TYPE."""
+    out, current = {}, None
+    for line in text.splitlines():
+        if line.startswith('# HELP '):
+            current = line.split()[2]
+            assert current not in out
+            out[current] = []
+        elif not line.startswith('# TYPE '):
+            assert line.split('{')[0].split()[0].startswith(current)
+            out[current].append(line)
+    return out
+
+
+def test_render(fresh):
+    for ms in range(1, 101):
+        fresh.record('fetch', ms / 1000.0)
+    conn = SimpleNamespace(cache_stats={'symbol_info': {'hits': 3, 'misses': 1}})
+    fam = _families(metrics.render(connector=conn))
+    samples = dict(line.rsplit(' ', 1) for line in fam['bot_latency_seconds'])
+    assert float(samples['bot_latency_seconds{phase="fetch",quantile="0.5"}']) == pytest.approx(0.05, rel=1 / 64)
+    assert samples['bot_latency_seconds_count{phase="fetch"}'] == '100'
+    assert fam['bot_info_cache_hit_ratio'] == ['bot_info_cache_hit_ratio{cache="symbol_info"} 0.75']
+    assert 'bot_log_queue_depth' in fam
+
+
+def test_server(fresh):
+    server = metrics.MetricsServer(port=0).start()
+    try:
+        host, port = server.address
+        body = urllib.request.urlopen(f'http://{host}:{port}/metrics', timeout=5).read().decode()
+        assert '# TYPE bot_log_queue_depth gauge' in body
+        with pytest.raises(urllib.error.HTTPError) as err:
+            urllib.request.urlopen(f'http://{host}:{port}/other', timeout=5)
+        assert err.value.code == 404
+    finally:
+        server.stop()
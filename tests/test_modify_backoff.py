@@ -0,0 +1,93 @@
+from types import SimpleNamespace
+
+import pytest
+
+
+class FakeConn:
+    """Connector with a scripted modify_sl_tp retcode."""
+
+    def __init__(self, retcode=10016):
+        self.symbol = 'EURUSD'
+        self.retcode = retcode
+        self.sent = []
+        self.spec = SimpleNamespace(point=0.00001, digits=5, trade_tick_value=1.0)
+
+    def for_symbol(self, symbol):
+        return self
+
+    def symbol_specs(self):
+        return self.spec
+
+    def symbol_info(self, fresh=False):
+        return self.spec
+
+    def modify_sl_tp(self, ticket, new_sl=None, new_tp=None):
+        self.sent.append((ticket, new_sl, new_tp))
+        return SimpleNamespace(retcode=self.retcode, comment='Invalid stops')
+
+
+@pytest.fixture
+def trader(engine_module):
+    conn = FakeConn()
+    trader = engine_module.SymbolTrader(conn)
+    trader.clock = lambda: trader.now
+    trader.now = 100.0
+    pos = SimpleNamespace(ticket=7, type=0, price_open=1.10000, sl=1.09900, tp=1.10200, volume=0.1)
+    return trader, conn, pos
+
+
+def _tick(bid):
+    return SimpleNamespace(bid=bid, ask=bid + 0.0001)
+
+
+def test_rejected_modify_waits_for_cooldown(trader, engine_module, capsys):
+    trader, conn, pos = trader
+    cooldown = engine_module.POSITION_MANAGER_CONFIG['modify_retry_cooldown']
+    tick = _tick(1.10080)  # بالای مرحله‌ی کمیسیون، زیر 2R
+    for _ in range(20):
+        trader.manage_cycle([pos], tick)
+    assert len(conn.sent) == 1
+    trader.now += cooldown
+    trader.manage_cycle([pos], tick)
+    assert len(conn.sent) == 2
+    assert capsys.readouterr().out.count('modify rejected') == 1  # retcode یک بار برای هر هدف
+
+
+def test_new_target_is_sent_immediately(trader):
+    trader, conn, pos = trader
+    trader.manage_cycle([pos], _tick(1.10080))
+    trader.manage_cycle([pos], _tick(1.10210))  # 2R: هدف جدید
+    assert len(conn.sent) == 2 and conn.sent[0][1] != conn.sent[1][1]
+
+
+def test_success_and_close_clear_the_backoff(trader):
+    trader, conn, pos = trader
+    trader.manage_cycle([pos], _tick(1.10080))
+    assert 7 in trader.modify_backoff
+    trader.manage_cycle([], _tick(1.10080))
+    assert trader.modify_backoff == {}
+    conn.retcode = 10009
+    trader.manage_cycle([pos], _tick(1.10080))
+    assert trader.modify_backoff == {} and trader.stage_plans[7].level == 0
+
+
+class Pool:
+    """ModifyPool stand-in that runs jobs inline and counts them."""
+
+    def __init__(self):
+        self.jobs = 0
+
+    def busy(self, ticket):
+        return False
+
+    def submit(self, ticket, fn, *args):
+        self.jobs += 1
+        fn(*args)
+
+
+def test_backed_off_target_is_not_submitted_to_the_pool(trader):
+    trader, conn, pos = trader
+    trader.modifier = Pool()
+    for _ in range(20):
+        trader.manage_cycle([pos], _tick(1.10080))
+    assert trader.modifier.jobs == 1 and len(conn.sent) == 1
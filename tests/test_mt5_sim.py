@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import MetaTrader5 as mt5
+from bar_cache import BarCache
+from bench import _rates
+from conftest import synthetic_bars
+
+
+@pytest.fixture
+def cached_frame(tmp_path):
+    rates = _rates(synthetic_bars(300))
+    cache = BarCache(tmp_path, 'EURUSD')
+    cache.write(rates)
+    return rates, cache.frame()
+
+
+def test_cached_frame_index_and_column(cached_frame):
+    rates, df = cached_frame
+    assert isinstance(df.index.dtype, pd.DatetimeTZDtype)
+    for bars in (df, df.reset_index(), df.set_axis(df.index.as_unit('us'))):
+        sim = mt5.configure(bars=bars, start=100)
+        np.testing.assert_array_equal(sim.rates['time'], rates['time'])
+        np.testing.assert_array_equal(sim.rates['close'], rates['close'])
+
+
+def test_two_symbols(cached_frame):
+    rates, df = cached_frame
+    jpy = df[['open', 'high', 'low', 'close']] * 100 + 50
+    sim = mt5.configure(bars={'EURUSD': df, 'USDJPY': jpy}, start=100,
+                        symbols={'USDJPY': {'digits': 3, 'point': 0.001, 'contract_size': 1000.0}})
+    sim.set_time(int(rates['time'][150]) + 30)
+
+    eur = mt5.copy_rates_from_pos('EURUSD', mt5.TIMEFRAME_M1, 1, 5)
+    usd = mt5.copy_rates_from_pos('USDJPY', mt5.TIMEFRAME_M1, 1, 5)
+    np.testing.assert_array_equal(eur['time'], usd['time'])
+    np.testing.assert_allclose(usd['close'], eur['close'] * 100 + 50)
+    assert mt5.symbol_info('USDJPY').digits == 3
+    assert mt5.symbol_info('GBPUSD') is None
+
+    tick = mt5.symbol_info_tick('USDJPY')
+    res = mt5.order_send({'action': mt5.TRADE_ACTION_DEAL, 'symbol': 'USDJPY', 'volume': 0.1,
+                          'type': mt5.ORDER_TYPE_BUY, 'sl': tick.bid - 1.0, 'tp': tick.bid + 1.0})
+    assert res.retcode == mt5.TRADE_RETCODE_DONE and res.price == tick.ask
+    (pos,) = mt5.positions_get(symbol='USDJPY')
+    assert pos.price_current == tick.bid
+    assert mt5.positions_get(symbol='EURUSD') == ()
+    # SL/TP روی کندل‌های همان نماد چک می‌شود
+    mod = mt5.order_send({'action': mt5.TRADE_ACTION_SLTP, 'position': pos.ticket,
+                          'sl': tick.bid - 0.001, 'tp': pos.tp})
+    assert mod.retcode == mt5.TRADE_RETCODE_DONE
+    sim.set_time(int(rates['time'][160]))
+    assert mt5.positions_get() == ()
+    assert sim.balance != 10_000.0
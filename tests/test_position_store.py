@@ -0,0 +1,63 @@
+from types import SimpleNamespace
+
+from position_store import PositionStore
+
+
+class FakeConn:
+    def __init__(self):
+        self.symbol = 'EURUSD'
+        self.spec = SimpleNamespace(point=0.00001, digits=5, trade_tick_value=1.0)
+        self.sent = []
+        self.info_calls = 0
+
+    def for_symbol(self, symbol):
+        return self
+
+    def symbol_specs(self):
+        return self.spec
+
+    def symbol_info(self, fresh=False):
+        self.info_calls += 1
+        return self.spec
+
+    def modify_sl_tp(self, ticket, new_sl=None, new_tp=None):
+        self.sent.append((ticket, new_sl, new_tp))
+        return SimpleNamespace(retcode=10009)
+
+
+def test_round_trip(tmp_path):
+    store = PositionStore(str(tmp_path / 'state.db'))
+    state = {'entry': 1.1, 'risk': 0.001, 'direction': 'sell', 'done_stages': {'b', 'a'}, 'volume': 0.2}
+    store.save('EURUSD', 7, state)
+    store.save('USDJPY', 8, dict(state, entry=150.0))
+    store.close()
+    store = PositionStore(str(tmp_path / 'state.db'))
+    loaded = store.load()
+    assert loaded['EURUSD'] == {7: state}
+    assert loaded['USDJPY'][8]['entry'] == 150.0
+    store.delete('EURUSD', [7])
+    assert set(store.load()) == {'USDJPY'}
+
+
+def test_warm_restart_keeps_applied_stages(tmp_path, engine_module):
+    path = str(tmp_path / 'state.db')
+    pos = SimpleNamespace(ticket=7, type=0, price_open=1.10000, sl=1.09900, tp=1.10200, volume=0.1)
+    tick = SimpleNamespace(bid=1.10080, ask=1.10090)  # بالای مرحله‌ی کمیسیون
+
+    first = engine_module.SymbolTrader(FakeConn())
+    first.attach_store(PositionStore(path))
+    first.manage_cycle([pos], tick)
+    assert len(first.conn.sent) == 1
+    first.store.close()
+
+    store = PositionStore(path)
+    restarted = engine_module.SymbolTrader(FakeConn())
+    restarted.attach_store(store, store.load().get('EURUSD'))
+    assert restarted.position_states[7] == first.position_states[7]
+    pos.sl = first.conn.sent[0][1]
+    restarted.manage_cycle([pos], tick)
+    # نه register دوباره (symbol_info تازه) و نه ارسال دوباره‌ی مرحله‌ی اعمال‌شده
+    assert restarted.conn.info_calls == 0 and restarted.conn.sent == []
+
+    restarted.manage_cycle([], tick)
+    assert store.load() == {}
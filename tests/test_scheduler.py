@@ -0,0 +1,72 @@
+import pytest
+
+from scheduler import BarScheduler
+
+
+class Clock:
+    def __init__(self, now):
+        self.now = now
+        self.slept = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def sched():
+    clock = Clock(1000.0)
+    return BarScheduler(bar_seconds=60, close_latency=0.3, retry_interval=0.25, retry_window=5.0,
+                        manage_interval=0.5, max_wait=60, clock=clock, sleeper=clock.sleep), clock
+
+
+def test_bar_check_follows_the_bar_close(sched):
+    s, clock = sched
+    assert s.bar_due()  # اولین چرخه بلافاصله
+    s.bar_received()
+    assert s.next_bar_check == pytest.approx(1020.3)
+    clock.now = 1020.0
+    assert not s.bar_due()
+    clock.now = 1020.3
+    assert s.bar_due()
+
+
+def test_missing_bar_retries_then_waits_for_the_next_close(sched):
+    s, clock = sched
+    clock.now = 1020.3
+    waited = [s.bar_missing()]
+    assert s.next_bar_check == pytest.approx(1020.55)
+    while waited[-1] < 5.0:
+        clock.now = s.next_bar_check
+        waited.append(s.bar_missing())
+    assert len(waited) == 21  # 5s / 0.25s
+    assert s.next_bar_check == pytest.approx(1080.3)
+    s.bar_received()
+    assert s.waiting_since is None
+
+
+def test_max_wait(sched):
+    s, clock = sched
+    s.max_wait = 30
+    clock.now = 1020.3
+    s.bar_missing()
+    clock.now = 1026.0
+    s.bar_missing()
+    assert s.next_bar_check == pytest.approx(1050.3)  # waiting_since + max_wait قبل از کندل بعدی
+    assert not s.wait_expired()
+    clock.now = 1050.3
+    assert s.wait_expired()
+
+
+def test_sleep_until_the_earliest_deadline(sched):
+    s, clock = sched
+    s.bar_received()   # 1020.3
+    s.managed()        # 1000.5
+    s.sleep()
+    assert clock.slept == [pytest.approx(0.5)] and s.manage_due() and not s.bar_due()
+    s.next_manage = 2000.0
+    s.sleep()
+    assert clock.now == pytest.approx(1020.3) and s.bar_due()
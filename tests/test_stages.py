@@ -0,0 +1,28 @@
+import pytest
+
+from stages import StagePlan
+
+STAGES = [
+    {'id': 'commission', 'trigger_R': 'auto', 'sl_lock_R': 'auto', 'tp_R': None},
+    {'id': 'r2', 'trigger_R': 2.0, 'sl_lock_R': 1.0, 'tp_R': 4.0},
+    {'id': 'r3', 'trigger_R': 3.0, 'sl_lock_R': 2.0, 'tp_R': None},  # فقط SL را جلو می‌برد
+]
+
+
+@pytest.mark.parametrize('direction, sign', [('buy', 1), ('sell', -1)])
+def test_target_keeps_the_last_tp_when_the_best_stage_has_none(direction, sign):
+    plan = StagePlan(STAGES, entry=1.1, risk=0.001, direction=direction, commission_trigger_R=0.5)
+    assert plan.target(0) == (round(1.1 + sign * 0.0005, 5), None, 'commission')
+    assert plan.target(1) == (round(1.1 + sign * 0.001, 5), round(1.1 + sign * 0.004, 5), 'r2')
+    # r3 (tp_R=None) محافظ‌ترین SL را دارد؛ TP مرحله‌ی r2 نباید گم شود
+    k = plan.reached(1.1 + sign * 0.0035)
+    assert k == 2
+    assert plan.target(k) == (round(1.1 + sign * 0.002, 5), round(1.1 + sign * 0.004, 5), 'r3')
+    assert plan.advance(k) == ['commission', 'r2', 'r3']
+
+
+def test_best_sl_comes_from_an_earlier_stage():
+    stages = [{'id': 'a', 'trigger_R': 1.0, 'sl_lock_R': 0.8, 'tp_R': None},
+              {'id': 'b', 'trigger_R': 1.5, 'sl_lock_R': 0.5, 'tp_R': 3.0}]
+    plan = StagePlan(stages, entry=1.0, risk=0.01, direction='buy')
+    assert plan.target(1) == (1.008, 1.03, 'b')
@@ -0,0 +1,22 @@
+import pandas as pd
+
+from backtest import Backtester
+from conftest import synthetic_bars
+from sweep import param_grid, parse_values, run_sweep
+
+
+def test_parse_values():
+    assert parse_values('4:6:0.5') == [4.0, 4.5, 5.0, 5.5, 6.0]
+    assert parse_values('0.618,0.705') == [0.618, 0.705]
+
+
+def test_sweep_matches_serial_runs():
+    bars = synthetic_bars(3000, seed=3)
+    grid = param_grid([4.0, 8.0], [0.705], [0.9], [1.5, 2.0])
+    ranked = run_sweep(bars, grid, workers=2, progress=False)
+    serial = pd.DataFrame([dict(params, **Backtester(bars, **params).run()) for params in grid])
+    assert serial['trades'].sum() > 0
+    keys = ['threshold', 'fib_705', 'fib_90', 'win_ratio']
+    got = ranked.drop(columns='elapsed_s').sort_values(keys).reset_index(drop=True)
+    want = serial.sort_values(keys).reset_index(drop=True)[got.columns]
+    pd.testing.assert_frame_equal(got, want)
@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+
+from analytics import tick_store
+from analytics.tick_store import TickStore, read_ticks
+
+DAY = '2025-01-06'
+T0 = 1736121600000  # 2025-01-06 00:00 (ms)
+
+
+@pytest.fixture(autouse=True)
+def _no_flusher(monkeypatch):
+    # thread پس‌زمینه‌ی flush در تست لازم نیست
+    monkeypatch.setattr(TickStore, '_start_flusher', lambda self: None)
+
+
+def _fill(store, start, n):
+    for i in range(start, start + n):
+        store.append('EURUSD', 1.1 + i * 1e-5, 1.1001 + i * 1e-5, time_ms=T0 + i * 100)
+
+
+def _check(root, n):
+    cols, meta = read_ticks(root, 'EURUSD', DAY)
+    assert meta['rows'] == n
+    np.testing.assert_array_equal(cols['time'], T0 + np.arange(n) * 100)
+    np.testing.assert_allclose(cols['bid'], 1.1 + np.arange(n) * 1e-5)
+    assert all(len(c) == n for c in cols.values())
+
+
+def test_partial_flush_is_ignored_and_overwritten(tmp_path):
+    store = TickStore(tmp_path)
+    _fill(store, 0, 50)
+    store.flush()
+    # crash وسط flush بعدی: دو ستون نوشته شده، meta.json هنوز 50 ردیف
+    path = tmp_path / 'EURUSD' / DAY
+    for name in ('time', 'bid'):
+        with (path / f'{name}.bin').open('ab') as f:
+            f.write(b'\xff' * 8 * 7)
+    _check(tmp_path, 50)
+
+    restarted = TickStore(tmp_path)
+    _fill(restarted, 50, 30)
+    restarted.flush()
+    _check(tmp_path, 80)
+    assert (path / 'time.bin').stat().st_size == 80 * 8
+
+
+def test_failed_commit_keeps_the_buffer(tmp_path, monkeypatch):
+    store = TickStore(tmp_path)
+    _fill(store, 0, 10)
+    store.flush()
+    _fill(store, 10, 5)
+    original = tick_store._TickDay._write_meta
+
+    def broken(self):
+        raise OSError('disk full')
+    monkeypatch.setattr(tick_store._TickDay, '_write_meta', broken)
+    store.flush()  # خطا لاگ می‌شود، بافر حفظ می‌شود
+    assert store.pending() == 5
+    _check(tmp_path, 10)
+    monkeypatch.setattr(tick_store._TickDay, '_write_meta', original)
+    store.flush()
+    _check(tmp_path, 15)
+
+
+def test_day_without_rows_in_meta_uses_the_shortest_column(tmp_path):
+    store = TickStore(tmp_path)
+    _fill(store, 0, 20)
+    store.flush()
+    path = tmp_path / 'EURUSD' / DAY
+    meta = (path / 'meta.json').read_text()
+    (path / 'meta.json').write_text(meta.replace('"rows": 20', '"legacy": 1'))
+    with (path / 'ask.bin').open('r+b') as f:
+        f.truncate(18 * 8)
+    cols, _ = read_ticks(tmp_path, 'EURUSD', DAY)
+    assert len(cols['time']) == 18